@@ -42,6 +42,7 @@ smaller_networks_scale = 9.0
 params = {}
 betas = {}
 logfile = None
+CALIBRATION_OUTPUT_SERIES = ["num_fatalities", "cumulative_mean_fraction_lambda_*"]
 
 def processParams(params_json):
     global params
@@ -120,6 +121,9 @@ def run_sim(run, params, betas):
         cmd+= [f"--BETA_{b}",f"{betas[b]}"]
     cmd += [f"--input_directory", f"{input_folder}"]
     cmd += [f"--output_directory", f"{output_folder}"]
+    ## Only the outputs read by get_mean_fatalities and get_mean_lambdas
+    cmd += [f"--output_series", ",".join(CALIBRATION_OUTPUT_SERIES)]
+    cmd += [f"--SKIP_PLOT_SCRIPTS"]
     print(" ".join(cmd))
     logging.info(" ".join(cmd))
     if DEBUG: 
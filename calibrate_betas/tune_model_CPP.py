@@ -187,6 +187,8 @@ def run_sim(num_sims_count, params):
     command+=" --ENABLE_NBR_CELLS "
     command+=f"--CITY_SW_LAT {LAT_S} --CITY_NE_LAT {LAT_N} --CITY_SW_LON {LON_W} --CITY_NE_LON {LON_E} "
     command+=" --IGNORE_ATTENDANCE_FILE"
+    # Only the outputs read by calculate_means_fatalities_CPP and calculate_means_lambda_CPP
+    command+=" --output_series 'num_fatalities,cumulative_mean_fraction_lambda_*' --SKIP_PLOT_SCRIPTS"
     #command+=" --USE_AGE_DEPENDENT_MIXING"
     print(command)
 
@@ -0,0 +1,306 @@
+//Copyright [2020] [Indian Institute of Science, Bangalore & Tata Institute of Fundamental Research, Mumbai]
+//SPDX-License-Identifier: Apache-2.0
+
+// Benchmark of the per-timestep agent passes on synthetic agents.
+//
+// Usage: ./bench_agents [num_agents] [num_timesteps]
+//
+// Runs update_infection over every agent, followed by a statistics pass of
+// the kind done at the end of each timestep in run_simulation, and reports
+// the size of the agent array along with the time per timestep. Build with
+// "make bench_agents" and run at 1000000 and 12000000 agents to compare
+// layouts of struct agent.
+//
+// It then times the location passes (home, workplace, community and
+// neighbourhood cell lambdas, and the neighbourhood cell statistics of
+// soft containment) on synthetic locations. Build with the OpenMP
+// Makefile and set OMP_NUM_THREADS to compare thread counts.
+//
+// Next it times update_all_kappa with an intervention file of
+// num_periods one-day periods (third argument, default 1000), as a long
+// multi-phase intervention file would give, first recomputing every kappa and
+// then with INCREMENTAL_KAPPA_UPDATES.
+//
+// Then it times the cohort kappa, intra-cohort lambda and agent cohort lambda
+// passes with every agent in a cohort, for cohort sizes 10 to 50. The
+// inter-cohort pass needs the train input files; bench_cohorts.py times all
+// the cohort passes on a city.
+//
+// Last, it times disease progression from the same agents, by the sweep
+// over every agent and with EVENT_DRIVEN_PROGRESSION, first with every
+// susceptible agent under a nonzero lambda and then with 1% of them.
+#include "models.h"
+#include "updates.h"
+#include "initializers.h"
+#include "cohorts.h"
+#include <chrono>
+#include <iostream>
+#include <string>
+#include <vector>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+using std::vector;
+
+int main(int argc, char** argv){
+  count_type num_agents = (argc > 1)? std::stoul(argv[1]): 1000000;
+  int num_timesteps = (argc > 2)? std::stoi(argv[2]): 40;
+  count_type num_periods = (argc > 3)? std::stoul(argv[3]): 1000;
+
+  SEED_RNG_PROVIDED_SEED(1234);
+  vector<agent> nodes(num_agents);
+  init_agent_details(nodes);
+  for(auto& node: nodes){
+	auto& details = node.details();
+	int age = uniform_count_type(0, 80);
+	details.age = age;
+	node.age_group = get_age_group(age);
+	node.age_index = get_age_index(age);
+	node.zeta_a = zeta(age);
+	node.infectiousness = gamma(GLOBAL.INFECTIOUSNESS_SHAPE, GLOBAL.INFECTIOUSNESS_SCALE);
+	details.incubation_period = gamma(GLOBAL.INCUBATION_PERIOD_SHAPE, GLOBAL.INCUBATION_PERIOD_SCALE);
+	details.asymptomatic_period = gamma(1.0, GLOBAL.ASYMPTOMATIC_PERIOD);
+	details.symptomatic_period = gamma(1.0, GLOBAL.SYMPTOMATIC_PERIOD);
+	details.hospital_regular_period = GLOBAL.HOSPITAL_REGULAR_PERIOD;
+	details.hospital_critical_period = GLOBAL.HOSPITAL_CRITICAL_PERIOD;
+	node.lambda = 0.05;
+  }
+
+  auto start = std::chrono::high_resolution_clock::now();
+  double lambda_sum = 0;
+  count_type infected = 0;
+  for(int time_step = 0; time_step < num_timesteps; ++time_step){
+	for(auto& node: nodes){
+	  update_infection(node, time_step);
+	  node.psi_T = psi_T(node, time_step);
+	}
+	infected = 0;
+	for(const auto& node: nodes){
+	  infected += (node.infection_status != Progression::susceptible);
+	  lambda_sum += node.lambda_incoming.sum() * node.kappa_T;
+	}
+  }
+  auto end = std::chrono::high_resolution_clock::now();
+  double total_ms = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+
+  std::cout << "agents: " << num_agents
+			<< ", sizeof(agent): " << sizeof(agent) << " bytes"
+			<< ", agent array: " << double(sizeof(agent) * num_agents) / (1024 * 1024) << " MB"
+			<< std::endl;
+  std::cout << "timesteps: " << num_timesteps
+			<< ", ms per timestep: " << total_ms / num_timesteps
+			<< ", ns per agent per timestep: " << 1e6 * total_ms / (double(num_timesteps) * num_agents)
+			<< std::endl;
+  // Keep the results live so the passes are not optimised away
+  std::cout << "affected: " << infected << ", checksum: " << lambda_sum << std::endl;
+
+  // Synthetic locations: homes of 4, workplaces of 50 and 200 communities,
+  // with homes spread over a 64x64 grid of neighbourhood cells
+  const count_type num_homes = std::max<count_type>(num_agents / 4, 1);
+  const count_type num_workplaces = std::max<count_type>(num_agents / 50, 1);
+  const count_type num_communities = 200;
+  const count_type grid_size = 64;
+  for(count_type i = 0; i < num_agents; ++i){
+	auto& node = nodes[i];
+	node.lambda_h = node.lambda_w = node.lambda_c = node.lambda_nbr_cell = uniform_real(0, 1);
+	node.home = i % num_homes;
+	node.workplace = i % num_workplaces;
+	node.community = i % num_communities;
+  }
+  MEMBERSHIP.homes.build(num_homes, num_agents, [&](count_type i){ return int(i % num_homes); });
+  MEMBERSHIP.workplaces.build(num_workplaces, num_agents, [&](count_type i){ return int(i % num_workplaces); });
+  MEMBERSHIP.communities.build(num_communities, num_agents, [&](count_type i){ return int(i % num_communities); });
+  vector<house> homes(num_homes);
+  vector<workplace> workplaces(num_workplaces);
+  vector<community> communities(num_communities);
+  for(count_type h = 0; h < num_homes; ++h){
+	homes[h].individuals = MEMBERSHIP.homes.of(h);
+	homes[h].scale = 1;
+	homes[h].community = h % num_communities;
+	homes[h].neighbourhood.cell_x = (h / grid_size) % grid_size;
+	homes[h].neighbourhood.cell_y = h % grid_size;
+  }
+  GLOBAL.ENABLE_NBR_CELLS = true;
+  auto nbr_cells = init_nbr_cells(homes);
+  assign_homes_nbr_cell(homes, nbr_cells);
+  for(count_type w = 0; w < num_workplaces; ++w){
+	workplaces[w].individuals = MEMBERSHIP.workplaces.of(w);
+	workplaces[w].scale = 1;
+	workplaces[w].workplace_type = WorkplaceType::office;
+  }
+  for(count_type c = 0; c < num_communities; ++c){
+	communities[c].individuals = MEMBERSHIP.communities.of(c);
+	communities[c].scale = 1;
+  }
+  location_age_mixing no_age_mixing;
+
+  start = std::chrono::high_resolution_clock::now();
+  double location_sum = 0;
+  for(int time_step = 0; time_step < num_timesteps; ++time_step){
+	update_location_lambdas(nodes, homes, workplaces, no_age_mixing);
+	updated_lambda_c_local_communities(nodes, communities);
+	update_grid_cell_statistics(nbr_cells, homes, nodes,
+								GLOBAL.LOCKED_NEIGHBORHOOD_LEAKAGE,
+								GLOBAL.NEIGHBORHOOD_LOCK_THRESHOLD);
+	update_lambda_nbr_cells(nodes, nbr_cells, homes, communities);
+	location_sum += homes[0].age_independent_mixing + workplaces[0].age_independent_mixing
+	  + communities[0].lambda_community + nbr_cells[0].lambda_nbr;
+  }
+  end = std::chrono::high_resolution_clock::now();
+  total_ms = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+#ifdef _OPENMP
+  int threads = omp_get_max_threads();
+#else
+  int threads = 1;
+#endif
+  std::cout << "location passes: threads: " << threads
+			<< ", ms per timestep: " << total_ms / num_timesteps
+			<< ", checksum: " << location_sum << std::endl;
+
+  // Intervention file alternating between lockdown and case isolation with
+  // home quarantine every day, with varying compliance
+  vector<intervention_params> periods(num_periods);
+  for(count_type p = 0; p < num_periods; ++p){
+	periods[p].num_days = 1;
+	periods[p].lockdown = (p % 2 == 0);
+	periods[p].case_isolation = periods[p].home_quarantine = (p % 2 == 1);
+	periods[p].compliance = periods[p].compliance_hd = 0.5 + 0.4 * (p % 3) / 2.0;
+  }
+  for(auto& home: homes){
+	home.non_compliance_metric = uniform_real(0, 1);
+  }
+  GLOBAL.INTERVENTION = Intervention::intv_file_read;
+  GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS = 0;
+  const int kappa_timesteps = std::max<count_type>(num_timesteps, num_periods * GLOBAL.SIM_STEPS_PER_DAY);
+  for(bool incremental: {false, true}){
+	GLOBAL.INCREMENTAL_KAPPA_UPDATES = incremental;
+	auto intv_schedule = compile_intervention_schedule(periods);
+	start = std::chrono::high_resolution_clock::now();
+	count_type compliant = 0;
+	for(int time_step = 0; time_step < kappa_timesteps; ++time_step){
+	  update_all_kappa(nodes, homes, workplaces, communities, nbr_cells, intv_schedule, time_step);
+	  compliant += nodes[0].compliant;
+	}
+	end = std::chrono::high_resolution_clock::now();
+	total_ms = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+	std::cout << "intervention file: periods: " << num_periods
+			  << (incremental? ", incremental kappas": "")
+			  << ", timesteps: " << kappa_timesteps
+			  << ", ms per timestep: " << total_ms / kappa_timesteps
+			  << ", checksum: " << compliant << std::endl;
+  }
+
+  // Cohorts of consecutive agents, spread over the pairs of 50 stations
+  GLOBAL.ENABLE_COHORTS = true;
+  GLOBAL.TRAINS_RUNNING = true;
+  GLOBAL.ISOLATE_COHORTS = true;
+  for(count_type cohort_size = 10; cohort_size <= 50; cohort_size += 10){
+	std::unordered_map<count_type, vector<cohort_space>> cohorts;
+	for(count_type i = 0; i < num_agents; i += cohort_size){
+	  const count_type id = i / cohort_size;
+	  cohort_space cohort(id, (id / 50) % 50, id % 50, 10);
+	  cohort.scale = 1.0 / cohort_size;
+	  for(count_type j = i; j < std::min(num_agents, i + cohort_size); ++j){
+		cohort.internal_nodes.push_back(j);
+	  }
+	  cohorts[id % 2500].push_back(cohort);
+	}
+	start = std::chrono::high_resolution_clock::now();
+	// Cohorts travel at odd timesteps
+	for(int time_step = 1; time_step < 2 * num_timesteps; time_step += 2){
+	  update_kappas_cohorts(cohorts, nodes, time_step);
+	  update_lambda_intra_cohort(cohorts, nodes, time_step);
+	  update_individual_lambda_cohort(nodes, time_step, cohorts);
+	}
+	end = std::chrono::high_resolution_clock::now();
+	total_ms = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+	double cohort_sum = 0;
+	for(const auto cohort: list_cohorts(cohorts)){
+	  cohort_sum += cohort->lambda_interaction_internal + cohort->quarantined;
+	}
+	std::cout << "cohort passes: cohort size: " << cohort_size
+			  << ", cohorts: " << get_num_cohorts(cohorts)
+			  << ", threads: " << threads
+			  << ", ms per timestep: " << total_ms / num_timesteps
+			  << ", checksum: " << cohort_sum << std::endl;
+  }
+
+  // Once the community lambdas are nonzero, every susceptible agent of a city
+  // has a nonzero lambda, and EVENT_DRIVEN_PROGRESSION only skips the agents
+  // that are neither susceptible nor infective and have no transition due.
+  // The exposed agents get their lambda from their homes, and every other
+  // location has a zero lambda.
+  const vector<agent> start_nodes = nodes;
+  const vector<agent_details> start_details = AGENT_DETAILS;
+  std::unordered_map<count_type, vector<cohort_space>> no_cohorts;
+  GLOBAL.NUM_TIMESTEPS = 2 * num_timesteps;
+  for(double exposed_fraction: {1.0, 0.01}){
+	for(auto& home: homes){
+	  home.age_independent_mixing = 0;
+	  home.random_households.lambda_random_community = 0;
+	}
+	for(auto& workplace: workplaces){
+	  workplace.age_independent_mixing = 0;
+	}
+	for(auto& community: communities){
+	  community.lambda_community_global = 0;
+	}
+	for(auto& cell: nbr_cells){
+	  cell.lambda_nbr = 0;
+	}
+	for(bool event_driven: {false, true}){
+	  nodes = start_nodes;
+	  AGENT_DETAILS = start_details;
+	  SEED_RNG_PROVIDED_SEED(1234);
+	  for(count_type j = 0; j < num_agents; ++j){
+		const bool exposed = (j % 100 < 100 * exposed_fraction);
+		nodes[j].lambda = exposed? 0.001: 0;
+		if(exposed){
+		  homes[nodes[j].home].age_independent_mixing = 1;
+		}
+	  }
+	  progression_schedule schedule;
+	  if(event_driven){
+		build_progression_schedule(schedule, nodes, num_timesteps);
+	  }
+	  count_type visited = 0;
+	  start = std::chrono::high_resolution_clock::now();
+	  for(int time_step = num_timesteps; time_step < 2 * num_timesteps; ++time_step){
+		if(event_driven){
+		  for_each_agent_to_update(schedule, nodes, time_step, [&](count_type j){
+			++visited;
+			auto previous_status = nodes[j].infection_status;
+			update_infection(nodes[j], time_step);
+			if(nodes[j].infection_status != previous_status){
+			  schedule_next_transition(schedule, nodes[j], j, time_step);
+			}
+			if(nodes[j].infective){
+			  schedule.infective.push_back(j);
+			}
+		  });
+		  collect_susceptible_agents(schedule, nodes, homes, workplaces, communities, nbr_cells,
+									 no_cohorts, 0, time_step);
+		}
+		else{
+		  for(auto& node: nodes){
+			update_infection(node, time_step);
+		  }
+		  visited += num_agents;
+		}
+	  }
+	  end = std::chrono::high_resolution_clock::now();
+	  total_ms = std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count();
+	  count_type affected = 0;
+	  for(const auto& node: nodes){
+		affected += (node.infection_status != Progression::susceptible);
+	  }
+	  std::cout << "progression: " << (event_driven? "event driven": "sweep")
+				<< ", exposed fraction: " << exposed_fraction
+				<< ", agents visited per timestep: " << visited / num_timesteps
+				<< ", ms per timestep: " << total_ms / num_timesteps
+				<< ", affected: " << affected << std::endl;
+	}
+  }
+  return 0;
+}
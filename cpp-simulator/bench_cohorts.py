@@ -0,0 +1,70 @@
+'''Times the cohort passes of the simulator on the input of launch_drive_sim.py
+for a range of cohort sizes and thread counts.
+
+Each run uses the options of launch_drive_sim.py with --RECORD_PHASE_TIMES,
+and reports the mean wall time per timestep of the train coach building, the
+cohort kappa and lambda updates (the "cohorts" phase) and the agent lambdas,
+which include the cohort lambda of each agent.
+'''
+import argparse
+import csv
+import os
+import subprocess
+
+import launch_drive_sim
+
+PHASES = ['train_coaches', 'cohorts', 'agent_lambdas', 'total']
+
+
+def mean_phase_times(phase_times_file):
+    with open(phase_times_file) as f:
+        rows = list(csv.DictReader(f))
+    return {phase: sum(float(row[phase]) for row in rows) / len(rows)
+            for phase in PHASES}
+
+
+def run(cohort_size, threads, output_path):
+    os.makedirs(output_path, exist_ok=True)
+    args = launch_drive_sim.simulator_args(
+        launch_drive_sim.BETA_COHORT[0], cohort_size,
+        launch_drive_sim.CROWDING_FACTORS[0],
+        launch_drive_sim.ISOLATION_POLICY[0],
+        launch_drive_sim.COHORT_SEVERITY_FRACTION[0],
+        launch_drive_sim.COHORT_STRATEGY[0],
+        launch_drive_sim.ONE_OFF_TRAVELERS_RATIO[0], output_path)
+    args += ['--RECORD_PHASE_TIMES', '--SKIP_PLOT_SCRIPTS',
+             '--output_series', 'phase_times']
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+    subprocess.run(args=args, env=env, check=True,
+                   stdout=open(F'{output_path}/cout.txt', 'w'),
+                   stderr=open(F'{output_path}/cerr.txt', 'w'))
+    return mean_phase_times(F'{output_path}/phase_times.csv')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-i', default=launch_drive_sim.INPUT_PATH,
+                        help='input directory (default: that of launch_drive_sim.py)')
+    parser.add_argument('-o', default=F'{launch_drive_sim.OUTPUT_PATH}/bench_cohorts',
+                        help='directory for the outputs of the runs')
+    parser.add_argument('--simulator', default=launch_drive_sim.SIMULATOR_PATH)
+    parser.add_argument('--num_days', type=int, default=launch_drive_sim.NUM_DAYS)
+    parser.add_argument('--cohort_sizes', type=int, nargs='+', default=[10, 20, 30, 40, 50])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    launch_drive_sim.INPUT_PATH = args.i
+    launch_drive_sim.SIMULATOR_PATH = args.simulator
+    launch_drive_sim.NUM_DAYS = args.num_days
+
+    print('cohort_size,threads,' + ','.join(F'{phase}_ms' for phase in PHASES))
+    for cohort_size in args.cohort_sizes:
+        for threads in args.threads:
+            times = run(cohort_size, threads, F'{args.o}/CS_{cohort_size}_T_{threads}')
+            print(F'{cohort_size},{threads},'
+                  + ','.join(F'{times[phase]:.3f}' for phase in PHASES),
+                  flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+//Copyright [2020] [Indian Institute of Science, Bangalore & Tata Institute of Fundamental Research, Mumbai]
+//SPDX-License-Identifier: Apache-2.0
+
+// Benchmark of the cohort building done at startup.
+//
+// Usage: ./bench_startup [num_agents] [train_fraction] [train_directory]
+//
+// Gives a fraction train_fraction (default 0.3) of num_agents synthetic agents
+// (default 1000000) an office to travel to by train, between stations of a
+// network the size of Mumbai's suburban railway, with one in twenty of them
+// one-off travellers. It then times make_cohorts, make_oneoff_cohorts and
+// merge_cohorts for cohort sizes 10 to 50, first with every cohort kept and
+// then with half of them dropped (FRACTION_IN_TRAINS_COHORTS 0.5). Run it
+// at 1000000 and 10000000 agents for the 1M and 10M Mumbai populations; the
+// agent array takes about 4.5 GB at 10M.
+//
+// The train journey files are written to train_directory (default /tmp).
+#include "models.h"
+#include "cohorts.h"
+#include <chrono>
+#include <cstdlib>
+#include <fstream>
+#include <iostream>
+#include <string>
+#include <vector>
+
+using std::vector;
+
+namespace {
+  // Stations of Mumbai's Western, Central, Harbour and Trans-Harbour lines
+  const int NUM_STATIONS = 99;
+  const int LINE_LENGTHS[] = {28, 24, 30, 17};
+  const int MINUTES_BETWEEN_STATIONS = 3;
+
+  // Every station pair is joined by a single leg on the line of its source
+  void write_train_files(const std::string& directory){
+	std::ofstream route(directory + "train_route.json");
+	std::ofstream travel(directory + "travel_time.json");
+	std::ofstream overlap(directory + "overlap_time.json");
+	vector<int> line_of(NUM_STATIONS);
+	route << "[";
+	int station = 0;
+	for(int line = 1; line <= 4; ++line){
+	  for(int i = 0; i < LINE_LENGTHS[line - 1]; ++i, ++station){
+		line_of[station] = line;
+		route << (station? ",": "") << "{\"trainLineId\":" << line << ",\"stationId\":" << station << "}";
+	  }
+	}
+	route << "]";
+	travel << "[";
+	bool first = true;
+	for(int src = 0; src < NUM_STATIONS; ++src){
+	  for(int dest = 0; dest < NUM_STATIONS; ++dest){
+		if(src == dest){
+		  continue;
+		}
+		const int minutes = MINUTES_BETWEEN_STATIONS * std::abs(src - dest);
+		travel << (first? "": ",") << "{\"start\":" << src << ",\"end\":" << dest
+			   << ",\"travel_time_min\":" << minutes
+			   << ",\"route_str\":\"[(" << line_of[src] << ", " << src << ", " << dest << ", " << minutes << ")]\"}";
+		first = false;
+	  }
+	}
+	travel << "]";
+	overlap << "[]";
+  }
+
+  template<class F>
+  double time_ms(F f){
+	auto start = std::chrono::high_resolution_clock::now();
+	f();
+	auto end = std::chrono::high_resolution_clock::now();
+	return std::chrono::duration<double, std::milli>(end - start).count();
+  }
+}
+
+int main(int argc, char** argv){
+  count_type num_agents = (argc > 1)? std::stoul(argv[1]): 1000000;
+  double train_fraction = (argc > 2)? std::stod(argv[2]): 0.3;
+  std::string train_directory = (argc > 3)? argv[3]: "/tmp";
+  if(train_directory.back() != '/'){
+	train_directory += '/';
+  }
+
+  GLOBAL.ENABLE_COHORTS = true;
+  write_train_files(train_directory);
+  TrainLoader trains(train_directory + "overlap_time.json",
+					 train_directory + "travel_time.json",
+					 train_directory + "train_route.json");
+
+  SEED_RNG_PROVIDED_SEED(1234);
+  vector<agent> nodes(num_agents);
+  init_agent_details(nodes);
+  count_type travellers = 0;
+  for(auto& node: nodes){
+	if(bernoulli(train_fraction)){
+	  auto& my_cohort = node.my_cohort;
+	  node.workplace_type = WorkplaceType::office;
+	  my_cohort.takes_train = true;
+	  my_cohort.one_off_traveler = bernoulli(0.05);
+	  my_cohort.source_station = uniform_count_type(0, NUM_STATIONS - 1);
+	  do{
+		my_cohort.destination_station = uniform_count_type(0, NUM_STATIONS - 1);
+	  } while(my_cohort.destination_station == my_cohort.source_station);
+	  ++travellers;
+	}
+  }
+  std::cout << "agents: " << num_agents << ", train travellers: " << travellers << std::endl;
+
+  for(double kept_fraction: {1.0, 0.5}){
+	GLOBAL.taking_train_fraction = kept_fraction;
+	for(count_type cohort_size = 10; cohort_size <= 50; cohort_size += 10){
+	  std::unordered_map<count_type, vector<cohort_space>> cohorts, one_off_cohorts;
+	  double cohorts_ms = time_ms([&](){ cohorts = make_cohorts(nodes, cohort_size, trains); });
+	  double one_off_ms = time_ms([&](){ one_off_cohorts = make_oneoff_cohorts(nodes, trains); });
+	  double merge_ms = time_ms([&](){ merge_cohorts(cohorts, std::move(one_off_cohorts)); });
+	  std::cout << "\ncohort size: " << cohort_size
+				<< ", fraction kept: " << kept_fraction
+				<< ", cohorts: " << get_num_cohorts(cohorts)
+				<< ", make_cohorts ms: " << cohorts_ms
+				<< ", make_oneoff_cohorts ms: " << one_off_ms
+				<< ", merge_cohorts ms: " << merge_ms
+				<< std::endl;
+	}
+  }
+  return 0;
+}
@@ -0,0 +1,474 @@
+//Copyright [2020] [Indian Institute of Science, Bangalore & Tata Institute of Fundamental Research, Mumbai]
+//SPDX-License-Identifier: Apache-2.0
+#include <algorithm>
+#include <cstring>
+#include <fstream>
+#include <iostream>
+#include <map>
+#include <sstream>
+#include <utility>
+#include <type_traits>
+
+#include "checkpoint.h"
+
+using std::string;
+using std::vector;
+
+namespace { // Anon namespace for local functions
+
+const char CHECKPOINT_MAGIC[8] = {'E', 'P', 'I', 'C', 'K', 'P', 'T', '\0'};
+
+//Agents and their details are written as raw bytes
+static_assert(std::is_trivially_copyable<agent>::value,
+			  "agent must be trivially copyable to be checkpointed");
+static_assert(std::is_trivially_copyable<agent_details>::value,
+			  "agent_details must be trivially copyable to be checkpointed");
+
+template<class T>
+void write_value(std::ostream& out, const T& value){
+  static_assert(std::is_trivially_copyable<T>::value, "raw write of a non-trivial type");
+  out.write(reinterpret_cast<const char*>(&value), sizeof(T));
+}
+
+template<class T>
+void read_value(std::istream& in, T& value){
+  static_assert(std::is_trivially_copyable<T>::value, "raw read of a non-trivial type");
+  in.read(reinterpret_cast<char*>(&value), sizeof(T));
+}
+
+template<class T>
+void write_vector(std::ostream& out, const vector<T>& values){
+  write_value(out, count_type(values.size()));
+  out.write(reinterpret_cast<const char*>(values.data()), sizeof(T) * values.size());
+}
+
+template<class T>
+void read_vector(std::istream& in, vector<T>& values){
+  count_type size = 0;
+  read_value(in, size);
+  if(!in){
+	return;
+  }
+  values.resize(size);
+  in.read(reinterpret_cast<char*>(values.data()), sizeof(T) * size);
+}
+
+void write_string(std::ostream& out, const string& value){
+  write_value(out, count_type(value.size()));
+  out.write(value.data(), value.size());
+}
+
+void read_string(std::istream& in, string& value){
+  count_type size = 0;
+  read_value(in, size);
+  if(!in){
+	return;
+  }
+  value.resize(size);
+  in.read(&value[0], size);
+}
+
+template<class T>
+void write_series(std::ostream& out, const std::map<string, timed_csv_data<T>>& series){
+  write_value(out, count_type(series.size()));
+  for(const auto& elem: series){
+	write_string(out, elem.first);
+	write_value(out, count_type(elem.second.size()));
+	for(const auto& row: elem.second){
+	  write_value(out, std::get<0>(row));
+	  write_vector(out, std::get<1>(row));
+	}
+  }
+}
+
+template<class T>
+void read_series(std::istream& in, std::map<string, timed_csv_data<T>>& series){
+  series.clear();
+  count_type num_series = 0;
+  read_value(in, num_series);
+  for(count_type i = 0; i < num_series && in; ++i){
+	string name;
+	read_string(in, name);
+	count_type num_rows = 0;
+	read_value(in, num_rows);
+	auto& rows = series[name];
+	rows.resize(num_rows);
+	for(auto& row: rows){
+	  read_value(in, std::get<0>(row));
+	  read_vector(in, std::get<1>(row));
+	  if(!in){
+		return;
+	  }
+	}
+  }
+}
+
+template<class Generator>
+void write_generator(std::ostream& out, const Generator& generator){
+  std::ostringstream state;
+  state << generator;
+  write_string(out, state.str());
+}
+
+template<class Generator>
+void read_generator(std::istream& in, Generator& generator){
+  string value;
+  read_string(in, value);
+  std::istringstream state(value);
+  state >> generator;
+  if(!state){
+	in.setstate(std::ios::failbit);
+  }
+}
+
+//Cohorts are kept in an unordered_map, so they are visited in key order
+vector<count_type> sorted_cohort_keys(const std::unordered_map<count_type, vector<cohort_space>>& cohorts){
+  vector<count_type> keys;
+  keys.reserve(cohorts.size());
+  for(const auto& elem: cohorts){
+	keys.push_back(elem.first);
+  }
+  std::sort(keys.begin(), keys.end());
+  return keys;
+}
+
+//Sizes that have to agree between the stored and the current run
+vector<count_type> layout(const simulation_state& state){
+  count_type num_cohorts = 0;
+  for(const auto& elem: state.cohorts){
+	num_cohorts += elem.second.size();
+  }
+  count_type num_projects = 0;
+  for(const auto& w: state.workplaces){
+	num_projects += w.projects.size();
+  }
+  return {sizeof(agent), sizeof(agent_details),
+		  sizeof(count_type), sizeof(double), sizeof(long double),
+		  state.nodes.size(), state.homes.size(), state.workplaces.size(),
+		  num_projects, state.communities.size(),
+		  state.nbr_cells.size(),
+		  state.cohorts.size(), num_cohorts,
+		  count_type(GLOBAL.num_wards), count_type(GLOBAL.RNG_SEED_NETWORK)};
+}
+
+//The event counters in GLOBAL, in a fixed order
+vector<count_type*> global_counters(){
+  return {&GLOBAL.INIT_ACTUALLY_INFECTED,
+		  &GLOBAL.num_detected_cases,
+		  &GLOBAL.daily_new_exposed, &GLOBAL.daily_new_presymptomatic,
+		  &GLOBAL.daily_new_symptomatic, &GLOBAL.daily_new_hospitalised,
+		  &GLOBAL.daily_new_critical, &GLOBAL.daily_new_recovered,
+		  &GLOBAL.daily_new_deaths, &GLOBAL.daily_new_detected,
+		  &GLOBAL.cumulative_new_exposed, &GLOBAL.cumulative_new_presymptomatic,
+		  &GLOBAL.cumulative_new_symptomatic, &GLOBAL.cumulative_new_hospitalised,
+		  &GLOBAL.cumulative_new_critical, &GLOBAL.cumulative_new_recovered,
+		  &GLOBAL.cumulative_new_deaths, &GLOBAL.cumulative_new_detected};
+}
+
+//Applies op (read_op or write_op) to the fields of GLOBAL that interventions
+//change during a run, such as the train and containment settings of an
+//intervention file, which later periods do not necessarily set again
+template<class Stream, class Op>
+void visit_intervention_globals(Stream& stream, Op op){
+  op(stream, GLOBAL.TRAINS_RUNNING);
+  op(stream, GLOBAL.FRACTION_FORCED_TO_TAKE_TRAIN);
+  op(stream, GLOBAL.LOCKED_COMMUNITY_LEAKAGE);
+  op(stream, GLOBAL.COMMUNITY_LOCK_THRESHOLD);
+  op(stream, GLOBAL.LOCKED_NEIGHBORHOOD_LEAKAGE);
+  op(stream, GLOBAL.CYCLIC_POLICY_ENABLED);
+  op(stream, GLOBAL.CYCLIC_POLICY_START_DAY);
+  op(stream, GLOBAL.NUMBER_OF_CYCLIC_CLASSES);
+  op(stream, GLOBAL.PERIOD_OF_ATTENDANCE_CYCLE);
+}
+
+//Applies op (read_op or write_op) to every dynamic field of the locations
+template<class Stream, class Op, class Homes, class Workplaces, class Communities, class Cells>
+void visit_locations(Stream& stream, Op op, Homes& homes, Workplaces& workplaces,
+					 Communities& communities, Cells& nbr_cells){
+  for(auto& home: homes){
+	op(stream, home.lambda_home);
+	op(stream, home.Q_h);
+	op(stream, home.random_households.lambda_random_community);
+	op(stream, home.lambda_random_community_outgoing);
+	op(stream, home.compliant);
+	op(stream, home.non_compliance_metric);
+	op(stream, home.quarantined);
+	op(stream, home.age_independent_mixing);
+	op(stream, home.neighborhood_access_factor);
+  }
+  for(auto& workplace: workplaces){
+	op(stream, workplace.lambda_workplace);
+	op(stream, workplace.Q_w);
+	op(stream, workplace.quarantined);
+	op(stream, workplace.age_independent_mixing);
+	for(auto& project: workplace.projects){
+	  op(stream, project.lambda_project);
+	  op(stream, project.age_independent_mixing);
+	}
+  }
+  for(auto& community: communities){
+	op(stream, community.lambda_community);
+	op(stream, community.lambda_community_global);
+	op(stream, community.Q_c);
+	op(stream, community.quarantined);
+	op(stream, community.w_c);
+  }
+  for(auto& cell: nbr_cells){
+	op(stream, cell.quarantined);
+	op(stream, cell.lambda_nbr);
+	op(stream, cell.num_active_hospitalisations);
+	op(stream, cell.access_factor);
+	op(stream, cell.num_index_hospitalised);
+	op(stream, cell.num_index_positive);
+	op(stream, cell.num_index_symptomatic);
+  }
+}
+
+//Position of a cohort as (key, index in cohorts.at(key))
+using cohort_position = std::pair<count_type, count_type>;
+
+//Coaches point into the cohorts, so they are stored with the positions of
+//their cohorts, and their lines in key order
+void write_coaches(std::ostream& out,
+				   const std::unordered_map<count_type, vector<train_coach>>& train_coaches,
+				   const std::map<const cohort_space*, cohort_position>& positions){
+  vector<count_type> keys;
+  for(const auto& elem: train_coaches){
+	keys.push_back(elem.first);
+  }
+  std::sort(keys.begin(), keys.end());
+  write_vector(out, keys);
+  for(auto key: keys){
+	const auto& coaches = train_coaches.at(key);
+	write_value(out, count_type(coaches.size()));
+	for(const auto& coach: coaches){
+	  write_value(out, coach.coach_id);
+	  write_value(out, coach.trainLine);
+	  write_value(out, coach.isDown);
+	  write_vector(out, coach.stations);
+	  write_vector(out, coach.capacity_at_station);
+	  vector<cohort_position> cohorts;
+	  for(auto cohort: coach.cohorts){
+		cohorts.push_back(positions.at(cohort));
+	  }
+	  write_vector(out, cohorts);
+	}
+  }
+}
+
+void read_coaches(std::istream& in,
+				  std::unordered_map<count_type, vector<train_coach>>& train_coaches,
+				  std::unordered_map<count_type, vector<cohort_space>>& cohorts){
+  train_coaches.clear();
+  vector<count_type> keys;
+  read_vector(in, keys);
+  for(auto key: keys){
+	count_type num_coaches = 0;
+	read_value(in, num_coaches);
+	if(!in){
+	  return;
+	}
+	auto& coaches = train_coaches[key];
+	coaches.resize(num_coaches);
+	for(auto& coach: coaches){
+	  read_value(in, coach.coach_id);
+	  read_value(in, coach.trainLine);
+	  read_value(in, coach.isDown);
+	  read_vector(in, coach.stations);
+	  read_vector(in, coach.capacity_at_station);
+	  vector<cohort_position> positions;
+	  read_vector(in, positions);
+	  if(!in){
+		return;
+	  }
+	  coach.cohorts.clear();
+	  for(const auto& position: positions){
+		auto it = cohorts.find(position.first);
+		if(it == cohorts.end() || position.second >= it->second.size()){
+		  in.setstate(std::ios::failbit);
+		  return;
+		}
+		coach.cohorts.push_back(&it->second[position.second]);
+	  }
+	}
+  }
+}
+
+struct write_op{
+  template<class T>
+  void operator()(std::ostream& out, const T& value) const { write_value(out, value); }
+};
+
+struct read_op{
+  template<class T>
+  void operator()(std::istream& in, T& value) const { read_value(in, value); }
+};
+
+} // End anon namespace
+
+bool store_checkpoint(const string& filename, count_type time_step,
+					  const simulation_state& state){
+  std::ofstream out(filename, std::ios::binary);
+  if(!out.good()){
+	std::cout << "ERROR: Checkpoint file " << filename << " can't be opened" << std::endl;
+	return false;
+  }
+  out.write(CHECKPOINT_MAGIC, sizeof(CHECKPOINT_MAGIC));
+  write_value(out, CHECKPOINT_VERSION);
+  write_vector(out, layout(state));
+  write_value(out, time_step);
+
+  write_generator(out, GENERATOR);
+  write_generator(out, GENERATOR_NETWORK);
+  for(auto counter: global_counters()){
+	write_value(out, *counter);
+  }
+  visit_intervention_globals(out, write_op());
+
+  write_vector(out, state.nodes);
+  write_vector(out, AGENT_DETAILS);
+  visit_locations(out, write_op(), state.homes, state.workplaces,
+				  state.communities, state.nbr_cells);
+  for(auto key: sorted_cohort_keys(state.cohorts)){
+	for(const auto& cohort: state.cohorts.at(key)){
+	  write_value(out, cohort.lambda_interaction_internal);
+	  write_value(out, cohort.lambda_interaction_external);
+	  write_value(out, cohort.quarantined);
+	  write_value(out, cohort.enabled);
+	}
+  }
+  std::map<const cohort_space*, cohort_position> positions;
+  for(const auto& elem: state.cohorts){
+	for(count_type i = 0; i < elem.second.size(); ++i){
+	  positions[&elem.second[i]] = {elem.first, i};
+	}
+  }
+  write_value(out, state.coaches_created);
+  write_coaches(out, state.train_coaches_am, positions);
+  write_coaches(out, state.train_coaches_pm, positions);
+
+  const auto& counters = state.counters;
+  write_value(out, counters.num_cases);
+  write_value(out, counters.quarantined_num_cases);
+  write_value(out, counters.num_cumulative_hospitalizations);
+  write_value(out, counters.num_cumulative_infective);
+  write_value(out, counters.num_total_infections);
+  write_value(out, counters.travel_fraction);
+  write_value(out, counters.cumulative_mean_lambda_fraction_data);
+  write_vector(out, counters.infections_by_new_infectives);
+  write_vector(out, counters.home_ward_infected);
+
+  const auto& plot_data = state.plot_data;
+  write_series(out, plot_data.nums);
+  write_series(out, plot_data.susceptible_lambdas);
+  write_series(out, plot_data.total_lambda_fractions);
+  write_series(out, plot_data.mean_lambda_fractions);
+  write_series(out, plot_data.cumulative_mean_lambda_fractions);
+  write_series(out, plot_data.infections_by_new_infectives);
+  write_series(out, plot_data.quarantined_stats);
+  write_series(out, plot_data.curtailment_stats);
+  write_series(out, plot_data.disease_label_stats);
+  write_series(out, plot_data.ward_wise_stats);
+  write_series(out, plot_data.coach_stats);
+  write_series(out, plot_data.contact_tracing_stats);
+  write_series(out, plot_data.daily_cumulative_stats);
+
+  out.close();
+  if(!out){
+	std::cout << "ERROR: Writing checkpoint file " << filename << " failed" << std::endl;
+	return false;
+  }
+  return true;
+}
+
+bool load_checkpoint(const string& filename, count_type& time_step,
+					 simulation_state& state){
+  std::ifstream in(filename, std::ios::binary);
+  if(!in.good()){
+	std::cout << "ERROR: Checkpoint file " << filename << " doesn't exist" << std::endl;
+	return false;
+  }
+  char magic[sizeof(CHECKPOINT_MAGIC)];
+  in.read(magic, sizeof(magic));
+  std::uint32_t version = 0;
+  read_value(in, version);
+  if(!in || std::memcmp(magic, CHECKPOINT_MAGIC, sizeof(magic)) != 0){
+	std::cout << "ERROR: " << filename << " is not a checkpoint file" << std::endl;
+	return false;
+  }
+  if(version != CHECKPOINT_VERSION){
+	std::cout << "ERROR: checkpoint version " << version
+			  << " does not match the simulator's version " << CHECKPOINT_VERSION << std::endl;
+	return false;
+  }
+  vector<count_type> stored_layout;
+  read_vector(in, stored_layout);
+  if(stored_layout != layout(state)){
+	std::cout << "ERROR: checkpoint was written for a different city, network seed or build"
+			  << std::endl;
+	return false;
+  }
+  read_value(in, time_step);
+  if(time_step >= GLOBAL.NUM_TIMESTEPS){
+	std::cout << "ERROR: checkpoint timestep " << time_step
+			  << " is past the end of the simulation" << std::endl;
+	return false;
+  }
+
+  read_generator(in, GENERATOR);
+  read_generator(in, GENERATOR_NETWORK);
+  for(auto counter: global_counters()){
+	read_value(in, *counter);
+  }
+  visit_intervention_globals(in, read_op());
+
+  read_vector(in, state.nodes);
+  read_vector(in, AGENT_DETAILS);
+  visit_locations(in, read_op(), state.homes, state.workplaces,
+				  state.communities, state.nbr_cells);
+  for(auto key: sorted_cohort_keys(state.cohorts)){
+	for(auto& cohort: state.cohorts.at(key)){
+	  read_value(in, cohort.lambda_interaction_internal);
+	  read_value(in, cohort.lambda_interaction_external);
+	  read_value(in, cohort.quarantined);
+	  read_value(in, cohort.enabled);
+	}
+  }
+  read_value(in, state.coaches_created);
+  read_coaches(in, state.train_coaches_am, state.cohorts);
+  read_coaches(in, state.train_coaches_pm, state.cohorts);
+
+  auto& counters = state.counters;
+  read_value(in, counters.num_cases);
+  read_value(in, counters.quarantined_num_cases);
+  read_value(in, counters.num_cumulative_hospitalizations);
+  read_value(in, counters.num_cumulative_infective);
+  read_value(in, counters.num_total_infections);
+  read_value(in, counters.travel_fraction);
+  read_value(in, counters.cumulative_mean_lambda_fraction_data);
+  read_vector(in, counters.infections_by_new_infectives);
+  read_vector(in, counters.home_ward_infected);
+  //The branch may run for longer than the run that wrote the checkpoint
+  counters.infections_by_new_infectives.resize(GLOBAL.NUM_TIMESTEPS, 0);
+
+  auto& plot_data = state.plot_data;
+  read_series(in, plot_data.nums);
+  read_series(in, plot_data.susceptible_lambdas);
+  read_series(in, plot_data.total_lambda_fractions);
+  read_series(in, plot_data.mean_lambda_fractions);
+  read_series(in, plot_data.cumulative_mean_lambda_fractions);
+  read_series(in, plot_data.infections_by_new_infectives);
+  read_series(in, plot_data.quarantined_stats);
+  read_series(in, plot_data.curtailment_stats);
+  read_series(in, plot_data.disease_label_stats);
+  read_series(in, plot_data.ward_wise_stats);
+  read_series(in, plot_data.coach_stats);
+  read_series(in, plot_data.contact_tracing_stats);
+  read_series(in, plot_data.daily_cumulative_stats);
+
+  if(!in){
+	std::cout << "ERROR: checkpoint file " << filename << " is truncated" << std::endl;
+	return false;
+  }
+  return true;
+}
@@ -0,0 +1,59 @@
+//Copyright [2020] [Indian Institute of Science, Bangalore & Tata Institute of Fundamental Research, Mumbai]
+//SPDX-License-Identifier: Apache-2.0
+#ifndef CHECKPOINT_H_
+#define CHECKPOINT_H_
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+#include "models.h"
+#include "outputs.h"
+
+//Version of the checkpoint file layout. Bump this whenever the layout, or a
+//struct written to the file as raw bytes, changes.
+const std::uint32_t CHECKPOINT_VERSION = 7;
+
+//Cumulative quantities kept by run_simulation across timesteps
+struct run_counters{
+  count_type num_cases = 0;
+  count_type quarantined_num_cases = 0;
+  count_type num_cumulative_hospitalizations = 0;
+  count_type num_cumulative_infective = 0;
+  count_type num_total_infections = 0;
+  double travel_fraction = 0;
+  lambda_incoming_data cumulative_mean_lambda_fraction_data;
+  std::vector<long double> infections_by_new_infectives;
+  std::vector<int> home_ward_infected;
+};
+
+//Simulator state at the start of a timestep
+struct simulation_state{
+  std::vector<agent>& nodes;
+  std::vector<house>& homes;
+  std::vector<workplace>& workplaces;
+  std::vector<community>& communities;
+  nbr_cell_grid& nbr_cells;
+  std::unordered_map<count_type, std::vector<cohort_space>>& cohorts;
+  std::unordered_map<count_type, std::vector<train_coach>>& train_coaches_am;
+  std::unordered_map<count_type, std::vector<train_coach>>& train_coaches_pm;
+  bool& coaches_created;
+  run_counters& counters;
+  plot_data_struct& plot_data;
+};
+
+//Writes the state before timestep time_step is simulated: the agents, the
+//dynamic fields of homes, workplaces, communities, neighbourhood cells and
+//cohorts, the train coaches of the day, the run counters and output series so far, the event counters and
+//the fields changed by interventions in GLOBAL, and the state of both random
+//number generators.
+bool store_checkpoint(const std::string& filename, count_type time_step,
+					  const simulation_state& state);
+
+//Restores a checkpoint written by store_checkpoint into a simulator
+//initialized from the same inputs and network seed. Returns false, leaving
+//the state unspecified, if the file does not match. On success time_step is
+//the first timestep left to simulate.
+bool load_checkpoint(const std::string& filename, count_type& time_step,
+					 simulation_state& state);
+
+#endif
@@ -5,10 +5,12 @@
 #include <unordered_map>
 #include <iostream>
 #include <fstream>
+#include <iterator>
 #include "models.h"
 #include "cohorts.h"
 #include "train_loader.h"
 #include "intervention_primitives.h"
+#include "interventions.h"
 
 #ifdef ENABLE_PROTO
 #include "agents_store.pb.h"
@@ -18,11 +20,12 @@ using namespace std;
 
 namespace {
 
-vector<cohort_space*> reset_coach_assignment(
+// Fills ptr_cohort_vector with the cohorts to assign to coaches, in random order.
+void reset_coach_assignment(
     std::unordered_map<count_type, std::vector<cohort_space>>& cohorts, 
-    bool isOneOff){
+    bool isOneOff, vector<cohort_space*>& ptr_cohort_vector){
 
-    vector<cohort_space*> ptr_cohort_vector;
+    ptr_cohort_vector.clear();
     for (auto& it1: cohorts){
         for (auto& cohort: it1.second){
             if (cohort.is_one_off_cohort != isOneOff) {
@@ -33,11 +36,10 @@ vector<cohort_space*> reset_coach_assignment(
     }
     //std::random_shuffle (ptr_cohort_vector.begin(), ptr_cohort_vector.end()); //What would be the random generator. Will it be the same permutation all the time?
     randomly_shuffle(ptr_cohort_vector);
-    return ptr_cohort_vector;
-}
-bool custom_sort(pair<int, int> i, pair<int, int> j) {
-    return i.second > j.second; // Reverse order.
 }
+
+const int NUM_TRAIN_LINES = 4; //need to be updated to actual number of lines. Need to add to GLOBAL?
+const int REJECTED_COHORTS_THRESHOLD = 5; //Need to add to GLOBAL?
 void drop_cohorts_randomly(
     std::unordered_map<count_type, std::vector<cohort_space>>& cohorts,
     double taking_train_fraction) {
@@ -60,10 +62,23 @@ void drop_cohorts_randomly(
     int elements_to_keep = taking_train_fraction * vec.size();
     vec.resize(vec.size() - elements_to_keep);
 
-    std::sort(vec.begin(), vec.end(), custom_sort);
-
-    for (auto& i : vec) {
-        cohorts[i.first].erase(cohorts[i.first].begin() + i.second);
+    // Remove the dropped cohorts of each station pair in one pass
+    std::sort(vec.begin(), vec.end());
+    for (auto dropped = vec.begin(); dropped != vec.end(); ) {
+        const int key = dropped->first;
+        auto& station_cohorts = cohorts[key];
+        size_t kept = 0;
+        for (size_t i = 0; i < station_cohorts.size(); i++) {
+            if (dropped != vec.end() && dropped->first == key && size_t(dropped->second) == i) {
+                ++dropped;
+                continue;
+            }
+            if (kept != i) {
+                station_cohorts[kept] = std::move(station_cohorts[i]);
+            }
+            ++kept;
+        }
+        station_cohorts.erase(station_cohorts.begin() + kept, station_cohorts.end());
     }
 
     for (auto& it1: cohorts){
@@ -74,6 +89,65 @@ void drop_cohorts_randomly(
           << " dropped size " << vec.size();
 }
 
+// Agents who take the train to an office every day, or only once in a while
+// (one-off travellers), grouped by source and destination station. The agents
+// of group g are travellers[offsets[g]] to travellers[offsets[g + 1] - 1], in
+// index order, and the groups are in the order of their first agent. ranks
+// holds the position of each of them among all the travellers, in index order.
+struct station_pair_groups {
+    vector<int> sources;
+    vector<int> destinations;
+    vector<count_type> offsets;
+    vector<count_type> travellers;
+    vector<count_type> ranks;
+
+    count_type size() const {
+        return sources.size();
+    }
+};
+
+// Counting sort of the travellers by station pair
+station_pair_groups group_by_station_pair(const vector<agent>& nodes, bool one_off) {
+    station_pair_groups groups;
+    unordered_map<count_type, count_type> group_of_pair;
+    vector<count_type> group_sizes;
+    vector<count_type> group_of_traveller;
+    vector<count_type> travellers;
+    for (count_type i=0; i<nodes.size(); ++i){
+        if(nodes[i].workplace_type != WorkplaceType::office
+            || !nodes[i].my_cohort.takes_train || nodes[i].my_cohort.one_off_traveler != one_off){
+            continue;
+        }
+        const int source = nodes[i].my_cohort.source_station;
+        const int destination = nodes[i].my_cohort.destination_station;
+        const count_type pair = (count_type(unsigned(source)) << 32) | unsigned(destination);
+        const auto inserted = group_of_pair.emplace(pair, groups.size());
+        if (inserted.second) {
+            groups.sources.push_back(source);
+            groups.destinations.push_back(destination);
+            group_sizes.push_back(0);
+        }
+        const count_type group = inserted.first->second;
+        ++group_sizes[group];
+        group_of_traveller.push_back(group);
+        travellers.push_back(i);
+    }
+
+    groups.offsets.assign(groups.size() + 1, 0);
+    for (count_type g = 0; g < groups.size(); ++g) {
+        groups.offsets[g + 1] = groups.offsets[g] + group_sizes[g];
+    }
+    vector<count_type> next(groups.offsets.begin(), groups.offsets.end() - 1);
+    groups.travellers.resize(travellers.size());
+    groups.ranks.resize(travellers.size());
+    for (count_type t = 0; t < travellers.size(); ++t) {
+        const auto position = next[group_of_traveller[t]]++;
+        groups.travellers[position] = travellers[t];
+        groups.ranks[position] = t;
+    }
+    return groups;
+}
+
 }
 
 int get_num_cohorts(const std::unordered_map<count_type, std::vector<cohort_space>>& cohorts){
@@ -85,6 +159,17 @@ int get_num_cohorts(const std::unordered_map<count_type, std::vector<cohort_spac
     return num_cohorts;
 }
 
+vector<cohort_space*> list_cohorts(unordered_map<count_type, vector<cohort_space>>& cohorts){
+    vector<cohort_space*> cohort_list;
+    cohort_list.reserve(get_num_cohorts(cohorts));
+    for (auto& it1: cohorts){
+        for (auto& cohort: it1.second){
+            cohort_list.push_back(&cohort);
+        }
+    }
+    return cohort_list;
+}
+
 #ifdef ENABLE_PROTO
 void storeAgentsInfo(const std::vector<agent>& nodes) {
     if (GLOBAL.output_path.empty()) {
@@ -185,21 +270,23 @@ vector<tuple<int, bool, int, double>> get_coach_occupancy_per_line(
                 up_coach_count++;
             }
 
-            for (const auto& station : coach.capacity_at_station) {
+            for (count_type s = 0; s < coach.stations.size(); ++s) {
+                const auto station = coach.stations[s];
+                const auto capacity = coach.capacity_at_station[s];
                 // Total
-                total_capacity += station.second;
-                per_coach[coach.coach_id] += station.second;
+                total_capacity += capacity;
+                per_coach[coach.coach_id] += capacity;
                 // Per stations.
                 if (coach.isDown) {
-                    if (down.find(station.first) == down.end()) {
-                        down[station.first] = 0;
+                    if (down.find(station) == down.end()) {
+                        down[station] = 0;
                     }
-                    down[station.first] += station.second;
+                    down[station] += capacity;
                 } else {
-                    if (up.find(station.first) == up.end()) {
-                        up[station.first] = 0;
+                    if (up.find(station) == up.end()) {
+                        up[station] = 0;
                     }
-                    up[station.first] += station.second;
+                    up[station] += capacity;
                 }
             }
         }
@@ -230,8 +317,12 @@ TrainLoader init_TrainLoader() {
     std::string overlap_file = GLOBAL.input_base + "overlap_time.json";
     std::string travel_file = GLOBAL.input_base + "travel_time.json";
     std::string route_file = GLOBAL.input_base + "train_route.json";
+    std::string cache_file;
+    if (!GLOBAL.train_cache_filename.empty()) {
+        cache_file = GLOBAL.input_base + GLOBAL.train_cache_filename;
+    }
 
-    TrainLoader train_loader(overlap_file, travel_file, route_file);
+    TrainLoader train_loader(overlap_file, travel_file, route_file, cache_file);
     return train_loader;
 }
 
@@ -260,28 +351,40 @@ void merge_cohorts(std::unordered_map<count_type, std::vector<cohort_space>>& to
        }
 }
 
+void merge_cohorts(std::unordered_map<count_type, std::vector<cohort_space>>& to,
+   std::unordered_map<count_type, std::vector<cohort_space>>&& from) {
+       for (auto& iter1: from) {
+           auto& station_cohorts = to[iter1.first];
+           if (station_cohorts.empty()) {
+               station_cohorts = std::move(iter1.second);
+               continue;
+           }
+           station_cohorts.insert(station_cohorts.end(),
+               std::make_move_iterator(iter1.second.begin()), std::make_move_iterator(iter1.second.end()));
+       }
+       from.clear();
+}
+
 unordered_map<count_type, vector<cohort_space>> make_oneoff_cohorts(
     vector<agent>& nodes, const TrainLoader& trains) {
     unordered_map<count_type, vector<cohort_space>> cohorts_at_station;
     if(!GLOBAL.ENABLE_COHORTS){
         return {};
     }
-    int cohort_id = 0; // These ids will overlap with normal cohorts. This is fine since they won't share coaches.
-    for (count_type i=0; i<nodes.size(); ++i){ 
-        if(nodes[i].workplace_type != WorkplaceType::office 
-            || !nodes[i].my_cohort.takes_train || !nodes[i].my_cohort.one_off_traveler){
-            continue;
+    auto groups = group_by_station_pair(nodes, true);
+    // Every one-off traveller is a cohort of its own, numbered in index order.
+    // These ids will overlap with normal cohorts. This is fine since they won't share coaches.
+    for (count_type g = 0; g < groups.size(); ++g) {
+        const int source = groups.sources[g];
+        const int destination = groups.destinations[g];
+        const int journey_minutes = trains.GetJourneyMinutes(source, destination);
+        auto& station_cohorts = cohorts_at_station[source*100 + destination];
+        station_cohorts.reserve(station_cohorts.size() + groups.offsets[g + 1] - groups.offsets[g]);
+        for (auto t = groups.offsets[g]; t < groups.offsets[g + 1]; ++t) {
+            station_cohorts.emplace_back(groups.ranks[t], source, destination, journey_minutes);
+            station_cohorts.back().internal_nodes.push_back(groups.travellers[t]);
+            station_cohorts.back().is_one_off_cohort = true;
         }
-        int source = nodes[i].my_cohort.source_station;
-        int destination = nodes[i].my_cohort.destination_station;
-        int key = source*100 + destination;
-        if (cohorts_at_station.find(key) == cohorts_at_station.end()) {
-            cohorts_at_station[key] = {};
-        }
-        cohort_space new_cohort(cohort_id++, source, destination, trains.GetJourneyMinutes(source, destination));
-        new_cohort.internal_nodes.push_back(i);
-        new_cohort.is_one_off_cohort = true;
-        cohorts_at_station[key].push_back(new_cohort);
     }
     return cohorts_at_station;
 }
@@ -290,64 +393,42 @@ unordered_map<count_type, vector<cohort_space>> make_oneoff_cohorts(
 unordered_map<count_type, vector<cohort_space>> make_cohorts(
     vector<agent>& nodes, count_type target_size, const TrainLoader& trains){
     unordered_map<count_type, vector<cohort_space>> cohorts_at_station;
-    vector<cohort_space> empty_cohort;
 
     //TODO[v2]: consider the following values: double fraction_in_train, double crowding_factor,
     if(!GLOBAL.ENABLE_COHORTS){
         return {};
     }
-    //unordered_map to map source, destination and the employees who travel between source, and destination
-    unordered_map<int, unordered_map<int, vector<count_type>>> stations_and_people;
-    unordered_map<int, vector<count_type>> at_source;
-
-    //iterate across all employed individuals
-    for (count_type i=0; i<nodes.size(); ++i){
-        if(nodes[i].workplace_type != WorkplaceType::office 
-            || !nodes[i].my_cohort.takes_train || nodes[i].my_cohort.one_off_traveler){
-            continue;
-        }
-        int source = nodes[i].my_cohort.source_station;
-        int destination = nodes[i].my_cohort.destination_station;
-
-        //group individuals with same source and destination stations
-        if (stations_and_people.find(source) == stations_and_people.end()) {
-            //if new source: add both the source and destination
-            stations_and_people[source] = at_source;
-            vector<count_type> agent_vector = {i};
-            stations_and_people[source][destination] = agent_vector;
-        }
-        else{
-            //source exists
-            if (stations_and_people[source].find(destination) == stations_and_people[source].end()) {
-                vector<count_type> agent_vector = {i};
-                stations_and_people[source][destination] = agent_vector;
-            }
-            else{
-                stations_and_people[source][destination].push_back(i);
-            }
-        }
+    //group individuals with same source and destination stations
+    auto groups = group_by_station_pair(nodes, false);
+
+    //The cohorts of the station pairs are added in the order of a map from
+    //source to a map from destination, filled in order of first appearance.
+    //The random draws when dropping cohorts and building coaches depend on
+    //this order.
+    unordered_map<int, unordered_map<int, count_type>> stations_and_groups;
+    for (count_type g = 0; g < groups.size(); ++g) {
+        stations_and_groups[groups.sources[g]][groups.destinations[g]] = g;
     }
 
-    //create cohorts
-    for (auto& it1: stations_and_people) {
+    //create cohorts of target_size consecutive agents of each group
+    for (auto& it1: stations_and_groups) {
         int source_index = it1.first;
         for (auto& it2: it1.second) {
-            int cohort_count = 0;
-            cohorts_at_station[(it1.first*100) + it2.first] = vector<cohort_space>();
-            auto citer = it2.second.begin();
-            cohort_space new_cohort(cohort_count, source_index, it2.first, trains.GetJourneyMinutes(source_index, it2.first));
-            while(citer!= it2.second.end()) {
-                new_cohort.internal_nodes.push_back(*citer);
-                if (new_cohort.internal_nodes.size() == target_size || ((citer+1)==it2.second.end())) {
-                    // storing cohort.
-                    new_cohort.is_one_off_cohort = false;
-                    cohorts_at_station[(it1.first*100) + it2.first].push_back(new_cohort);
-                    new_cohort = cohort_space(++cohort_count, source_index, it2.first, trains.GetJourneyMinutes(source_index, it2.first));
-                }
-                citer++;
+            const auto first_traveller = groups.travellers.begin() + groups.offsets[it2.second];
+            const count_type num_travellers = groups.offsets[it2.second + 1] - groups.offsets[it2.second];
+            const count_type cohort_size = (target_size > 0) ? target_size : num_travellers;
+            const int journey_minutes = trains.GetJourneyMinutes(source_index, it2.first);
+            auto& station_cohorts = cohorts_at_station[(it1.first*100) + it2.first];
+            station_cohorts.clear();
+            station_cohorts.reserve((num_travellers - 1) / cohort_size + 1);
+            for (count_type first = 0; first < num_travellers; first += cohort_size) {
+                station_cohorts.emplace_back(station_cohorts.size(), source_index, it2.first, journey_minutes);
+                station_cohorts.back().internal_nodes.assign(
+                    first_traveller + first,
+                    first_traveller + std::min(num_travellers, first + cohort_size));
             }
         }
-    }    
+    }
     drop_cohorts_randomly(cohorts_at_station, GLOBAL.taking_train_fraction);
     return cohorts_at_station;
 }
@@ -438,117 +519,188 @@ std::unordered_map<count_type, std::vector<train_coach>> make_train_coaches(
     if(!GLOBAL.ENABLE_COHORTS){
         return train_coaches;
     }
-    auto random_cohort_ptr = reset_coach_assignment(cohorts, isOneOff);
-    int coach_counter = 0;
+    train_coach_builder builder(trains);
+    builder.add_coaches(cohorts, isAM, isOneOff, train_coaches);
+    return train_coaches;
+}
 
+train_coach_builder::train_coach_builder(const TrainLoader& trains):
+    trains(trains),
+    line_stations(NUM_TRAIN_LINES),
+    up_coaches(NUM_TRAIN_LINES),
+    down_coaches(NUM_TRAIN_LINES),
+    rejected_up_cohorts(NUM_TRAIN_LINES),
+    rejected_down_cohorts(NUM_TRAIN_LINES) {
+    for(int line = 1; line <= NUM_TRAIN_LINES; ++line){
+        for (auto station: trains.GetTrainLineStations(line, true)){
+            auto& stations = line_stations[line-1];
+            if(std::find(stations.begin(), stations.end(), station) == stations.end()){
+                stations.push_back(station);
+            }
+        }
+    }
+}
 
-    int num_lines = 4; //need to be updated to actual number of lines. Need to add to GLOBAL?
-    for(int line_count = 0; line_count<num_lines;++line_count){
-        vector<train_coach> temp;
-        train_coaches[line_count+1] = temp; //train linenumber starts from 1
+const train_coach_builder::journey* train_coach_builder::find_journey(int src, int dest) {
+    auto by_stations = [](const journey& j, const std::pair<int, int>& key){
+        return std::make_pair(j.src, j.dest) < key;
+    };
+    auto key = std::make_pair(src, dest);
+    auto it = std::lower_bound(journeys.begin(), journeys.end(), key, by_stations);
+    if (it != journeys.end() && it->src == src && it->dest == dest) {
+        return &*it;
     }
-    int rejected_cohorts_threshold = 5; //Need to add to GLOBAL?
-    const int capacity = GLOBAL.COACH_SEAT_CAPACITY * GLOBAL.crowding_factor;
 
-    vector<int> rejected_up_cohorts(num_lines,0); //counter for rejected cohorts for each line. Might need to make it unordered map with trainline as key.
-    vector<int> rejected_down_cohorts(num_lines,0);
-
-    vector<train_coach> current_up_coaches; //current set of active coaches on each line
-    vector<train_coach> current_down_coaches;
-    for(int i=1; i<=num_lines;i++){
-        auto temp_stations=trains.GetTrainLineStations(i,true);
-        train_coach temp(coach_counter++, i,true,capacity, temp_stations);
-        current_up_coaches.push_back(temp);
-        temp_stations=trains.GetTrainLineStations(i,false);
-        train_coach temp1(coach_counter++, i,false,capacity,temp_stations);
-        current_down_coaches.push_back(temp1);
-    }
-    int back_index = random_cohort_ptr.size() -1;
-    while(!random_cohort_ptr.empty()){
-        // int random_index = uniform_count_type(0,random_cohort_ptr.size()-1); //confirm that uniform_count_type gives a value between o and size-1.
-        back_index = (back_index < 0) ?  0 : back_index;
-        auto current_cohort = random_cohort_ptr[back_index];// We will assume that this is an un-assigned cohort
-        int current_src, current_dest;
-        if (isAM) {
-            current_src = current_cohort->source_station;
-            current_dest = current_cohort->destination_station;
-        } else {
-            current_src = current_cohort->destination_station;
-            current_dest = current_cohort->source_station;
+    // First time this journey is seen: number the stations of its legs
+    journey new_journey{src, dest, legs.size(), legs.size()};
+    for (auto& leg: trains.GetJourneyLegs(src, dest)){
+        std::vector<int> stations;
+        auto isDown = trains.GetJourneyLegStationsAndIsDown(leg.trainLine, leg.src, leg.dest, stations);
+        const auto& line = line_stations[leg.trainLine-1];
+        journey_leg_stations leg_stations_range{leg.trainLine, isDown, leg_stations.size(), leg_stations.size()};
+        for (count_type count = 0; count + 1 < stations.size(); ++count){ // Exclude last station as they will deboard here.
+            leg_stations.push_back(std::find(line.begin(), line.end(), stations[count]) - line.begin());
         }
+        leg_stations_range.last = leg_stations.size();
+        legs.push_back(leg_stations_range);
+    }
+    new_journey.last_leg = legs.size();
+    return &*journeys.insert(it, new_journey);
+}
+
+train_coach train_coach_builder::take_coach(count_type id, int line, bool isDown, int capacity) {
+    train_coach coach;
+    if (!spare_coaches.empty()) {
+        coach = std::move(spare_coaches.back());
+        spare_coaches.pop_back();
+    }
+    coach.set(id, line, isDown, capacity, line_stations[line-1]);
+    return coach;
+}
+
+void train_coach_builder::clear(std::unordered_map<count_type, std::vector<train_coach>>& train_coaches) {
+    for (int line_count = 0; line_count<NUM_TRAIN_LINES;++line_count){
+        auto& coaches = train_coaches[line_count+1]; //train linenumber starts from 1
+        std::move(coaches.begin(), coaches.end(), std::back_inserter(spare_coaches));
+        coaches.clear();
+    }
+}
+
+void train_coach_builder::add_coaches(
+  std::unordered_map<count_type, std::vector<cohort_space>>& cohorts,
+  bool isAM, bool isOneOff,
+  std::unordered_map<count_type, std::vector<train_coach>>& train_coaches) {
+
+    if(!GLOBAL.ENABLE_COHORTS){
+        return;
+    }
+    reset_coach_assignment(cohorts, isOneOff, shuffled);
+    auto route_of = [&](const cohort_space* cohort){
+        return isAM ? find_journey(cohort->source_station, cohort->destination_station)
+                    : find_journey(cohort->destination_station, cohort->source_station);
+    };
+    // Number the stations of new journeys before keeping pointers to them
+    for (auto cohort: shuffled){
+        route_of(cohort);
+    }
+    unvisited.clear();
+    rejected.clear();
+    for (auto cohort: shuffled){
+        unvisited.push_back({cohort, route_of(cohort)});
+    }
+
+    for(int line_count = 0; line_count<NUM_TRAIN_LINES;++line_count){
+        train_coaches[line_count+1]; //train linenumber starts from 1
+    }
+    const int capacity = GLOBAL.COACH_SEAT_CAPACITY * GLOBAL.crowding_factor;
+    std::fill(rejected_up_cohorts.begin(), rejected_up_cohorts.end(), 0);
+    std::fill(rejected_down_cohorts.begin(), rejected_down_cohorts.end(), 0);
+
+    // Active coaches on each line. As before, the coach used by down journey
+    // legs has isDown false, and the one used by up legs has isDown true.
+    int coach_counter = 0;
+    for(int i=1; i<=NUM_TRAIN_LINES;i++){
+        up_coaches[i-1] = take_coach(coach_counter++, i, true, capacity);
+        down_coaches[i-1] = take_coach(coach_counter++, i, false, capacity);
+    }
+
+    // The cohorts are visited from the back of the shuffled list to the
+    // front, and the ones that do not fit are visited again, in the same
+    // order, after a coach is filled. The list is kept as the cohorts not yet
+    // visited followed by the rejected ones in reverse, so that assigned
+    // cohorts are removed without shifting the others. Once every cohort has
+    // been visited, the front cohort is tried again until it fits or a
+    // coach is filled.
+    while(!unvisited.empty() || !rejected.empty()){
+        const bool revisit = unvisited.empty();
+        const auto current = revisit ? rejected.back() : unvisited.back();
+        const int cohort_size = current.cohort->internal_nodes.size();
+
         bool cohort_assigned = true;
-        auto current_cohort_journey_legs =  trains.GetJourneyLegs(current_src, current_dest);
-        int cohort_size = current_cohort->internal_nodes.size();
-
-        for (auto& journey: current_cohort_journey_legs){
-            std::vector<int> stations;
-            auto current_trainline = journey.trainLine;
-            auto isDown = trains.GetJourneyLegStationsAndIsDown(current_trainline, journey.src, journey.dest,stations);
-            for (count_type count = 0; count < stations.size()-1; ++count){
-                auto station = stations[count];
-                if(isDown){
-                    if(current_down_coaches[current_trainline-1].capacity_at_station[station] <= cohort_size){
-                        cohort_assigned = false;
-                        rejected_down_cohorts[current_trainline-1]++;
-                        break;
-                    }
-                } else{
-                    if(current_up_coaches[current_trainline-1].capacity_at_station[station] <= cohort_size){
-                        cohort_assigned = false;
-                        rejected_up_cohorts[current_trainline-1]++;
-                        break;
+        for (auto l = current.route->first_leg; l < current.route->last_leg; ++l){
+            const auto& leg = legs[l];
+            auto& coach = leg.isDown ? down_coaches[leg.line-1] : up_coaches[leg.line-1];
+            for (auto s = leg.first; s < leg.last; ++s){
+                if(coach.capacity_at_station[leg_stations[s]] <= cohort_size){
+                    cohort_assigned = false;
+                    if(leg.isDown){
+                        rejected_down_cohorts[leg.line-1]++;
+                    } else{
+                        rejected_up_cohorts[leg.line-1]++;
                     }
+                    break;
                 }
             }
         }
 
         if(cohort_assigned){
-            for (auto& journey: current_cohort_journey_legs){
-                std::vector<int> stations;
-                auto current_trainline = journey.trainLine;
-                auto isDown = trains.GetJourneyLegStationsAndIsDown(current_trainline, journey.src, journey.dest,stations);
-                for (count_type count = 0; count < stations.size()-1; ++count){ // Exclude last station as they will deboard here.
-                    auto station = stations[count];
-                    if(isDown){
-                        current_down_coaches[current_trainline-1].capacity_at_station[station] -= cohort_size;
-                    } else{
-                        current_up_coaches[current_trainline-1].capacity_at_station[station] -= cohort_size;
-                    }
-                }
-                if(isDown){
-                    current_down_coaches[current_trainline-1].cohorts.push_back(current_cohort);
-                }else{
-                    current_up_coaches[current_trainline-1].cohorts.push_back(current_cohort);
+            for (auto l = current.route->first_leg; l < current.route->last_leg; ++l){
+                const auto& leg = legs[l];
+                auto& coach = leg.isDown ? down_coaches[leg.line-1] : up_coaches[leg.line-1];
+                for (auto s = leg.first; s < leg.last; ++s){
+                    coach.capacity_at_station[leg_stations[s]] -= cohort_size;
                 }
+                coach.cohorts.push_back(current.cohort);
+            }
+            if(revisit){
+                rejected.pop_back();
+            } else{
+                unvisited.pop_back();
             }
-            random_cohort_ptr.erase(random_cohort_ptr.begin()+back_index);
-            back_index--;
         }else{
-            back_index--;
-            for (int line_count = 0; line_count<num_lines;++line_count){
-                if(rejected_down_cohorts[line_count] > rejected_cohorts_threshold){
-                    train_coaches[line_count+1].push_back(current_down_coaches[line_count]);
-                    current_down_coaches[line_count].reset(coach_counter++, capacity);
+            if(!revisit){
+                unvisited.pop_back();
+                rejected.push_back(current);
+            }
+            bool coach_filled = false;
+            for (int line_count = 0; line_count<NUM_TRAIN_LINES;++line_count){
+                if(rejected_down_cohorts[line_count] > REJECTED_COHORTS_THRESHOLD){
+                    train_coaches[line_count+1].push_back(std::move(down_coaches[line_count]));
+                    down_coaches[line_count] = take_coach(coach_counter++, line_count+1, false, capacity);
                     rejected_down_cohorts[line_count] = 0;
-                    back_index = random_cohort_ptr.size() - 1;
+                    coach_filled = true;
                 }
-                if(rejected_up_cohorts[line_count] > rejected_cohorts_threshold){
-                    train_coaches[line_count+1].push_back(current_up_coaches[line_count]);
-                    current_up_coaches[line_count].reset(coach_counter++, capacity);
+                if(rejected_up_cohorts[line_count] > REJECTED_COHORTS_THRESHOLD){
+                    train_coaches[line_count+1].push_back(std::move(up_coaches[line_count]));
+                    up_coaches[line_count] = take_coach(coach_counter++, line_count+1, true, capacity);
                     rejected_up_cohorts[line_count] = 0;
-                    back_index = random_cohort_ptr.size() - 1;
+                    coach_filled = true;
                 }
             }
+            if(coach_filled){
+                // Visit the remaining cohorts again from the back
+                unvisited.insert(unvisited.end(), rejected.rbegin(), rejected.rend());
+                rejected.clear();
+            }
         }
     }
-    for (int line_count = 0; line_count<num_lines;++line_count){
-        train_coaches[line_count+1].push_back(current_down_coaches[line_count]);
-        train_coaches[line_count+1].push_back(current_up_coaches[line_count]);
+    for (int line_count = 0; line_count<NUM_TRAIN_LINES;++line_count){
+        train_coaches[line_count+1].push_back(std::move(down_coaches[line_count]));
+        train_coaches[line_count+1].push_back(std::move(up_coaches[line_count]));
     }
 #ifdef DEBUG
     get_coach_occupancy_per_line(train_coaches);
 #endif
-    return train_coaches;
 }
 
 // creation of inter_cohorts to use unordered_maps
@@ -564,50 +716,60 @@ void assign_inter_cohort(unordered_map<count_type, vector<train_coach>>& coachs,
 void update_kappas_cohorts(unordered_map<count_type, vector<cohort_space>>& cohorts , vector<agent>& nodes, int cur_time){
  //intervention modeling for cohorts.
     if(GLOBAL.ISOLATE_COHORTS && GLOBAL.TRAINS_RUNNING){
-        for (auto& it1: cohorts) { //cohort_hash (src*100) + dst
-            for (auto& cohort_it: it1.second) {
-                cohort_it.quarantined = false; //reset quarantine to false.
-                for (auto& j: cohort_it.internal_nodes){
-                    // double time_since_symptomatic = cur_time
-                    //     - (nodes[j].time_of_infection
-                    //         + nodes[j].incubation_period
-                    //         + nodes[j].asymptomatic_period);
-                    // double time_since_hospitalised = time_since_symptomatic -nodes[j].symptomatic_period;
-                    nodes[j].my_cohort.quarantined = false; //Reset qquarantined flag. Will be set in the below loop if the cohort needs to be quarantined.
-                    const bool symptomatic_severe_compliant = ((nodes[j].entered_symptomatic_state) &&
-                        (nodes[j].severity_index <= GLOBAL.COHORT_SEVERITY_FRACTION) &&
-                        nodes[j].compliant); //Node is symptomatic, has severe symptoms and is compliant
-                    const bool tested_positive = nodes[j].test_status.tested_positive; // node tested positive at some point.
-                    const bool hospitalised = nodes[j].entered_hospitalised_state; //node entered hospital state.
-
-                    double trigger_time = GLOBAL.NUM_TIMESTEPS; //time at which this individual triggers isolation. Starting with a large value.
-
-                    if(symptomatic_severe_compliant){
-                        trigger_time = min(trigger_time,(nodes[j].time_of_infection
-                            + nodes[j].incubation_period
-                            + nodes[j].asymptomatic_period));
-                    }
-                    if(tested_positive){
-                        trigger_time = min(trigger_time,(double)nodes[j].test_status.contact_traced_epoch);
-                    }
-                    if(hospitalised){
-                        trigger_time = min(trigger_time,((nodes[j].time_of_infection
-                            + nodes[j].incubation_period
-                            + nodes[j].asymptomatic_period
-                            + nodes[j].symptomatic_period)));
-                    }
+        const auto cohort_list = list_cohorts(cohorts);
+        const count_type NUM_COHORTS = cohort_list.size();
+        const double COHORT_SEVERITY_FRACTION = GLOBAL.COHORT_SEVERITY_FRACTION;
+        const double NUM_TIMESTEPS = GLOBAL.NUM_TIMESTEPS;
+        const double ISOLATION_TIMESTEPS = HOME_QUARANTINE_DAYS*GLOBAL.SIM_STEPS_PER_DAY;
+        //Every agent is in at most one cohort, so the cohorts are updated in
+        //parallel
+#pragma omp parallel for default(none) \
+  shared(cohort_list, nodes, cur_time, NUM_COHORTS, COHORT_SEVERITY_FRACTION, NUM_TIMESTEPS, ISOLATION_TIMESTEPS) \
+  schedule(dynamic, 64)
+        for (count_type c = 0; c < NUM_COHORTS; ++c) {
+            auto& cohort_it = *cohort_list[c];
+            cohort_it.quarantined = false; //reset quarantine to false.
+            for (auto& j: cohort_it.internal_nodes){
+                // double time_since_symptomatic = cur_time
+                //     - (nodes[j].time_of_infection
+                //         + nodes[j].details().incubation_period
+                //         + nodes[j].details().asymptomatic_period);
+                // double time_since_hospitalised = time_since_symptomatic -nodes[j].details().symptomatic_period;
+                nodes[j].my_cohort.quarantined = false; //Reset qquarantined flag. Will be set in the below loop if the cohort needs to be quarantined.
+                const bool symptomatic_severe_compliant = ((nodes[j].entered_symptomatic_state) &&
+                    (nodes[j].details().severity_index <= COHORT_SEVERITY_FRACTION) &&
+                    nodes[j].compliant); //Node is symptomatic, has severe symptoms and is compliant
+                const bool tested_positive = nodes[j].test_status.tested_positive; // node tested positive at some point.
+                const bool hospitalised = nodes[j].entered_hospitalised_state; //node entered hospital state.
+
+                double trigger_time = NUM_TIMESTEPS; //time at which this individual triggers isolation. Starting with a large value.
+
+                if(symptomatic_severe_compliant){
+                    trigger_time = min(trigger_time,(nodes[j].time_of_infection
+                        + nodes[j].details().incubation_period
+                        + nodes[j].details().asymptomatic_period));
+                }
+                if(tested_positive){
+                    trigger_time = min(trigger_time,(double)nodes[j].test_status.contact_traced_epoch);
+                }
+                if(hospitalised){
+                    trigger_time = min(trigger_time,((nodes[j].time_of_infection
+                        + nodes[j].details().incubation_period
+                        + nodes[j].details().asymptomatic_period
+                        + nodes[j].details().symptomatic_period)));
+                }
 
 
-                    if((symptomatic_severe_compliant || tested_positive || hospitalised) && (cur_time-trigger_time <= HOME_QUARANTINE_DAYS*GLOBAL.SIM_STEPS_PER_DAY)){
-                            cohort_it.quarantined = true;
-                            break;
-                    }
+                if((symptomatic_severe_compliant || tested_positive || hospitalised) && (cur_time-trigger_time <= ISOLATION_TIMESTEPS)){
+                        cohort_it.quarantined = true;
+                        break;
                 }
-                if(cohort_it.quarantined){
-                    for (auto& j: cohort_it.internal_nodes){
-                        nodes[j].my_cohort.quarantined = true;
-                        modify_kappa_case_isolate_node(nodes[j]); //TODO: Compliance per node on isolating themselves. Might need a separate cohort_compliance variable.
-                    }
+            }
+            if(cohort_it.quarantined){
+                for (auto& j: cohort_it.internal_nodes){
+                    nodes[j].my_cohort.quarantined = true;
+                    modify_kappa_case_isolate_node(nodes[j]); //TODO: Compliance per node on isolating themselves. Might need a separate cohort_compliance variable.
+                    mark_kappas_modified(nodes[j]);
                 }
             }
         }
@@ -24,6 +24,9 @@ void merge_coaches(std::unordered_map<count_type, std::vector<train_coach>>& to,
 
 void merge_cohorts(std::unordered_map<count_type, std::vector<cohort_space>>& to,
    const std::unordered_map<count_type, std::vector<cohort_space>>& from);
+// Moves the cohorts out of from
+void merge_cohorts(std::unordered_map<count_type, std::vector<cohort_space>>& to,
+   std::unordered_map<count_type, std::vector<cohort_space>>&& from);
 
 std::unordered_map<count_type, std::vector<cohort_space>> make_cohorts(
   std::vector<agent>& nodes,
@@ -39,6 +42,70 @@ std::unordered_map<count_type, std::vector<train_coach>> make_train_coaches(
   const TrainLoader& trains,
   bool isAM, bool isOneOff);
 
+//Assigns cohorts to train coaches as make_train_coaches does, with buffers
+//that are kept from one day to the next. The stations of each line are
+//numbered once, and the journey legs between each pair of stations are kept
+//as ranges of station numbers in a table sorted by (source, destination), so
+//that no hash map is built or looked up per coach. Coaches of the previous
+//build are recycled, so a day's coaches are built without allocating once
+//the buffers have grown.
+class train_coach_builder
+{
+public:
+  explicit train_coach_builder(const TrainLoader& trains);
+
+  //Recycles the coaches in train_coaches, leaving an empty list of coaches
+  //for each line
+  void clear(std::unordered_map<count_type, std::vector<train_coach>>& train_coaches);
+
+  //Assigns the cohorts that are one-off cohorts if isOneOff (and regular
+  //cohorts otherwise) to coaches, and appends the coaches of each line to
+  //train_coaches. Draws the same random numbers and gives the same coaches
+  //as make_train_coaches followed by merge_coaches.
+  void add_coaches(std::unordered_map<count_type, std::vector<cohort_space>>& cohorts,
+                   bool isAM, bool isOneOff,
+                   std::unordered_map<count_type, std::vector<train_coach>>& train_coaches);
+
+private:
+  //Stations travelled on one line, excluding the station where the cohort
+  //gets off, as positions in leg_stations
+  struct journey_leg_stations{
+    int line;
+    bool isDown;
+    count_type first;
+    count_type last;
+  };
+  //Journey legs of a (source, destination) pair, as positions in legs
+  struct journey{
+    int src;
+    int dest;
+    count_type first_leg;
+    count_type last_leg;
+  };
+  struct pending_cohort{
+    cohort_space* cohort;
+    const journey* route;
+  };
+
+  const journey* find_journey(int src, int dest);
+  train_coach take_coach(count_type id, int line, bool isDown, int capacity);
+
+  const TrainLoader& trains;
+  std::vector<std::vector<int>> line_stations; //stations of line l + 1
+  std::vector<journey> journeys; //sorted by (src, dest)
+  std::vector<journey_leg_stations> legs;
+  std::vector<count_type> leg_stations;
+
+  std::vector<cohort_space*> shuffled;
+  std::vector<pending_cohort> unvisited;
+  std::vector<pending_cohort> rejected;
+  std::vector<train_coach> up_coaches;
+  std::vector<train_coach> down_coaches;
+  std::vector<int> rejected_up_cohorts;
+  std::vector<int> rejected_down_cohorts;
+  std::vector<train_coach> spare_coaches;
+};
+
 void compute_scale_intra_cohorts(
   std::unordered_map<count_type, std::vector<cohort_space>>& cohorts,
   const std::vector<agent>& nodes);
@@ -54,6 +121,11 @@ void update_kappas_cohorts(
 
 int get_num_cohorts(const std::unordered_map<count_type, std::vector<cohort_space>>& cohorts);
 
+// Pointers to all the cohorts, in the order of the map, for the passes that
+// run in parallel over cohorts.
+std::vector<cohort_space*> list_cohorts(
+  std::unordered_map<count_type, std::vector<cohort_space>>& cohorts);
+
 std::vector<std::tuple<int, bool, int, double>> get_coach_occupancy_per_line(
   const std::unordered_map<count_type, std::vector<train_coach>>& coachs);
 
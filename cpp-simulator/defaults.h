@@ -58,6 +58,14 @@ struct defaults{
   std::string ENABLE_NBR_CELLS = "false";
   std::string ENABLE_NEIGHBORHOOD_SOFT_CONTAINMENT = "false";
   std::string WARD_CONTAINMENT_THRESHOLD  = "0";
+  std::string COMMUNITY_KERNEL_SPARSITY_THRESHOLD = "0";
+  std::string EVENT_DRIVEN_PROGRESSION = "false";
+  std::string INCREMENTAL_KAPPA_UPDATES = "false";
+  std::string INDEXED_CONTACT_TRACING = "false";
+  std::string RECORD_PHASE_TIMES = "false";
+  std::string STREAM_OUTPUTS = "false";
+  std::string output_series = "";
+  std::string SKIP_PLOT_SCRIPTS = "false";
   std::string intervention_params_filename = "intervention_params.json";
   std::string BETA_PROJECT = "0";
   std::string BETA_CLASS = "0";
@@ -77,7 +85,11 @@ struct defaults{
   std::string STORE_STATE_TIME_STEP = "0";
   std::string LOAD_STATE_TIME_STEP = "0";
   std::string ONE_OFF_TRAVELERS_RATIO = "0";
+  std::string train_cache_filename = "";
   std::string agent_load_file = "agentStore.pbstore";
+  std::string CHECKPOINT_TIME_STEP = "0";
+  std::string checkpoint_file = "checkpoint.bin";
+  std::string restore_checkpoint = "";
 } DEFAULTS;
 
 #endif
@@ -111,6 +111,9 @@ int main(int argc, char** argv){
      cxxopts::value<double>()->default_value(DEFAULTS.THIRD_PERIOD))
     ("OE_SECOND_PERIOD", "length in days of the second odd-even intervention period",
      cxxopts::value<double>()->default_value(DEFAULTS.OE_SECOND_PERIOD))
+    ("INCREMENTAL_KAPPA_UPDATES",
+	 "recompute the kappas of only those agents whose intervention inputs changed since the previous timestep",
+     cxxopts::value<bool>()->default_value(DEFAULTS.INCREMENTAL_KAPPA_UPDATES))
     ;
 
   options.add_options("Intervention - cylic strategy")
@@ -151,6 +154,18 @@ int main(int argc, char** argv){
      cxxopts::value<count_type>()->default_value(DEFAULTS.WARD_CONTAINMENT_THRESHOLD))
     ;
 
+  options.add_options("Community kernel")
+    ("COMMUNITY_KERNEL_SPARSITY_THRESHOLD",
+	 "drop ward-to-ward kernel entries below this fraction of their row sum (0 keeps the kernel dense)",
+     cxxopts::value<double>()->default_value(DEFAULTS.COMMUNITY_KERNEL_SPARSITY_THRESHOLD))
+    ;
+
+  options.add_options("Disease progression")
+    ("EVENT_DRIVEN_PROGRESSION",
+	 "update only agents with a scheduled transition, infective agents and susceptible agents with nonzero lambda",
+     cxxopts::value<bool>()->default_value(DEFAULTS.EVENT_DRIVEN_PROGRESSION))
+    ;
+
   options.add_options("Age-dependent mixing")
     ("USE_AGE_DEPENDENT_MIXING", "whether age-stratified interactions are enabled",
      cxxopts::value<bool>()->default_value(DEFAULTS.USE_AGE_DEPENDENT_MIXING))
@@ -174,6 +189,15 @@ int main(int argc, char** argv){
      cxxopts::value<double>()->default_value(DEFAULTS.MASK_FACTOR))
     ("MASK_START_DELAY", "days after which masks are enforced",
      cxxopts::value<double>()->default_value(DEFAULTS.MASK_START_DELAY))
+    ("RECORD_PHASE_TIMES", "write the wall time of each phase of every timestep to phase_times.csv",
+     cxxopts::value<bool>()->default_value(DEFAULTS.RECORD_PHASE_TIMES))
+    ("STREAM_OUTPUTS", "append rows to the output CSV files as each timestep completes, instead of at the end of the run",
+     cxxopts::value<bool>()->default_value(DEFAULTS.STREAM_OUTPUTS))
+    ("output_series",
+	 "comma-separated names of the output series to write, a trailing * matching any suffix (default: all)",
+     cxxopts::value<std::string>()->default_value(DEFAULTS.output_series))
+    ("SKIP_PLOT_SCRIPTS", "do not write the gnuplot script and plots.html",
+     cxxopts::value<bool>()->default_value(DEFAULTS.SKIP_PLOT_SCRIPTS))
     ;
 
   options.add_options("Testing and contact tracing")
@@ -183,6 +207,9 @@ int main(int argc, char** argv){
     cxxopts::value<std::string>()->default_value(DEFAULTS.testing_protocol_filename))
     ("TESTING_PROTOCOL", "index of testing protocol",
      cxxopts::value<count_type>()->default_value(DEFAULTS.TESTING_PROTOCOL))
+    ("INDEXED_CONTACT_TRACING",
+     "trace neighbourhood cells by visiting only the residents of cells with index cases (draws random numbers differently from the default)",
+     cxxopts::value<bool>()->default_value(DEFAULTS.INDEXED_CONTACT_TRACING))
     ;
 
   options.add_options("Cohorts")
@@ -202,6 +229,8 @@ int main(int argc, char** argv){
      cxxopts::value<count_type>()->default_value(DEFAULTS.COHORT_STRATEGY))
     ("ONE_OFF_TRAVELERS_RATIO", "ratio of one-off travelers",
      cxxopts::value<double>()->default_value(DEFAULTS.ONE_OFF_TRAVELERS_RATIO))
+    ("train_cache_filename", "file to cache the train journey and overlap tables in, relative to input_directory (empty disables the cache)",
+     cxxopts::value<std::string>()->default_value(DEFAULTS.train_cache_filename))
     ;
 
   options.add_options("Store_load_state")
@@ -213,6 +242,16 @@ int main(int argc, char** argv){
     cxxopts::value<std::string>()->default_value(DEFAULTS.agent_load_file))
   ;
 
+  options.add_options("Checkpoint")
+    ("CHECKPOINT_TIME_STEP",
+	 "timestep at the start of which the full simulator state is written to checkpoint_file (0 disables)",
+     cxxopts::value<count_type>()->default_value(DEFAULTS.CHECKPOINT_TIME_STEP))
+    ("checkpoint_file", "checkpoint file name, relative to output_directory",
+     cxxopts::value<std::string>()->default_value(DEFAULTS.checkpoint_file))
+    ("restore_checkpoint", "path of a checkpoint to resume the simulation from",
+     cxxopts::value<std::string>()->default_value(DEFAULTS.restore_checkpoint))
+    ;
+
   auto optvals = options.parse(argc, argv);
 
   if(optvals.count("help")){
@@ -224,8 +263,10 @@ int main(int argc, char** argv){
 			       "Intervention - cyclic strategy",
 			       "Intervention - soft containment zones",
 			       "Intervention - neighbourhood containment",
+			       "Community kernel",
 			       "Age-dependent mixing",
 			       "Other",
+			       "Checkpoint",
              "Testing and contact tracing"
       }) << std::endl;
     return 0;
@@ -348,6 +389,14 @@ int main(int argc, char** argv){
 	GLOBAL.ENABLE_NEIGHBORHOOD_SOFT_CONTAINMENT = false;
   }
   GLOBAL.WARD_CONTAINMENT_THRESHOLD = optvals["WARD_CONTAINMENT_THRESHOLD"].as<count_type>();
+  GLOBAL.COMMUNITY_KERNEL_SPARSITY_THRESHOLD = optvals["COMMUNITY_KERNEL_SPARSITY_THRESHOLD"].as<double>();
+  GLOBAL.EVENT_DRIVEN_PROGRESSION = optvals["EVENT_DRIVEN_PROGRESSION"].count();
+  GLOBAL.INCREMENTAL_KAPPA_UPDATES = optvals["INCREMENTAL_KAPPA_UPDATES"].count();
+  GLOBAL.INDEXED_CONTACT_TRACING = optvals["INDEXED_CONTACT_TRACING"].count();
+  GLOBAL.RECORD_PHASE_TIMES = optvals["RECORD_PHASE_TIMES"].count();
+  GLOBAL.STREAM_OUTPUTS = optvals["STREAM_OUTPUTS"].count();
+  GLOBAL.output_series = split_output_series(optvals["output_series"].as<std::string>());
+  GLOBAL.SKIP_PLOT_SCRIPTS = optvals["SKIP_PLOT_SCRIPTS"].count();
 
   GLOBAL.ENABLE_TESTING = optvals["ENABLE_TESTING"].count();
   GLOBAL.ENABLE_NBR_CELLS = GLOBAL.ENABLE_NBR_CELLS || GLOBAL.ENABLE_CONTAINMENT;
@@ -375,12 +424,22 @@ int main(int argc, char** argv){
  GLOBAL.COHORT_SEVERITY_FRACTION = optvals["COHORT_SEVERITY_FRACTION"].as<double>();
  GLOBAL.COHORT_STRATEGY = static_cast<cohort_strategy>(optvals["COHORT_STRATEGY"].as<count_type>());
  GLOBAL.ONE_OFF_TRAVELERS_RATIO = optvals["ONE_OFF_TRAVELERS_RATIO"].as<double>();
+ GLOBAL.train_cache_filename = optvals["train_cache_filename"].as<std::string>();
  
 //  std::cout<<"GLOBAL.ENABLE_COHORTS" << GLOBAL.ENABLE_COHORTS << std::endl;
 
 // store or load state.
  GLOBAL.STORE_STATE_TIME_STEP = optvals["STORE_STATE_TIME_STEP"].as<count_type>();
  GLOBAL.LOAD_STATE_TIME_STEP = optvals["LOAD_STATE_TIME_STEP"].as<count_type>();
+ GLOBAL.CHECKPOINT_TIME_STEP = optvals["CHECKPOINT_TIME_STEP"].as<count_type>();
+ GLOBAL.checkpoint_file = optvals["checkpoint_file"].as<std::string>();
+ GLOBAL.restore_checkpoint = optvals["restore_checkpoint"].as<std::string>();
+ //A streaming run does not keep the output series so far in memory, so its
+ //checkpoints could not hold the rows before the checkpoint
+ if(GLOBAL.CHECKPOINT_TIME_STEP > 0 && GLOBAL.STREAM_OUTPUTS){
+   std::cout << "ERROR: CHECKPOINT_TIME_STEP cannot be combined with STREAM_OUTPUTS" << std::endl;
+   return 1;
+ }
 
   //Initialize the attendance probability
   initialize_office_attendance();
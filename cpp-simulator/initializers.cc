@@ -10,6 +10,7 @@
 #include <vector>
 #include <random>
 #include <string>
+#include <unordered_map>
 #include <cmath>
 #include <set>
 
@@ -144,28 +145,35 @@ vector<community> init_community() {
   return communities;
 }
 
-matrix<nbr_cell> init_nbr_cells() {
+nbr_cell_grid init_nbr_cells(vector<house>& homes) {
 
-  matrix<nbr_cell> nbr_cells;
+  nbr_cell_grid nbr_cells;
 
   if(GLOBAL.ENABLE_NBR_CELLS){
-	location loc_temp;
-
-	loc_temp.lat = GLOBAL.city_SW.lat;
-	loc_temp.lon = GLOBAL.city_NE.lon;
-	count_type num_x_grids = ceil(earth_distance(GLOBAL.city_SW,loc_temp)/GLOBAL.NBR_CELL_SIZE);
-	nbr_cells.resize(num_x_grids);
-
-	loc_temp.lon = GLOBAL.city_SW.lon;
-	loc_temp.lat = GLOBAL.city_NE.lat;
-	count_type num_y_grids = ceil(earth_distance(GLOBAL.city_SW,loc_temp)/GLOBAL.NBR_CELL_SIZE);
+	//Only the cells that contain a home are stored, in row-major order of
+	//their grid positions, with the homes of each cell in increasing order.
+	//positions maps a grid position to its cell while the homes are assigned.
+	std::unordered_map<std::uint64_t, count_type> positions;
+	for(const auto& home: homes){
+	  positions.emplace(nbr_cell_grid::key(home.neighbourhood), 0);
+	}
+	vector<std::uint64_t> keys;
+	keys.reserve(positions.size());
+	for(const auto& elem: positions){
+	  keys.push_back(elem.first);
+	}
+	std::sort(keys.begin(), keys.end());
 
-	for(count_type count_x_grid = 0; count_x_grid < num_x_grids; ++count_x_grid){
-		nbr_cells[count_x_grid].resize(num_y_grids);
-		for(count_type count_y_grid = 0; count_y_grid < num_y_grids; ++count_y_grid){
-			nbr_cells[count_x_grid][count_y_grid].neighbourhood.cell_x = count_x_grid;
-			nbr_cells[count_x_grid][count_y_grid].neighbourhood.cell_y = count_y_grid;
-		}
+	nbr_cells.cells.resize(keys.size());
+	for(count_type c = 0; c < keys.size(); ++c){
+	  positions[keys[c]] = c;
+	  nbr_cells.cells[c].neighbourhood.cell_x = keys[c] >> 32;
+	  nbr_cells.cells[c].neighbourhood.cell_y = keys[c] & 0xffffffffu;
+	}
+	for(count_type home_count = 0; home_count < homes.size(); ++home_count){
+	  homes[home_count].nbr_cell_index
+		= positions[nbr_cell_grid::key(homes[home_count].neighbourhood)];
+	  nbr_cells.of(homes[home_count]).houses_list.push_back(home_count);
 	}
   }
   return nbr_cells;
@@ -346,6 +354,19 @@ vector<intervention_params> init_intervention_params(){
   return intv_params;
 }
 
+intervention_schedule compile_intervention_schedule(vector<intervention_params> periods){
+  intervention_schedule schedule;
+  schedule.periods = std::move(periods);
+  schedule.compliance_period = schedule.periods.size();
+  //Days past the end of the second last period are in the last period, and
+  //need no entry
+  for(count_type index = 0; index + 1 < schedule.periods.size(); ++index){
+	schedule.period_of_day.insert(schedule.period_of_day.end(),
+								  schedule.periods[index].num_days, index);
+  }
+  return schedule;
+}
+
 void print_testing_protocol(const int index, const testing_probability probabilities){
   std::cout<<std::endl<<"Index : "<<index<<". num_days = "<<probabilities.num_days;
   std::cout<<".  prob_test_index_symptomatic:  "<<probabilities.prob_test_index_symptomatic;
@@ -662,7 +683,7 @@ void set_node_initial_infection(agent& node,
 		 && bernoulli(community_infection_probability)){
 		// Always seed non-high-density-ares residents
 		// High-density-area residents seeded based on global flag.
-		seed_initial_infection_at_node(node, -uniform_real(0, node.incubation_period));
+		seed_initial_infection_at_node(node, -uniform_real(0, node.details().incubation_period));
 	  }
 	}
   }
@@ -676,6 +697,7 @@ vector<agent> init_nodes(){
   auto size = indivJSON.GetArray().Size();
   GLOBAL.num_people = size;
   vector<agent> nodes(size);
+  init_agent_details(nodes);
   auto community_infection_prob = compute_prob_infection_given_community(GLOBAL.INIT_FRAC_INFECTED, GLOBAL.USE_SAME_INFECTION_PROB_FOR_ALL_WARDS);
 
   count_type i = 0;
@@ -684,34 +706,34 @@ vector<agent> init_nodes(){
   seed_candidates.reserve(size);
 
   for (auto &elem: indivJSON.GetArray()){
- 	nodes[i].loc = location{elem["lat"].GetDouble(),
+ 	nodes[i].details().loc = location{elem["lat"].GetDouble(),
 							elem["lon"].GetDouble()};
 
 #ifdef DEBUG
 	assert(elem["age"].IsInt());
 #endif
 	int age = elem["age"].GetInt();
-	nodes[i].age = age;
+	nodes[i].details().age = age;
 	nodes[i].age_group = get_age_group(age);
 	nodes[i].age_index = get_age_index(age);
 	nodes[i].zeta_a = zeta(age);
 
 	nodes[i].infectiousness = gamma(GLOBAL.INFECTIOUSNESS_SHAPE,
 									GLOBAL.INFECTIOUSNESS_SCALE);
-	nodes[i].severity_index = uniform_real(0,1);
-	nodes[i].severity = (nodes[i].severity_index<=GLOBAL.SEVERITY_RATE)?1:0;
+	nodes[i].details().severity_index = uniform_real(0,1);
+	nodes[i].severity = (nodes[i].details().severity_index<=GLOBAL.SEVERITY_RATE)?1:0;
 
 #ifdef DEBUG
 	assert(elem["household"].IsInt());
 #endif
 	nodes[i].home = elem["household"].GetInt();
-	nodes[i].home_ward = elem["wardIndex"].GetInt();
+	nodes[i].details().home_ward = elem["wardIndex"].GetInt();
 	nodes[i].workplace = WORKPLACE_HOME; //null workplace, by default
 	nodes[i].workplace_type = WorkplaceType::home; //home, by default
 	nodes[i].workplace_subnetwork = 0;
 
 	if(elem["workplaceType"].IsInt()){
-	  //nodes[i].work_ward = elem["workplaceward"].GetInt();
+	  //nodes[i].details().work_ward = elem["workplaceward"].GetInt();
 	  switch(elem["workplaceType"].GetInt()){
 	  case 1:
 		if(elem["workplace"].IsNumber()){
@@ -735,7 +757,7 @@ vector<agent> init_nodes(){
 	  }
 	}
 	else{
-		nodes[i].work_ward = -1;
+		nodes[i].details().work_ward = -1;
 	}
 
 	//Initialize cohorts - other definitions are in cohorts.cc
@@ -777,15 +799,15 @@ vector<agent> init_nodes(){
 	nodes[i].community = community;
 	nodes[i].funct_d_ck = f_kernel(elem["CommunityCentreDistance"].GetDouble());
 
-	nodes[i].incubation_period = gamma(GLOBAL.INCUBATION_PERIOD_SHAPE,
+	nodes[i].details().incubation_period = gamma(GLOBAL.INCUBATION_PERIOD_SHAPE,
 									   GLOBAL.INCUBATION_PERIOD_SCALE);
-	nodes[i].asymptomatic_period = gamma(1.0,
+	nodes[i].details().asymptomatic_period = gamma(1.0,
 										 GLOBAL.ASYMPTOMATIC_PERIOD);
-	nodes[i].symptomatic_period = gamma(1.0,
+	nodes[i].details().symptomatic_period = gamma(1.0,
 										GLOBAL.SYMPTOMATIC_PERIOD);
 
-	nodes[i].hospital_regular_period = GLOBAL.HOSPITAL_REGULAR_PERIOD;
-	nodes[i].hospital_critical_period = GLOBAL.HOSPITAL_CRITICAL_PERIOD;
+	nodes[i].details().hospital_regular_period = GLOBAL.HOSPITAL_REGULAR_PERIOD;
+	nodes[i].details().hospital_critical_period = GLOBAL.HOSPITAL_CRITICAL_PERIOD;
 
 	//Now procees node to check if it could be an initial seed given
 	//all its other data
@@ -813,7 +835,7 @@ vector<agent> init_nodes(){
 	count_type num = std::min(candidate_list_size, GLOBAL.INIT_FIXED_NUMBER_INFECTED);
 	for(count_type j = 0; j < num; ++j){
 	  seed_initial_infection_at_node(nodes[seed_candidates[j]],
-									 -uniform_real(0, nodes[seed_candidates[j]].incubation_period));
+									 -uniform_real(0, nodes[seed_candidates[j]].details().incubation_period));
 	}
   }
   return nodes;
@@ -881,6 +903,62 @@ svd init_community_age_interaction_matrix(){
   return svd;
 }
 
+age_mixing_factors init_age_mixing_factors(const svd& age_matrix){
+  age_mixing_factors factors;
+  const count_type num_age_groups = GLOBAL.NUM_AGE_GROUPS;
+  count_type rank = std::min(age_matrix.sigma.size(), age_matrix.vT.size());
+  if(!age_matrix.u.empty()){
+	rank = std::min(rank, age_matrix.u[0].size());
+  }
+  factors.rank = std::min(rank, count_type(std::ceil(GLOBAL.SIGNIFICANT_EIGEN_VALUES)));
+  factors.size = std::min(age_matrix.u.size(), num_age_groups);
+
+  factors.u_sigma.assign(num_age_groups * factors.rank, 0.0);
+  for(count_type g = 0; g < std::min(age_matrix.u.size(), num_age_groups); ++g){
+	for(count_type k = 0; k < factors.rank; ++k){
+	  factors.u_sigma[g * factors.rank + k] = age_matrix.u[g][k] * age_matrix.sigma[k];
+	}
+  }
+  factors.vT.assign(factors.rank * factors.size, 0.0);
+  for(count_type k = 0; k < factors.rank; ++k){
+	for(count_type a = 0; a < factors.size; ++a){
+	  factors.vT[k * factors.size + a] = age_matrix.vT[k][a];
+	}
+  }
+  return factors;
+}
+
+namespace {
+  void size_age_mixing_batch(age_mixing_batch& batch, const svd& age_matrix){
+	batch.factors = init_age_mixing_factors(age_matrix);
+	batch.age_component.assign(batch.locations.size() * GLOBAL.NUM_AGE_GROUPS, 0.0);
+	batch.projected.assign(batch.locations.size() * batch.factors.rank, 0.0);
+  }
+}
+
+location_age_mixing init_location_age_mixing(const vector<house>& homes,
+											 const vector<workplace>& workplaces,
+											 const svd& home_age_matrix,
+											 const svd& school_age_matrix,
+											 const svd& workplace_age_matrix){
+  location_age_mixing age_mixing;
+  for(count_type h = 0; h < homes.size(); ++h){
+	age_mixing.homes.locations.push_back(h);
+  }
+  for(count_type w = 0; w < workplaces.size(); ++w){
+	if(workplaces[w].workplace_type == WorkplaceType::school){
+	  age_mixing.schools.locations.push_back(w);
+	}
+	else{
+	  age_mixing.workplaces.locations.push_back(w);
+	}
+  }
+  size_age_mixing_batch(age_mixing.homes, home_age_matrix);
+  size_age_mixing_batch(age_mixing.schools, school_age_matrix);
+  size_age_mixing_batch(age_mixing.workplaces, workplace_age_matrix);
+  return age_mixing;
+}
+
 matrix<double> compute_community_distances(const vector<community>& communities){
   auto wardDistJSON = readJSONFile(GLOBAL.input_base + "wardCentreDistance.json");
   const rapidjson::Value& mat = wardDistJSON.GetArray();
@@ -910,11 +988,51 @@ matrix<double> compute_community_distances_fkernel(const matrix<double>& communi
   return fk_matrix;
 }
 
+community_kernel compute_community_kernel(const matrix<double>& community_fk_matrix){
+  community_kernel kernel;
+  const auto size = community_fk_matrix.size();
+  kernel.size = size;
+  kernel.weights.resize(size * size);
+  kernel.row_sum.resize(size);
+  for(count_type c1 = 0; c1 < size; ++c1){
+	double row_sum = 0;
+	for(count_type c2 = 0; c2 < size; ++c2){
+	  kernel.weights[c1 * size + c2] = community_fk_matrix[c1][c2];
+	  row_sum += community_fk_matrix[c1][c2];
+	}
+	kernel.row_sum[c1] = row_sum;
+  }
+
+  if(GLOBAL.COMMUNITY_KERNEL_SPARSITY_THRESHOLD > 0){
+	kernel.sparse = true;
+	kernel.row_offsets.reserve(size + 1);
+	kernel.row_offsets.push_back(0);
+	for(count_type c1 = 0; c1 < size; ++c1){
+	  const double cutoff = GLOBAL.COMMUNITY_KERNEL_SPARSITY_THRESHOLD * kernel.row_sum[c1];
+	  double row_sum = 0;
+	  for(count_type c2 = 0; c2 < size; ++c2){
+		const double fk_val = kernel.weights[c1 * size + c2];
+		if(fk_val >= cutoff && fk_val > 0){
+		  kernel.columns.push_back(c2);
+		  kernel.values.push_back(fk_val);
+		  row_sum += fk_val;
+		}
+	  }
+	  kernel.row_sum[c1] = row_sum;
+	  kernel.row_offsets.push_back(kernel.columns.size());
+	}
+	std::cout<<std::endl<<"Community kernel: kept "<<kernel.values.size()
+			 <<" of "<<size * size<<" entries";
+	//The dense copy is not needed any more
+	vector<double>().swap(kernel.weights);
+  }
+  return kernel;
+}
+
 void assign_individual_home_community(vector<agent>& nodes, vector<house>& homes, vector<workplace>& workplaces, vector<community>& communities){
   //Assign individuals to homes, workplace, community
   for(count_type i = 0; i < nodes.size(); ++i){
 	int home = nodes[i].home;
-	homes[home].individuals.push_back(i);
 	 //No checking for null as all individuals have a home
 	nodes[i].compliant = homes[home].compliant;
 	//All members of the household are set the same compliance value
@@ -923,17 +1041,17 @@ void assign_individual_home_community(vector<agent>& nodes, vector<house>& homes
 	if(GLOBAL.CYCLIC_POLICY_ENABLED){
 	  switch(GLOBAL.CYCLIC_POLICY_TYPE){
 	  case Cycle_Type::home:
-		nodes[i].cyclic_strategy_class = homes[home].cyclic_strategy_class;
+		nodes[i].details().cyclic_strategy_class = homes[home].cyclic_strategy_class;
 		break;
 	  case Cycle_Type::individual:
-		nodes[i].cyclic_strategy_class = uniform_count_type(0, GLOBAL.NUMBER_OF_CYCLIC_CLASSES - 1);
+		nodes[i].details().cyclic_strategy_class = uniform_count_type(0, GLOBAL.NUMBER_OF_CYCLIC_CLASSES - 1);
 		break;
 	  default:
 		assert(false);
 		break;
 	  }
-	  assert(0 <= nodes[i].cyclic_strategy_class &&
-			 nodes[i].cyclic_strategy_class < GLOBAL.NUMBER_OF_CYCLIC_CLASSES);
+	  assert(0 <= nodes[i].details().cyclic_strategy_class &&
+			 nodes[i].details().cyclic_strategy_class < GLOBAL.NUMBER_OF_CYCLIC_CLASSES);
 	}
 
 	int workplace = nodes[i].workplace;
@@ -941,16 +1059,32 @@ void assign_individual_home_community(vector<agent>& nodes, vector<house>& homes
       nodes[i].office_type = workplaces[workplace].office_type;
     }
 	if(workplace != WORKPLACE_HOME){
-	  workplaces[workplace].individuals.push_back(i);
-
 	  //Since the individual is not home_bound, compute their
 	  //commute_distance
-	  nodes[i].commute_distance
+	  nodes[i].details().commute_distance
 		= earth_distance(workplaces[workplace].loc,
 						 homes[home].loc);
 	}
-	//No checking for null as all individuals have a community/ward
-	communities[nodes[i].community].individuals.push_back(i);
+  }
+
+  //Membership lists are stored contiguously, one index per location type.
+  //Members are listed in increasing order of agent index, the order in
+  //which they were previously appended.
+  MEMBERSHIP.homes.build(homes.size(), nodes.size(),
+						 [&](count_type i){ return nodes[i].home; });
+  MEMBERSHIP.workplaces.build(workplaces.size(), nodes.size(),
+							  [&](count_type i){ return nodes[i].workplace; });
+  //No checking for null as all individuals have a community/ward
+  MEMBERSHIP.communities.build(communities.size(), nodes.size(),
+							   [&](count_type i){ return nodes[i].community; });
+  for(count_type h = 0; h < homes.size(); ++h){
+	homes[h].individuals = MEMBERSHIP.homes.of(h);
+  }
+  for(count_type w = 0; w < workplaces.size(); ++w){
+	workplaces[w].individuals = MEMBERSHIP.workplaces.of(w);
+  }
+  for(count_type c = 0; c < communities.size(); ++c){
+	communities[c].individuals = MEMBERSHIP.communities.of(c);
   }
 }
 
@@ -1040,18 +1174,28 @@ void assign_household_random_community(vector<house>& homes, const vector<commun
 }
 
 
-void assign_homes_nbr_cell(const vector<house>& homes, matrix<nbr_cell>& neighbourhood_cells){
+void assign_homes_nbr_cell(const vector<house>& homes, nbr_cell_grid& neighbourhood_cells){
 	if(!GLOBAL.ENABLE_NBR_CELLS){
 		return;
 	}
 	for (count_type home_count = 0; home_count < homes.size(); ++home_count){
-		grid_cell my_nbr_cell = homes[home_count].neighbourhood;
-		neighbourhood_cells[my_nbr_cell.cell_x][my_nbr_cell.cell_y].houses_list.push_back(home_count);
-		neighbourhood_cells[my_nbr_cell.cell_x][my_nbr_cell.cell_y].population
+		neighbourhood_cells.of(homes[home_count]).population
 		  += homes[home_count].individuals.size();
 	}
 }
 
+//Residents of each neighbourhood cell, for contact tracing that only visits
+//the cells with index cases
+void index_nbr_cell_residents(const vector<agent>& nodes, const vector<house>& homes, const nbr_cell_grid& neighbourhood_cells){
+	if(!GLOBAL.ENABLE_NBR_CELLS || neighbourhood_cells.empty()){
+		return;
+	}
+	MEMBERSHIP.nbr_cells.build(neighbourhood_cells.size(), nodes.size(),
+							   [&](count_type i){
+								 return int(homes[nodes[i].home].nbr_cell_index);
+							   });
+}
+
 // Compute scale factors for each home, workplace and community. Done once at the beginning.
 void compute_scale_homes(vector<house>& homes){
   for (count_type w = 0; w < homes.size(); ++w){
@@ -1129,19 +1273,17 @@ void compute_scale_random_community(vector<house>& houses, vector<agent>& nodes)
   }
 }
 
-void compute_scale_nbr_cells(vector<agent>& nodes, vector<vector<nbr_cell>>& nbr_cells, const vector<house>& homes){
-  for(count_type i=0; i<nbr_cells.size(); ++i){
-	for(count_type j=0; j<nbr_cells[i].size(); ++j){
-		double sum_values = 0;
-		for(count_type h=0; h<nbr_cells[i][j].houses_list.size(); ++h){
-		  sum_values += homes[nbr_cells[i][j].houses_list[h]].individuals.size();
-		}
-		if(sum_values>0){
-			nbr_cells[i][j].scale = GLOBAL.BETA_NBR_CELLS/sum_values;
-		}
-		else{
-			nbr_cells[i][j].scale = 0;
-		}
+void compute_scale_nbr_cells(vector<agent>& nodes, nbr_cell_grid& nbr_cells, const vector<house>& homes){
+  for(auto& cell: nbr_cells){
+	double sum_values = 0;
+	for(count_type h=0; h<cell.houses_list.size(); ++h){
+	  sum_values += homes[cell.houses_list[h]].individuals.size();
+	}
+	if(sum_values>0){
+		cell.scale = GLOBAL.BETA_NBR_CELLS/sum_values;
+	}
+	else{
+		cell.scale = 0;
 	}
   }
 }
@@ -1153,50 +1295,29 @@ void initialize_office_attendance(){
   //it
   if(GLOBAL.IGNORE_ATTENDANCE_FILE) return;
 
-  //constexpr count_type NUMBER_OF_OFFICE_TYPES = 6;
+  //Each entry gives the attendance of every office type for a run of days:
+  //num_days days in the new file type, which starts when the interventions
+  //start, or repeat days (default 1) in the old one, which starts on day 0
   auto attendanceJSON = readJSONFile(GLOBAL.input_base + GLOBAL.attendance_filename);
-  ATTENDANCE.number_of_entries = attendanceJSON.GetArray().Size(); //will change for new file type
-  ATTENDANCE.probabilities.reserve(ATTENDANCE.number_of_entries); //will change for new file type
+  const auto NUMBER_OF_OFFICE_TYPES = GLOBAL.NUMBER_OF_OFFICE_TYPES;
+  vector<double> row(NUMBER_OF_OFFICE_TYPES);
   count_type index = 0;
   for(auto& elem: attendanceJSON.GetArray()){
 	count_type num_days = 1;
 	if(elem.HasMember("num_days")){
 		num_days = elem["num_days"].GetInt();
 		ATTENDANCE.attendance_new_file_type = true;
+	} else if(elem.HasMember("repeat")){
+		num_days = elem["repeat"].GetInt();
 	}
-	
-	for (count_type day = 0; day < num_days; ++day){
 
-		ATTENDANCE.probabilities.push_back(vector<double>(GLOBAL.NUMBER_OF_OFFICE_TYPES));
-		count_type val;
-		std::string val_s;
-
-		val = static_cast<count_type>(OfficeType::other);
-		val_s = std::to_string(val);
-		ATTENDANCE.probabilities[index].at(val) = elem[val_s.c_str()].GetDouble();
-		
-		val = static_cast<count_type>(OfficeType::sez);
-		val_s = std::to_string(val);
-		ATTENDANCE.probabilities[index].at(val) = elem[val_s.c_str()].GetDouble();
-		
-		val = static_cast<count_type>(OfficeType::government);
-		val_s = std::to_string(val);
-		ATTENDANCE.probabilities[index].at(val) = elem[val_s.c_str()].GetDouble();
-		
-		val = static_cast<count_type>(OfficeType::it);
-		val_s = std::to_string(val);
-		ATTENDANCE.probabilities[index].at(val) = elem[val_s.c_str()].GetDouble();
-		
-		val = static_cast<count_type>(OfficeType::construction);
-		val_s = std::to_string(val);
-		ATTENDANCE.probabilities[index].at(val) = elem[val_s.c_str()].GetDouble();
-		
-		val = static_cast<count_type>(OfficeType::hospital);
-		val_s = std::to_string(val);
-		ATTENDANCE.probabilities[index].at(val) = elem[val_s.c_str()].GetDouble();
-		
-		++index;
+	for(count_type office_type = 0; office_type < NUMBER_OF_OFFICE_TYPES; ++office_type){
+	  row[office_type] = elem[std::to_string(office_type).c_str()].GetDouble();
+	}
+	for (count_type day = 0; day < num_days; ++day){
+	  ATTENDANCE.probabilities.insert(ATTENDANCE.probabilities.end(), row.begin(), row.end());
 	}
+	index += num_days;
   }
   ATTENDANCE.number_of_entries = index;
   //assert(index == ATTENDANCE.number_of_entries);
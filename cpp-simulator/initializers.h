@@ -15,16 +15,21 @@ std::vector<house> init_homes();
 std::vector<workplace> init_workplaces();
 std::vector<community> init_community();
 std::vector<agent> init_nodes();
-matrix<nbr_cell> init_nbr_cells();
+//Builds the neighbourhood cells that contain a home, and sets the
+//nbr_cell_index of every home
+nbr_cell_grid init_nbr_cells(std::vector<house>& homes);
 std::vector<intervention_params> init_intervention_params();
+intervention_schedule compile_intervention_schedule(std::vector<intervention_params> periods);
 std::vector<testing_probability> init_testing_protocol();
 
 matrix<double> compute_community_distances(const std::vector<community>& communities);
 matrix<double> compute_community_distances_fkernel(const matrix<double>& community_distances);
+community_kernel compute_community_kernel(const matrix<double>& community_fk_matrix);
 
 //Assign individuals to homes, workplace, community
 void assign_individual_home_community(std::vector<agent>& nodes, std::vector<house>& homes, std::vector<workplace>& workplaces, std::vector<community>& communities);
-void assign_homes_nbr_cell(const std::vector<house>& homes, matrix<nbr_cell>& nbr_cells);
+void assign_homes_nbr_cell(const std::vector<house>& homes, nbr_cell_grid& nbr_cells);
+void index_nbr_cell_residents(const std::vector<agent>& nodes, const std::vector<house>& homes, const nbr_cell_grid& nbr_cells);
 void assign_individual_projects(std::vector<workplace>& workplaces, std::vector<agent>& nodes);
 void assign_household_community(std::vector<community>& communities, const std::vector<agent>& nodes, std::vector<house>& homes);
 void assign_household_random_community(std::vector<house>& homes, const std::vector<community>& communities);
@@ -35,7 +40,7 @@ void compute_scale_homes(std::vector<house>& homes);
 void compute_scale_workplaces(std::vector<workplace>& workplaces);
 void compute_scale_communities(const std::vector<agent>& nodes, std::vector<community>& communities);
 void compute_scale_random_community(std::vector<house>& houses, std::vector<agent>& nodes);
-void compute_scale_nbr_cells(std::vector<agent>& nodes, matrix<nbr_cell>& nbr_cells, const std::vector<house>& homes);
+void compute_scale_nbr_cells(std::vector<agent>& nodes, nbr_cell_grid& nbr_cells, const std::vector<house>& homes);
 
 
 // Age stratification JSON read function.
@@ -44,6 +49,16 @@ svd init_school_age_interaction_matrix();
 svd init_workplace_age_interaction_matrix();
 svd init_community_age_interaction_matrix();
 
+//Truncates age_matrix to its first SIGNIFICANT_EIGEN_VALUES singular values
+age_mixing_factors init_age_mixing_factors(const svd& age_matrix);
+//Batches homes and workplaces by age interaction matrix, with workspaces
+//sized for them
+location_age_mixing init_location_age_mixing(const std::vector<house>& homes,
+											 const std::vector<workplace>& workplaces,
+											 const svd& home_age_matrix,
+											 const svd& school_age_matrix,
+											 const svd& workplace_age_matrix);
+
 void print_testing_protocol(const int index, const testing_probability probabilities);
 
 #endif
\ No newline at end of file
@@ -51,7 +51,7 @@ void set_kappa_lockdown_node(agent& node, const int cur_time, const intervention
 }
 
 void modify_kappa_SDE_node(agent& node){
-  if(node.age>= UPPER_AGE && node.compliant){
+  if(node.details().age>= UPPER_AGE && node.compliant){
     node.kappa_W_incoming = min(0.25, node.kappa_W_incoming);
     node.kappa_C_incoming = min(0.25, node.kappa_C_incoming);
   }
@@ -103,8 +103,8 @@ void modify_kappa_ward_containment(agent& node){
 bool should_be_isolated_node(const agent& node, const int cur_time, const int quarantine_days){
   double time_since_symptoms = cur_time
                               - (node.time_of_infection
-                              + node.incubation_period
-                              + node.asymptomatic_period);
+                              + node.details().incubation_period
+                              + node.details().asymptomatic_period);
   return (node.entered_symptomatic_state &&
    (time_since_symptoms > NUM_DAYS_TO_RECOG_SYMPTOMS*GLOBAL.SIM_STEPS_PER_DAY) &&
    (time_since_symptoms <= (NUM_DAYS_TO_RECOG_SYMPTOMS + quarantine_days)*GLOBAL.SIM_STEPS_PER_DAY));
@@ -120,19 +120,18 @@ void mark_homes_for_quarantine(const vector<agent>& nodes, vector<house>& homes,
 }
 
 void mark_neighbourhood_homes_for_quarantine(const vector<agent>& nodes, vector<house>& homes,
-											 const matrix<nbr_cell>& nbr_cells, const int cur_time){
+											 const nbr_cell_grid& nbr_cells, const int cur_time){
 	for (count_type count = 0; count < nodes.size(); ++count){
 		double time_since_hospitalised = cur_time
 		- (nodes[count].time_of_infection
-			+ nodes[count].incubation_period
-			+ nodes[count].asymptomatic_period
-			+ nodes[count].symptomatic_period);
+			+ nodes[count].details().incubation_period
+			+ nodes[count].details().asymptomatic_period
+			+ nodes[count].details().symptomatic_period);
 		if(((nodes[count].entered_hospitalised_state) &&
 		(time_since_hospitalised <= (HOME_QUARANTINE_DAYS)*GLOBAL.SIM_STEPS_PER_DAY)) ){
 			homes[nodes[count].home].quarantined = true;		
 			//TODO: Need to check if the nbr_cell's quarantined flag needs to be set.
-			grid_cell my_nbr_grid_cell = homes[nodes[count].home].neighbourhood;
-			nbr_cell my_nbr_cell = 	nbr_cells[my_nbr_grid_cell.cell_x][my_nbr_grid_cell.cell_y];	
+			const nbr_cell& my_nbr_cell = nbr_cells.of(homes[nodes[count].home]);
 			count_type num_homes_in_cell = my_nbr_cell.houses_list.size();
 			for(count_type nbr_count = 0; nbr_count < num_homes_in_cell; ++nbr_count){
 				count_type neighbour = my_nbr_cell.houses_list[nbr_count];
@@ -10,6 +10,80 @@
 using std::vector;
 using std::min;
 
+namespace {
+  //Bits of the per-agent inputs of get_kappa_custom_modular that change
+  //during a run. Everything else it reads (age, workplace type, the
+  //intervention parameters) is fixed for a given set of parameters.
+  enum kappa_input : std::uint8_t {
+    KAPPA_INPUT_COMPLIANT = 1,
+    KAPPA_INPUT_ISOLATED = 2,
+    KAPPA_INPUT_HOME_QUARANTINED = 4,
+    KAPPA_INPUT_WARD_CONTAINED = 8,
+    //kappa_T changes every step while an agent is infective
+    KAPPA_INPUT_INFECTIVE = 16,
+    //Set by mark_kappas_modified, never by get_kappa_inputs, so that the
+    //cached inputs differ and the kappas are recomputed
+    KAPPA_INPUT_MODIFIED = 32
+  };
+
+  //Inputs of the last kappas set by get_kappa_custom_modular, used when
+  //INCREMENTAL_KAPPA_UPDATES is set
+  struct kappa_input_cache {
+    int last_time = -1;
+    intervention_params params;
+    vector<std::uint8_t> inputs;
+  };
+  kappa_input_cache KAPPA_INPUTS;
+
+  bool same_kappas(const kappa_values& a, const kappa_values& b){
+    return a.kappa_H == b.kappa_H && a.kappa_H_incoming == b.kappa_H_incoming
+      && a.kappa_W == b.kappa_W && a.kappa_W_incoming == b.kappa_W_incoming
+      && a.kappa_C == b.kappa_C && a.kappa_C_incoming == b.kappa_C_incoming;
+  }
+
+  //Whether two sets of intervention parameters give every agent the same
+  //kappas for the same agent inputs
+  bool same_kappa_params(const intervention_params& a, const intervention_params& b){
+    return a.lockdown == b.lockdown
+      && same_kappas(a.lockdown_kappas_compliant, b.lockdown_kappas_compliant)
+      && same_kappas(a.lockdown_kappas_non_compliant, b.lockdown_kappas_non_compliant)
+      && a.community_factor == b.community_factor
+      && a.social_dist_elderly == b.social_dist_elderly
+      && a.workplace_odd_even == b.workplace_odd_even
+      && a.school_closed == b.school_closed
+      && a.SC_factor == b.SC_factor
+      && a.case_isolation == b.case_isolation
+      && a.home_quarantine == b.home_quarantine
+      && a.neighbourhood_containment == b.neighbourhood_containment
+      && a.ward_containment == b.ward_containment;
+  }
+
+  std::uint8_t get_kappa_inputs(const agent& node, const vector<house>& homes,
+                                const vector<community>& communities,
+                                const int cur_time, const intervention_params& intv_params){
+    std::uint8_t inputs = 0;
+    if(node.compliant){
+      inputs |= KAPPA_INPUT_COMPLIANT;
+    }
+    if(intv_params.case_isolation && node.compliant
+       && should_be_isolated_node(node, cur_time, SELF_ISOLATION_DAYS)){
+      inputs |= KAPPA_INPUT_ISOLATED;
+    }
+    if(homes[node.home].quarantined
+       && (intv_params.home_quarantine || intv_params.neighbourhood_containment)){
+      inputs |= KAPPA_INPUT_HOME_QUARANTINED;
+    }
+    if(node.compliant && communities[node.community].quarantined
+       && intv_params.ward_containment){
+      inputs |= KAPPA_INPUT_WARD_CONTAINED;
+    }
+    if(node.infective){
+      inputs |= KAPPA_INPUT_INFECTIVE;
+    }
+    return inputs;
+  }
+}
+
 void get_kappa_no_intervention(vector<agent>& nodes,
 		const vector<house>& homes,
 		const vector<workplace>& workplaces,
@@ -40,8 +114,8 @@ void get_kappa_case_isolation(vector<agent>& nodes,
   for (count_type count = 0; count < nodes.size(); ++count){
 	double time_since_symptoms = cur_time
 	  - (nodes[count].time_of_infection
-		 + nodes[count].incubation_period
-		 + nodes[count].asymptomatic_period);
+		 + nodes[count].details().incubation_period
+		 + nodes[count].details().asymptomatic_period);
 	nodes[count].kappa_T = kappa_T(nodes[count], cur_time);
 	nodes[count].kappa_H = 1;
 	nodes[count].kappa_W = 1;
@@ -76,8 +150,8 @@ void get_kappa_SC(vector<agent>& nodes,
   for (count_type count = 0; count < nodes.size(); ++count){
 	double time_since_symptoms = cur_time
 	  - (nodes[count].time_of_infection
-		 + nodes[count].incubation_period
-		 + nodes[count].asymptomatic_period);
+		 + nodes[count].details().incubation_period
+		 + nodes[count].details().asymptomatic_period);
 	nodes[count].kappa_T = kappa_T(nodes[count], cur_time);
 	nodes[count].kappa_H = 1;
 	nodes[count].kappa_W = 1;
@@ -115,8 +189,8 @@ void get_kappa_home_quarantine(vector<agent>& nodes, vector<house>& homes, const
   for (count_type count = 0; count < nodes.size(); ++count){
 	double time_since_symptoms = cur_time
 	  - (nodes[count].time_of_infection
-		 + nodes[count].incubation_period
-		 + nodes[count].asymptomatic_period);
+		 + nodes[count].details().incubation_period
+		 + nodes[count].details().asymptomatic_period);
 	if((nodes[count].compliant && nodes[count].entered_symptomatic_state) &&
 	   (time_since_symptoms > NUM_DAYS_TO_RECOG_SYMPTOMS*GLOBAL.SIM_STEPS_PER_DAY) &&
 	   (time_since_symptoms
@@ -201,8 +275,8 @@ void get_kappa_CI_HQ(vector<agent>& nodes, vector<house>& homes, const vector<wo
   for(count_type count = 0; count < nodes.size(); ++count){
 	double time_since_symptoms = cur_time
 	  - (nodes[count].time_of_infection
-		 + nodes[count].incubation_period
-		 + nodes[count].asymptomatic_period);
+		 + nodes[count].details().incubation_period
+		 + nodes[count].details().asymptomatic_period);
 	if((nodes[count].compliant && nodes[count].entered_symptomatic_state) &&
 	   (time_since_symptoms > NUM_DAYS_TO_RECOG_SYMPTOMS*GLOBAL.SIM_STEPS_PER_DAY)
 	   && (time_since_symptoms <= (NUM_DAYS_TO_RECOG_SYMPTOMS + HOME_QUARANTINE_DAYS) *GLOBAL.SIM_STEPS_PER_DAY)){
@@ -244,8 +318,8 @@ void get_kappa_CI_HQ_65P(vector<agent>& nodes, vector<house>& homes, const vecto
   for (count_type count = 0; count < nodes.size(); ++count){
 	double time_since_symptoms = cur_time
 	  - (nodes[count].time_of_infection
-		 + nodes[count].incubation_period
-		 + nodes[count].asymptomatic_period);
+		 + nodes[count].details().incubation_period
+		 + nodes[count].details().asymptomatic_period);
 	if((nodes[count].compliant && nodes[count].entered_symptomatic_state) &&
 	   (time_since_symptoms > NUM_DAYS_TO_RECOG_SYMPTOMS*GLOBAL.SIM_STEPS_PER_DAY) &&
 	   (time_since_symptoms <= (NUM_DAYS_TO_RECOG_SYMPTOMS+HOME_QUARANTINE_DAYS)*GLOBAL.SIM_STEPS_PER_DAY)){
@@ -265,7 +339,7 @@ void get_kappa_CI_HQ_65P(vector<agent>& nodes, vector<house>& homes, const vecto
 	nodes[count].kappa_W_incoming = 1;
 	nodes[count].kappa_C_incoming = 1;
 
-	if(nodes[count].age>= UPPER_AGE && nodes[count].compliant){
+	if(nodes[count].details().age>= UPPER_AGE && nodes[count].compliant){
 	  nodes[count].kappa_W_incoming = 0.25;
 	  nodes[count].kappa_C_incoming = 0.25;
 	}
@@ -285,7 +359,7 @@ void get_kappa_CI_HQ_65P(vector<agent>& nodes, vector<house>& homes, const vecto
 
 void get_kappa_LOCKDOWN_fper_CI_HQ_SD_65_PLUS_sper_CI(vector<agent>& nodes, vector<house>& homes, const vector<workplace>& workplaces, vector<community>& communities, const int cur_time, double FIRST_PERIOD, double SECOND_PERIOD){
 	intervention_params intv_params;
-	matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+	nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  intv_params.lockdown = true;
       get_kappa_custom_modular(nodes, homes, workplaces, communities, nbr_cells, cur_time, intv_params);
@@ -305,7 +379,7 @@ void get_kappa_LOCKDOWN_fper_CI_HQ_SD_65_PLUS_sper_CI(vector<agent>& nodes, vect
 
 void get_kappa_LOCKDOWN_fper(vector<agent>& nodes, vector<house>& homes, const vector<workplace>& workplaces, vector<community>& communities, const int cur_time, double FIRST_PERIOD){
   intervention_params intv_params;
-  matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+  nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
   if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	//get_kappa_lockdown(nodes, homes, workplaces, communities, cur_time);
 	intv_params.lockdown = true;
@@ -326,8 +400,8 @@ void get_kappa_CI_HQ_65P_SC(vector<agent>& nodes, vector<house>& homes, const ve
   for (count_type count = 0; count < nodes.size(); ++count){
 	double time_since_symptoms = cur_time
 	  - (nodes[count].time_of_infection
-		 + nodes[count].incubation_period
-		 + nodes[count].asymptomatic_period);
+		 + nodes[count].details().incubation_period
+		 + nodes[count].details().asymptomatic_period);
 	if((nodes[count].compliant && nodes[count].entered_symptomatic_state) &&
 	   (time_since_symptoms > NUM_DAYS_TO_RECOG_SYMPTOMS*GLOBAL.SIM_STEPS_PER_DAY) &&
 	   (time_since_symptoms <= (NUM_DAYS_TO_RECOG_SYMPTOMS+HOME_QUARANTINE_DAYS)*GLOBAL.SIM_STEPS_PER_DAY)){
@@ -347,7 +421,7 @@ void get_kappa_CI_HQ_65P_SC(vector<agent>& nodes, vector<house>& homes, const ve
 	nodes[count].kappa_W_incoming = 1;
 	nodes[count].kappa_C_incoming = 1;
 
-	if(nodes[count].age>= UPPER_AGE && nodes[count].compliant){
+	if(nodes[count].details().age>= UPPER_AGE && nodes[count].compliant){
 	  nodes[count].kappa_W_incoming = 0.25;
 	  nodes[count].kappa_C_incoming = 0.25;
 	}
@@ -379,8 +453,8 @@ void get_kappa_CI_HQ_65P_SC_OE(vector<agent>& nodes, vector<house>& homes, const
   for (count_type count = 0; count < nodes.size(); ++count){
 	double time_since_symptoms = cur_time
 	  - (nodes[count].time_of_infection
-		 + nodes[count].incubation_period
-		 + nodes[count].asymptomatic_period);
+		 + nodes[count].details().incubation_period
+		 + nodes[count].details().asymptomatic_period);
 	if((nodes[count].compliant && nodes[count].entered_symptomatic_state) &&
 	   (time_since_symptoms > NUM_DAYS_TO_RECOG_SYMPTOMS*GLOBAL.SIM_STEPS_PER_DAY) &&
 	   (time_since_symptoms <= (NUM_DAYS_TO_RECOG_SYMPTOMS+HOME_QUARANTINE_DAYS)*GLOBAL.SIM_STEPS_PER_DAY)){
@@ -400,7 +474,7 @@ void get_kappa_CI_HQ_65P_SC_OE(vector<agent>& nodes, vector<house>& homes, const
 	nodes[count].kappa_W_incoming = 1;
 	nodes[count].kappa_C_incoming = 1;
 
-	if(nodes[count].age>= UPPER_AGE && nodes[count].compliant){
+	if(nodes[count].details().age>= UPPER_AGE && nodes[count].compliant){
 	  nodes[count].kappa_W_incoming = 0.25;
 	  nodes[count].kappa_C_incoming = 0.25;
 	}
@@ -440,9 +514,9 @@ void mark_communities_for_containment(const vector<agent>& nodes, vector<communi
 	for (count_type count = 0; count < nodes.size(); ++count){
 		double time_since_hospitalised = cur_time
 		- (nodes[count].time_of_infection
-			+ nodes[count].incubation_period
-			+ nodes[count].asymptomatic_period
-			+ nodes[count].symptomatic_period);
+			+ nodes[count].details().incubation_period
+			+ nodes[count].details().asymptomatic_period
+			+ nodes[count].details().symptomatic_period);
 		if(((nodes[count].entered_hospitalised_state) &&
 		(time_since_hospitalised <= (HOME_QUARANTINE_DAYS)*GLOBAL.SIM_STEPS_PER_DAY)) ){
 			++num_ward_hospitalised[nodes[count].community];
@@ -457,7 +531,7 @@ void mark_communities_for_containment(const vector<agent>& nodes, vector<communi
 
 void get_kappa_custom_modular(std::vector<agent>& nodes, std::vector<house>& homes,
 							  const std::vector<workplace>& workplaces, std::vector<community>& communities,
-							  const matrix<nbr_cell>& nbr_cells,
+							  const nbr_cell_grid& nbr_cells,
 							  const int cur_time, const intervention_params intv_params){
   if(intv_params.trains_active){
     GLOBAL.TRAINS_RUNNING = true;
@@ -494,8 +568,33 @@ void get_kappa_custom_modular(std::vector<agent>& nodes, std::vector<house>& hom
 	GLOBAL.LOCKED_COMMUNITY_LEAKAGE = intv_params.locked_community_leakage;
   }
 
-#pragma omp parallel for default(none) shared(nodes, homes, communities, cur_time, intv_params)
+  //With INCREMENTAL_KAPPA_UPDATES, only agents whose inputs changed since
+  //the previous step are recomputed. All agents are recomputed on the first
+  //call, when the parameters change, and after a step without a call to this
+  //function, since another intervention function may have set the kappas.
+  const bool incremental = GLOBAL.INCREMENTAL_KAPPA_UPDATES;
+  bool recompute_all = true;
+  if(incremental){
+    recompute_all = (KAPPA_INPUTS.inputs.size() != nodes.size()
+                     || KAPPA_INPUTS.last_time + 1 != cur_time
+                     || !same_kappa_params(KAPPA_INPUTS.params, intv_params));
+    KAPPA_INPUTS.inputs.resize(nodes.size());
+    KAPPA_INPUTS.last_time = cur_time;
+    KAPPA_INPUTS.params = intv_params;
+  }
+  auto& kappa_inputs = KAPPA_INPUTS.inputs;
+
+#pragma omp parallel for default(none) \
+  shared(nodes, homes, communities, cur_time, intv_params, incremental, recompute_all, kappa_inputs)
   for (count_type count = 0; count < nodes.size(); ++count){
+    if(incremental){
+      auto inputs = get_kappa_inputs(nodes[count], homes, communities, cur_time, intv_params);
+      if(!recompute_all && inputs == kappa_inputs[count]
+         && !(inputs & KAPPA_INPUT_INFECTIVE)){
+        continue;
+      }
+      kappa_inputs[count] = inputs;
+    }
     //choose base kappas
     if(intv_params.lockdown){
       set_kappa_lockdown_node(nodes[count], cur_time, intv_params);
@@ -537,9 +636,15 @@ void get_kappa_custom_modular(std::vector<agent>& nodes, std::vector<house>& hom
   */
 }
 
+void mark_kappas_modified(const agent& node){
+  if(count_type(node.index) < KAPPA_INPUTS.inputs.size()){
+    KAPPA_INPUTS.inputs[node.index] |= KAPPA_INPUT_MODIFIED;
+  }
+}
+
 void get_kappa_LD_fper_CI_HQ_SD65_SC_sper_SC_tper(vector<agent>& nodes, vector<house>& homes, const vector<workplace>& workplaces, vector<community>& communities, const int cur_time, double FIRST_PERIOD, double SECOND_PERIOD, double THIRD_PERIOD){
 	intervention_params intv_params;
-	matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+	nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  //get_kappa_lockdown(nodes, homes, workplaces, communities, cur_time);
 	  intv_params.lockdown = true;
@@ -565,7 +670,7 @@ void get_kappa_LD_fper_CI_HQ_SD65_SC_sper_SC_tper(vector<agent>& nodes, vector<h
 
 void get_kappa_LD_fper_CI_HQ_SD65_SC_sper(vector<agent>& nodes, vector<house>& homes, const vector<workplace>& workplaces, vector<community>& communities, const int cur_time, double FIRST_PERIOD, double SECOND_PERIOD){
 	intervention_params intv_params;
-	matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+	nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  //get_kappa_lockdown(nodes, homes, workplaces, communities, cur_time);
 	  intv_params.lockdown = true;
@@ -586,7 +691,7 @@ void get_kappa_LD_fper_CI_HQ_SD65_SC_sper(vector<agent>& nodes, vector<house>& h
 
 void get_kappa_LD_fper_CI_HQ_SD65_SC_OE_sper(vector<agent>& nodes, vector<house>& homes, const vector<workplace>& workplaces, vector<community>& communities, const int cur_time, double FIRST_PERIOD, double OE_SECOND_PERIOD){
 	intervention_params intv_params;
-	matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+	nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  //get_kappa_lockdown(nodes, homes, workplaces, communities, cur_time);
 	  intv_params.lockdown = true;
@@ -608,7 +713,7 @@ void get_kappa_LD_fper_CI_HQ_SD65_SC_OE_sper(vector<agent>& nodes, vector<house>
 
 void get_kappa_intv_fper_intv_sper_intv_tper(vector<agent>& nodes, vector<house>& homes, const vector<workplace>& workplaces, vector<community>& communities, const int cur_time, double FIRST_PERIOD, double SECOND_PERIOD, double THIRD_PERIOD){
 	intervention_params intv_params;
-	matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+	nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  //get_kappa_lockdown(nodes, homes, workplaces, communities, cur_time);
 	  intv_params.lockdown = true;
@@ -638,7 +743,7 @@ void get_kappa_NYC(vector<agent>& nodes, vector<house>& homes, const vector<work
 	const double THIRD_PERIOD = 3;
 	const double FOURTH_PERIOD = 5;
 	intervention_params intv_params;
-	matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+	nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
 
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  //get_kappa_case_isolation(nodes, homes, workplaces, communities, cur_time);
@@ -673,7 +778,7 @@ void get_kappa_NYC(vector<agent>& nodes, vector<house>& homes, const vector<work
 
 void get_kappa_Mumbai_cyclic(vector<agent>& nodes, vector<house>& homes,
 							 const vector<workplace>& workplaces, vector<community>& communities,
-							 const matrix<nbr_cell>& nbr_cells,
+							 const nbr_cell_grid& nbr_cells,
 							 const int cur_time, double FIRST_PERIOD, double SECOND_PERIOD){
   auto LOCKDOWN_PERIOD = FIRST_PERIOD + SECOND_PERIOD;
   double USUAL_COMPLIANCE_PROBABILITY = 0.6;
@@ -717,10 +822,10 @@ void get_kappa_Mumbai_cyclic(vector<agent>& nodes, vector<house>& homes,
 //The version below is an older version, based on a different generic implementation
 void get_kappa_Mumbai_alternative_version(vector<agent>& nodes, vector<house>& homes,
 										  const vector<workplace>& workplaces, vector<community>& communities,
-										  const matrix<nbr_cell>& nbr_cells,
+										  const nbr_cell_grid& nbr_cells,
 										  int cur_time, double FIRST_PERIOD, double SECOND_PERIOD){
 	intervention_params intv_params;
-	//matrix<nbr_cell> nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
+	//nbr_cell_grid nbr_cells; //dummy variable  just to enable get_kappa_custom_modular function call.
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  //get_kappa_lockdown(nodes, homes, workplaces, communities, cur_time);
 	  intv_params.lockdown = true;
@@ -745,7 +850,7 @@ void get_kappa_Mumbai_alternative_version(vector<agent>& nodes, vector<house>& h
 
 void get_kappa_containment(vector<agent>& nodes, vector<house>& homes,
 						   const vector<workplace>& workplaces, vector<community>& communities,
-						   const matrix<nbr_cell>& nbr_cells,
+						   const nbr_cell_grid& nbr_cells,
 						   int cur_time, double FIRST_PERIOD, Intervention intv){
 	if(cur_time < (GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS+FIRST_PERIOD)*GLOBAL.SIM_STEPS_PER_DAY){
 	  intervention_params intv_params;
@@ -778,27 +883,22 @@ void get_kappa_containment(vector<agent>& nodes, vector<house>& homes,
 
 void get_kappa_file_read(vector<agent>& nodes, vector<house>& homes,
 						 const vector<workplace>& workplaces, vector<community>& communities,
-						 const matrix<nbr_cell>& nbr_cells,
-						 const vector<intervention_params>& intv_params_vector, int cur_time){
-  count_type time_threshold = GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS;
-  count_type cur_day = cur_time/GLOBAL.SIM_STEPS_PER_DAY; //get current day. Division to avoid multiplication inside for loop.
-  const auto SIZE = intv_params_vector.size();
-
-  assert(SIZE > 0);
-  assert(cur_day >= time_threshold);
-  count_type intv_index = 0;
-
-  for (count_type count = 0; count < SIZE - 1; ++count){
-	time_threshold += intv_params_vector[count].num_days;
-	if(cur_day >= time_threshold){
-	  ++intv_index;
-	} else {
-	  break;
-	}
+						 const nbr_cell_grid& nbr_cells,
+						 intervention_schedule& intv_schedule, int cur_time){
+  count_type cur_day = cur_time/GLOBAL.SIM_STEPS_PER_DAY; //get current day.
+
+  assert(intv_schedule.periods.size() > 0);
+  assert(cur_day >= count_type(GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS));
+  const count_type intv_index = intv_schedule.period(cur_day);
+  const auto& intv_params = intv_schedule.periods[intv_index];
+
+  //Compliance only depends on the period, so it is set again only when the
+  //period changes
+  if(intv_schedule.compliance_period != intv_index){
+	set_compliance(nodes, homes, intv_params.compliance,
+				   intv_params.compliance_hd);
+	intv_schedule.compliance_period = intv_index;
   }
 
-  set_compliance(nodes, homes, intv_params_vector[intv_index].compliance,
-				 intv_params_vector[intv_index].compliance_hd);
-
-  get_kappa_custom_modular(nodes, homes, workplaces, communities, nbr_cells, cur_time, intv_params_vector[intv_index]);
+  get_kappa_custom_modular(nodes, homes, workplaces, communities, nbr_cells, cur_time, intv_params);
 }
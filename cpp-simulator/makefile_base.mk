@@ -11,6 +11,11 @@ debug =
 #Set this to -DMERSENNE_TWISTER to use the Mersenne twister 19937 Random number generator
 random = -DMERSENNE_TWISTER
 
+#Set this to yes to compute the global community term with cblas_dgemv.
+#blas_lib is the BLAS library to link against.
+enable_blas=no
+blas_lib = -lopenblas
+
 ifeq ($(check_git),yes)
 #Get the git commit ID
 GIT_HASH = $(shell git rev-parse HEAD)
@@ -24,24 +29,39 @@ endif
 ifeq ($(enable_proto), yes)
 #set proto flags
 LDLIBS = -lprotobuf
-obj = cohorts.o train_loader.o agents_store.pb.o initializers.o models.o interventions.o intervention_primitives.o updates.o simulator.o testing.o outputs.o drive_simulator.o
+obj = cohorts.o train_loader.o agents_store.pb.o initializers.o models.o interventions.o intervention_primitives.o updates.o checkpoint.o simulator.o testing.o outputs.o drive_simulator.o
 else
 LDLIBS =
-obj = cohorts.o train_loader.o initializers.o models.o interventions.o intervention_primitives.o updates.o simulator.o testing.o outputs.o drive_simulator.o
+obj = cohorts.o train_loader.o initializers.o models.o interventions.o intervention_primitives.o updates.o checkpoint.o simulator.o testing.o outputs.o drive_simulator.o
 endif
 
 
 
+ifeq ($(enable_blas), yes)
+blas = -DUSE_BLAS
+LDLIBS += $(blas_lib)
+else
+blas =
+endif
+
 include_paths = -Ilibs/ -Ilibs/cxxopts-2.2.0/include/
 DEPFLAGS = -MMD -MP -MF $*.d
 CXX = g++
-CPPFLAGS = -Wall --std=c++14 -O3 $(DEPFLAGS) $(include_paths) $(parallel) $(timing) $(debug) $(random) -D GIT_HASH='"$(GIT_HASH)"' -D GIT_TREE_STATE='"$(GIT_TREE_STATE)"'
+CPPFLAGS = -Wall --std=c++14 -O3 $(DEPFLAGS) $(include_paths) $(parallel) $(timing) $(debug) $(random) $(blas) -D GIT_HASH='"$(GIT_HASH)"' -D GIT_TREE_STATE='"$(GIT_TREE_STATE)"'
 
 all: drive_simulator check
 
 drive_simulator: $(obj)
 	$(CXX) $(CPPFLAGS) $^ -o $@ $(LDLIBS)
 
+#Benchmark of the per-timestep agent passes; not built by default
+bench_agents: bench_agents.o $(filter-out drive_simulator.o,$(obj))
+	$(CXX) $(CPPFLAGS) $^ -o $@ $(LDLIBS)
+
+#Benchmark of the cohort building at startup; not built by default
+bench_startup: bench_startup.o $(filter-out drive_simulator.o,$(obj))
+	$(CXX) $(CPPFLAGS) $^ -o $@ $(LDLIBS)
+
 %.o : $.cc %.d
 	$(CXX) $(CPPFLAGS) -c $<
 
@@ -49,13 +69,13 @@ $(DEPDIR):
 	mkdir -p $@
 
 
-DEPFILES := $(obj:%.o=%.d)
+DEPFILES := $(obj:%.o=%.d) bench_agents.d bench_startup.d
 $(DEPFILES):
 
 
 .PHONY: clean
 clean:
-	rm drive_simulator *.o
+	rm -f drive_simulator bench_agents bench_startup *.o
 
 .PHONY: check
 check:
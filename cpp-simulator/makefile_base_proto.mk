@@ -22,7 +22,7 @@ endif
 LDLIBS = -lprotobuf 
 LDFLAGS = -L/mnt/lustre/rbc/rbcsri/bin/lib/
 include_paths = -Ilibs/ -Ilibs/cxxopts-2.2.0/include/ -I../../bin/lib -I../../protobuf-3.13.0/src/
-obj = cohorts.o train_loader.o agents_store.pb.o initializers.o models.o interventions.o intervention_primitives.o updates.o simulator.o testing.o outputs.o drive_simulator.o
+obj = cohorts.o train_loader.o agents_store.pb.o initializers.o models.o interventions.o intervention_primitives.o updates.o checkpoint.o simulator.o testing.o outputs.o drive_simulator.o
 
 DEPFLAGS = -MMD -MP -MF $*.d
 CXX = g++
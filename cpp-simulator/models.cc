@@ -117,12 +117,12 @@ double agent::get_attendance_probability(count_type time) const{
         day = ATTENDANCE.number_of_entries - 1;
         //Just use the last entry
       }
-      return ATTENDANCE.probabilities[day][static_cast<count_type>(this->office_type)];
+      return ATTENDANCE.probability(day, this->office_type);
     }
   } else {
     day -= GLOBAL.CYCLIC_POLICY_START_DAY;
     auto cyclic_period = (day / GLOBAL.PERIOD_OF_ATTENDANCE_CYCLE) % GLOBAL.NUMBER_OF_CYCLIC_CLASSES;
-    if (cyclic_period == this->cyclic_strategy_class){
+    if (cyclic_period == this->details().cyclic_strategy_class){
       return 1.0;
     }
     else {
@@ -181,6 +181,15 @@ double earth_distance(location a, location b){
 
 
 office_attendance ATTENDANCE;
+location_memberships MEMBERSHIP;
+std::vector<agent_details> AGENT_DETAILS;
+
+void init_agent_details(std::vector<agent>& nodes){
+  AGENT_DETAILS.assign(nodes.size(), agent_details());
+  for(count_type i = 0; i < nodes.size(); ++i){
+	nodes[i].index = i;
+  }
+}
 
 //interpolation with a threshold
 double interpolate(double start, double end, double current, double threshold){
@@ -192,6 +201,16 @@ double interpolate(double start, double end, double current, double threshold){
   }
 }
 
+count_type intervention_schedule::period(count_type cur_day) const{
+  //Truncated, as when the schedule was looked up by walking the periods
+  count_type first_day = GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS;
+  count_type day = cur_day - first_day;
+  if(day < period_of_day.size()){
+	return period_of_day[day];
+  }
+  return periods.size() - 1;
+}
+
 void set_compliance(std::vector<agent> & nodes, std::vector<house> & homes,
 					double usual_compliance_probability, double hd_area_compliance_probability){
   //set the compliant flag for a household and it's individuals based on compliance_probability
@@ -219,13 +238,13 @@ double kappa_T(const agent& node, double cur_time){
   else {
 	double time_since_infection = cur_time - node.time_of_infection;
 
-	if(time_since_infection < node.incubation_period
-	   || time_since_infection> (node.incubation_period
-								 + node.asymptomatic_period
-								 + node.symptomatic_period)) {
+	if(time_since_infection < node.details().incubation_period
+	   || time_since_infection> (node.details().incubation_period
+								 + node.details().asymptomatic_period
+								 + node.details().symptomatic_period)) {
 	  // Individual is not yet symptomatic or has been recovered, or has moved to the hospital
 	  val = 0;
-	} else if(time_since_infection < node.incubation_period + node.asymptomatic_period) {
+	} else if(time_since_infection < node.details().incubation_period + node.details().asymptomatic_period) {
 	  val = 1;
 	} else {
 	  val = 1.5;
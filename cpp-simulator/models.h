@@ -9,6 +9,7 @@
 #include <string>
 #include <algorithm>
 #include <unordered_map>
+#include <cstdint>
 
 
 enum class Intervention {
@@ -199,6 +200,57 @@ struct svd {
   std::vector<double> sigma;
 };
 
+//Leading SIGNIFICANT_EIGEN_VALUES terms of an svd, flattened row-major so
+//that they can be applied to many locations at once:
+//u_sigma[g*rank + k] = u[g][k]*sigma[k] for each of the NUM_AGE_GROUPS age
+//groups g, and vT[k*size + a] = vT[k][a] for the size columns of vT.
+struct age_mixing_factors {
+  count_type rank = 0;
+  count_type size = 0;
+  std::vector<double> u_sigma;
+  std::vector<double> vT;
+};
+
+//Workspace for the age-dependent mixing of a set of locations sharing one
+//age interaction matrix. For the i-th location in locations, row i of
+//age_component holds the lambdas of its members summed by age group
+//(NUM_AGE_GROUPS entries), and row i of projected holds the truncated vT
+//applied to that row (rank entries). The buffers are sized once and reused
+//every timestep.
+struct age_mixing_batch {
+  age_mixing_factors factors;
+  std::vector<count_type> locations;
+  std::vector<double> age_component;
+  std::vector<double> projected;
+};
+
+//Age-dependent mixing batches of homes, schools and other workplaces
+struct location_age_mixing {
+  age_mixing_batch homes;
+  age_mixing_batch schools;
+  age_mixing_batch workplaces;
+};
+
+//Ward-to-ward kernel for the global community term, computed once at
+//startup. Entry (c1, c2) of the dense row-major array is
+//f_kernel(distance(c1, c2)) and row_sum[c1] is the sum of row c1, so that
+//row c1 divided by row_sum[c1] is the row-normalized kernel.
+//
+//If the kernel is sparsified, entries smaller than
+//COMMUNITY_KERNEL_SPARSITY_THRESHOLD times their row sum are dropped, the
+//remaining entries are held in CSR form, and row_sum is taken over the kept
+//entries only.
+struct community_kernel {
+  count_type size = 0;
+  std::vector<double> weights;
+  std::vector<double> row_sum;
+
+  bool sparse = false;
+  std::vector<count_type> row_offsets;
+  std::vector<count_type> columns;
+  std::vector<double> values;
+};
+
 struct kappa_values{
 double kappa_H;
 double kappa_H_incoming;
@@ -460,6 +512,40 @@ struct global_params{
   bool ENABLE_CONTAINMENT = false;
   bool ENABLE_NBR_CELLS = false;
 
+  //Kernel entries below this fraction of their row sum are dropped from the
+  //ward-to-ward kernel. 0 keeps the kernel dense.
+  double COMMUNITY_KERNEL_SPARSITY_THRESHOLD = 0;
+
+  //Call update_infection only on agents with a transition due, infective
+  //agents and susceptible agents with nonzero lambda. This skips the random
+  //draws of the other agents, so results differ from the default sweep over
+  //all agents for the same seed.
+  bool EVENT_DRIVEN_PROGRESSION = false;
+
+  //Recompute in get_kappa_custom_modular only the agents whose compliance,
+  //isolation, quarantine or containment status changed, and infective
+  //agents. The kappas are the same as with a full recompute.
+  bool INCREMENTAL_KAPPA_UPDATES = false;
+
+  //Contact trace neighbourhood cells through an index of their residents,
+  //visiting only the cells with index cases in the timestep. This skips the
+  //random draws of the other agents, so results differ from the default
+  //sweep over all agents for the same seed.
+  bool INDEXED_CONTACT_TRACING = false;
+
+  //Record the wall time of each phase of every timestep in phase_times.csv
+  bool RECORD_PHASE_TIMES = false;
+
+  //Append output rows to the CSV files at the end of each timestep instead
+  //of keeping them in memory until the end of the run (see csv_stream)
+  bool STREAM_OUTPUTS = false;
+
+  //Output series to write; empty writes all of them. A name ending in '*'
+  //selects every series starting with the rest of the name.
+  std::vector<std::string> output_series;
+  //Do not write gnuplot_script.gnuplot and plots.html
+  bool SKIP_PLOT_SCRIPTS = false;
+
   std::string intervention_filename = "intervention_params.json";
 
   double MIN_PROJECT_SIZE = 3; //Min and Max number of members in a project.
@@ -487,11 +573,18 @@ struct global_params{
   double COHORT_SEVERITY_FRACTION=0; //Threshold for severity index for an individual, beyond which the individual and the cohort is expected to quarantine.
   cohort_strategy COHORT_STRATEGY=cohort_strategy::static_cohorts_dynamic_coaches;
   double ONE_OFF_TRAVELERS_RATIO = 0.0;
+  // Cache of the train tables, relative to input_base; empty for no cache
+  std::string train_cache_filename = "";
 
   //////////// TO STORE OR LOAD STATE //////////////
   count_type STORE_STATE_TIME_STEP = 0;
   count_type LOAD_STATE_TIME_STEP = 0;
 
+  //Full simulator state checkpoint (see checkpoint.h)
+  count_type CHECKPOINT_TIME_STEP = 0;
+  std::string checkpoint_file = "checkpoint.bin";
+  std::string restore_checkpoint;
+
   
     // Daily counters for tracking state transitions
   count_type daily_new_exposed = 0;
@@ -602,6 +695,22 @@ struct intervention_params {
   }
 };
 
+//Periods of an intervention file, compiled at load time into the index of
+//the period in effect on each day, counted from
+//NUM_DAYS_BEFORE_INTERVENTIONS. The last period stays in effect on all later
+//days.
+struct intervention_schedule {
+  std::vector<intervention_params> periods;
+  std::vector<count_type> period_of_day;
+
+  //Period whose compliance probabilities were last applied to the agents,
+  //or periods.size() if none have been applied yet
+  count_type compliance_period = 0;
+
+  //Index of the period in effect on day cur_day
+  count_type period(count_type cur_day) const;
+};
+
 
 // return a random compliance based on GLOBAL.compliance_probability
 inline bool compliance(){
@@ -635,7 +744,7 @@ struct grid_cell{
 //Distance between two locations given by their latitude and longitude, in degrees
 double earth_distance(location a, location b);
 
-enum class Progression {
+enum class Progression : std::uint8_t {
    susceptible = 0,
    exposed,
    infective,
@@ -646,7 +755,7 @@ enum class Progression {
    dead
 };
 
-enum class DiseaseLabel{
+enum class DiseaseLabel : std::uint8_t {
    asymptomatic = 0, //neither contact traced nor tested positive
    primary_contact, //CCC1
    mild_symptomatic_tested, //CCC2
@@ -657,13 +766,13 @@ enum class DiseaseLabel{
    dead
 };
 
-enum class WorkplaceType{
+enum class WorkplaceType : std::uint8_t {
    home = 0,
    office = 1,
    school = 2
 };
 
-enum class OfficeType{
+enum class OfficeType : std::uint8_t {
    other = 0,
    sez = 1,
    government = 2,
@@ -779,13 +888,13 @@ struct lambda_incoming_data {
   }
 };
 
-enum class test_result{
+enum class test_result : std::uint8_t {
   not_yet_tested,
   positive,
   negative,
 };
 
-enum class test_trigger{
+enum class test_trigger : std::uint8_t {
   not_yet_requested,
   symptomatic,
   hospitalised,
@@ -794,55 +903,97 @@ enum class test_trigger{
 };
 
 struct test_struct{
+  count_type contact_traced_epoch = 0;
   int tested_epoch = -28; // This is reset in init_nodes
   bool tested_positive = false; // To indicate if the individual is tested positive at sometime in the past
-  count_type contact_traced_epoch = 0;
   bool test_requested = false;
-  test_result state = test_result::not_yet_tested;
   bool triggered_contact_trace = false;
+  test_result state = test_result::not_yet_tested;
   test_trigger node_test_trigger=test_trigger::not_yet_requested;
 };
 
 struct cohort{
   //count_type cohort_id = 0;
-  bool takes_train = false;
-  bool one_off_traveler = false;
   count_type source_station = 0;
   count_type destination_station = 0;
   double edge_weight = 0; //TODO[NKV]: we might need to update this while cohorts are made, I guess!
+  bool takes_train = false;
+  bool one_off_traveler = false;
   bool quarantined =false;
 };
 
-struct agent{
+//Setup data of an agent, which is not read at every timestep. It is kept
+//apart from struct agent, in AGENT_DETAILS, so that the passes over every
+//agent at every timestep do not load it, and only accessed through
+//agent::details().
+struct agent_details{
   location loc;
   int age;
-  int age_group; //For later feature update: for age dependent mixing
-  int age_index; //For the STATE_TRAN matrix
-  double zeta_a = 1;
-  double infectiousness;
-  //a.k.a rho
-  double severity;
-  double severity_index=0; //severity scale for an individual
-  //a.k.a S_k, is 0 or
-  int home; //index of household
-  int workplace;
-
   int home_ward;
   int work_ward;
+  double severity_index=0; //severity scale for an individual
 
-  int community;
-  double time_of_infection = 0;
-  // time_of_infection is initialized to zero before seeding
+  //Cyclic strategy class.
+  //
+  //If a cyclic workplace strategy is being followed, then every agent will get
+  //a class, which will determine the periods in which it goes to work.
+  count_type cyclic_strategy_class = 0;
 
-  Progression infection_status = Progression::susceptible;
-  bool entered_symptomatic_state = false;
-  bool entered_hospitalised_state = false;
+  double commute_distance = 0; //in km
 
+  //Disease progression periods, only read once the agent is infected
+  double incubation_period;
+  double asymptomatic_period;
+  double symptomatic_period;
+  double hospital_regular_period;
+  double hospital_critical_period;
+};
+
+//Details of agent i are AGENT_DETAILS[i]
+extern std::vector<agent_details> AGENT_DETAILS;
+
+// The fields of agent are read or written by every agent at every timestep
+// (update_infection, the kappa and lambda updates, and the statistics pass);
+// setup data is in agent_details. One-byte enums and flags are packed
+// together at the front to avoid padding.
+struct agent{
+  Progression infection_status = Progression::susceptible;
   // for recovered nodes, what was the last stage before recovery?
   Progression state_before_recovery = Progression::recovered;
+  DiseaseLabel disease_label = DiseaseLabel::asymptomatic;
+  WorkplaceType workplace_type;
+  //one of school, office, or home
+  OfficeType office_type = OfficeType::other;
 
   bool infective = false;
+  bool entered_symptomatic_state = false;
+  bool entered_hospitalised_state = false;
+  bool compliant = true;
+  bool quarantined = false;
+
+  //Transporation
+  bool has_to_travel = false; //does the agent take a train to go to
+							  //work?
+  bool forced_to_take_train = true;
+  //Will the agent be forced to take the train today, as employer did not provide transit?
+
+  //Currently attending office or not
+  bool attending = true;
+
+  bool hd_area_resident = false;
+
+  int index = 0; //position in the agents vector, and of the details in AGENT_DETAILS
+  int home; //index of household
+  int workplace;
+  int community;
+  int age_group; //For later feature update: for age dependent mixing
+  int age_index; //For the STATE_TRAN matrix
+  int workplace_subnetwork = 0;
+  int community_subnetwork = 0;
+
   count_type time_became_infective = 0;
+  double time_of_infection = 0;
+  // time_of_infection is initialized to zero before seeding
 
   double lambda_h = 0;
   //individuals contribution to his home cluster
@@ -858,68 +1009,43 @@ struct agent{
   double psi_T = 0;
   double funct_d_ck;
 
-  WorkplaceType workplace_type;
-  //one of school, office, or home
-  OfficeType office_type = OfficeType::other;
-  int workplace_subnetwork = 0;
-  int community_subnetwork = 0;
-
-  //cohorts
-  cohort my_cohort;
-
-  lambda_incoming_data lambda_incoming;
-  //infectiousness from home, workplace, community, travel as seen by
-  //individual
-
-  //Neighborhood cell containment
-  double neighborhood_access_factor = 1.0;
-  //access_factor for the neighborhood cell in which this node lives
-  //set to 1 in case neighborhood cell is not enabled.
-
-  bool compliant = true;
+  double zeta_a = 1;
+  double infectiousness;
+  //a.k.a rho
+  double severity;
+  //a.k.a S_k, is 0 or 1
 
   double kappa_H = 1;
   double kappa_W = 1;
   double kappa_C = 1;
-
-  double incubation_period;
-  double asymptomatic_period;
-  double symptomatic_period;
-
-
-  double hospital_regular_period;
-  double hospital_critical_period;
-
   double kappa_H_incoming = 1;
   double kappa_W_incoming = 1;
   double kappa_C_incoming = 1;
-  bool quarantined = false;
-
-  //Cyclic strategy class.
-  //
-  //If a cyclic workplace strategy is being followed, then every agent will get
-  //a class, which will determine the periods in which it goes to work.
-  count_type cyclic_strategy_class = 0;
-
-  //Transporation
-  bool has_to_travel = false; //does the agent take a train to go to
-							  //work?
-  bool forced_to_take_train = true;
-  //Will the agent be forced to take the train today, as employer did not provide transit?
 
-  double commute_distance = 0; //in km
+  //Neighborhood cell containment
+  double neighborhood_access_factor = 1.0;
+  //access_factor for the neighborhood cell in which this node lives
+  //set to 1 in case neighborhood cell is not enabled.
 
-  bool hd_area_resident = false;
   //Multiplication factor for high population density areas, such as slums
   double hd_area_factor = 1.0;
   double hd_area_exponent = 0;
   //only used if in the input file, some individuals are assigned to
   //slums or other high population density areas
 
-  //Currently attending office or not
-  bool attending = true;
+  lambda_incoming_data lambda_incoming;
+  //infectiousness from home, workplace, community, travel as seen by
+  //individual
+
+  //cohorts
+  cohort my_cohort;
+
+  //Read at every timestep by the testing, cohort and statistics passes
+  test_struct test_status;
 
   agent(){}
+  inline agent_details& details(){ return AGENT_DETAILS[index]; }
+  inline const agent_details& details() const { return AGENT_DETAILS[index]; }
   // Is the agent curently traveling?
   inline bool travels() const {
 	return forced_to_take_train
@@ -932,10 +1058,81 @@ struct agent{
 
   //attendance probability at given time, for the agent
   double get_attendance_probability(count_type time) const;
-  test_struct test_status;
-  DiseaseLabel disease_label = DiseaseLabel::asymptomatic;
 };
 
+//Numbers the agents and sizes AGENT_DETAILS for them, with default details
+void init_agent_details(std::vector<agent>& nodes);
+
+
+//Members of one location (home, workplace or community): a contiguous range
+//of agent indices inside a membership_index. The range does not own its
+//storage.
+struct member_list{
+  int* first = nullptr;
+  count_type count = 0;
+
+  inline int* begin() const { return first; }
+  inline int* end() const { return first + count; }
+  inline count_type size() const { return count; }
+  inline bool empty() const { return count == 0; }
+  inline int& operator[](count_type i) const { return first[i]; }
+};
+
+//Shuffles the members in place, drawing from GENERATOR_NETWORK exactly as the
+//std::vector overload does
+inline void randomly_shuffle(member_list a){
+  std::shuffle(a.begin(), a.end(), GENERATOR_NETWORK);
+}
+
+//Compressed sparse row membership of agents in locations. The members of
+//location l are members[offsets[l]], ..., members[offsets[l + 1] - 1], in
+//increasing order of agent index.
+struct membership_index{
+  std::vector<count_type> offsets;
+  std::vector<int> members;
+
+  //Build the index in one counting pass. location_of(i) is the location of
+  //agent i, or a negative value if the agent belongs to none.
+  template<typename F>
+  void build(count_type num_locations, count_type num_agents, F location_of){
+	offsets.assign(num_locations + 1, 0);
+	for(count_type i = 0; i < num_agents; ++i){
+	  int location = location_of(i);
+	  if(location >= 0){
+		++offsets[location + 1];
+	  }
+	}
+	for(count_type l = 0; l < num_locations; ++l){
+	  offsets[l + 1] += offsets[l];
+	}
+	members.resize(offsets[num_locations]);
+	std::vector<count_type> next(offsets.begin(), offsets.end() - 1);
+	for(count_type i = 0; i < num_agents; ++i){
+	  int location = location_of(i);
+	  if(location >= 0){
+		members[next[location]++] = i;
+	  }
+	}
+  }
+
+  inline member_list of(count_type location){
+	return member_list{members.data() + offsets[location],
+					   offsets[location + 1] - offsets[location]};
+  }
+};
+
+//Membership indexes backing the individuals lists of homes, workplaces and
+//communities, and the residents of each neighbourhood cell, which is only
+//built with INDEXED_CONTACT_TRACING.  The location of a neighbourhood cell is
+//its position in nbr_cell_grid::cells.
+struct location_memberships{
+  membership_index homes;
+  membership_index workplaces;
+  membership_index communities;
+  membership_index nbr_cells;
+};
+
+extern location_memberships MEMBERSHIP;
 
 struct random_community{
   double lambda_random_community;
@@ -948,8 +1145,9 @@ struct random_community{
 struct house{
   location loc;
   grid_cell neighbourhood;
+  count_type nbr_cell_index = 0; //position of the neighbourhood cell in nbr_cell_grid::cells
   double lambda_home = 0;
-  std::vector<int> individuals; //list of indices of individuals
+  member_list individuals; //list of indices of individuals
   double Q_h = 1;
   count_type community; // ward index
   random_community random_households;  //to specify random community network
@@ -1006,7 +1204,7 @@ struct project{
 struct workplace {
   location loc;
   double lambda_workplace = 0;
-  std::vector<int> individuals; //list of indices of individuals
+  member_list individuals; //list of indices of individuals
   std::vector<project> projects; // list of project indices in the workplace
   double Q_w = 1;
   double scale = 0;
@@ -1060,25 +1258,31 @@ struct cohort_space: interaction_space{
 };
 
 struct train_coach {
-  count_type coach_id;
-  int trainLine;
-  bool isDown;
+  count_type coach_id = 0;
+  int trainLine = 0;
+  bool isDown = false;
   std::vector<cohort_space*> cohorts; // Pointer to cohort_space.
-  std::unordered_map<int, int> capacity_at_station;
-
-  train_coach(int id, int my_trainline, bool my_isDown, int my_capacity, std::vector<int>& stations){
+  //Stations of the line, each listed once, and the seats left in the coach
+  //when it leaves each of them
+  std::vector<int> stations;
+  std::vector<int> capacity_at_station;
+
+  train_coach() = default;
+  train_coach(int id, int my_trainline, bool my_isDown, int my_capacity, const std::vector<int>& my_stations){
+      set(id, my_trainline, my_isDown, my_capacity, my_stations);
+  }
+  //Reuses the storage of the coach
+  void set(int id, int my_trainline, bool my_isDown, int my_capacity, const std::vector<int>& my_stations){
       coach_id = id;
       trainLine = my_trainline;
       isDown = my_isDown;
-      for (auto& station: stations){
-          capacity_at_station[station] = my_capacity;
-      }
+      stations.assign(my_stations.begin(), my_stations.end());
+      capacity_at_station.assign(my_stations.size(), my_capacity);
+      cohorts.clear();
   }
   void reset(int id, int my_capacity){
       coach_id = id;
-      for (auto& it: capacity_at_station){
-          it.second = my_capacity;
-      }
+      std::fill(capacity_at_station.begin(), capacity_at_station.end(), my_capacity);
       cohorts.clear(); // Pointer to cohort_space.
   }
 };
@@ -1088,7 +1292,7 @@ struct community {
   location loc;
   double lambda_community = 0;
   double lambda_community_global = 0;
-  std::vector<int> individuals; //list of indices of individuals
+  member_list individuals; //list of indices of individuals
   std::vector<int> households;  //list of households in a community
   double Q_c = 1;
   double scale = 0;
@@ -1125,11 +1329,42 @@ struct nbr_cell {
   
 };
 
+//Neighbourhood cells that contain at least one home, in increasing order of
+//(cell_x, cell_y). Cells of the city bounding box without homes are not
+//stored, so memory and the passes over cells scale with the number of
+//occupied cells. Each home keeps the position of its cell in
+//nbr_cell_index.
+struct nbr_cell_grid{
+  std::vector<nbr_cell> cells;
+
+  //Orders cells by (cell_x, cell_y)
+  static inline std::uint64_t key(const grid_cell& cell){
+	return (std::uint64_t(cell.cell_x) << 32) | std::uint64_t(cell.cell_y);
+  }
+
+  inline nbr_cell& of(const house& home){ return cells[home.nbr_cell_index]; }
+  inline const nbr_cell& of(const house& home) const { return cells[home.nbr_cell_index]; }
+
+  inline nbr_cell& operator[](count_type i){ return cells[i]; }
+  inline const nbr_cell& operator[](count_type i) const { return cells[i]; }
+  inline count_type size() const { return cells.size(); }
+  inline bool empty() const { return cells.empty(); }
+  inline std::vector<nbr_cell>::iterator begin(){ return cells.begin(); }
+  inline std::vector<nbr_cell>::iterator end(){ return cells.end(); }
+  inline std::vector<nbr_cell>::const_iterator begin() const { return cells.begin(); }
+  inline std::vector<nbr_cell>::const_iterator end() const { return cells.end(); }
+};
+
 struct office_attendance{
-  count_type number_of_entries;
-  matrix<double> probabilities;
+  count_type number_of_entries = 0; //number of days in the table
+  //Attendance probability of each office type on each day, stored day by day
+  //as number_of_entries rows of NUMBER_OF_OFFICE_TYPES
+  std::vector<double> probabilities;
   bool attendance_new_file_type = false; //new file type gives attendance in intervals rather than in days
                                          //+ it assumes full attendance for days before intervention.
+  double probability(count_type day, OfficeType office_type) const {
+	return probabilities[day * GLOBAL.NUMBER_OF_OFFICE_TYPES + static_cast<count_type>(office_type)];
+  }
 };
 
 extern office_attendance ATTENDANCE;
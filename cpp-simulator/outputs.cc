@@ -5,6 +5,7 @@
 #include <fstream>
 #include <iostream>
 #include <string>
+#include <sstream>
 #include <cassert>
 
 using std::string;
@@ -86,11 +87,7 @@ string intervention_rep(Intervention i){
 
 const std::string CSV_TERM = "\n";
 const char CSV_SEP = ',';
-template <class T>
-void output_timed_csv(const std::vector<std::string>& field_row, const std::string& output_file, const timed_csv_data<T>& mat){
-  std::ofstream fout(output_file, std::ios::out);
-  check_stream(fout, output_file);
-
+void output_timed_csv_header(std::ostream& fout, const std::vector<std::string>& field_row){
   fout << "Time" << CSV_SEP;
   auto end = field_row.end();
   auto penultimate = end - 1;
@@ -101,17 +98,30 @@ void output_timed_csv(const std::vector<std::string>& field_row, const std::stri
 	}
   }
   fout << CSV_TERM;
-  for(const auto& row: mat){
-	auto end = std::get<1>(row).end();
-	auto penultimate = end - 1;
-	fout << double(std::get<0>(row))/GLOBAL.SIM_STEPS_PER_DAY << CSV_SEP;
-	for(auto it = std::get<1>(row).begin(); it < end; ++it){
-	  fout << *it;
-	  if(it != penultimate){
-		fout<< CSV_SEP;
-	  }
+}
+
+template <class T>
+void output_timed_csv_row(std::ostream& fout, const timed_csv_row<T>& row){
+  auto end = std::get<1>(row).end();
+  auto penultimate = end - 1;
+  fout << double(std::get<0>(row))/GLOBAL.SIM_STEPS_PER_DAY << CSV_SEP;
+  for(auto it = std::get<1>(row).begin(); it < end; ++it){
+	fout << *it;
+	if(it != penultimate){
+	  fout<< CSV_SEP;
 	}
-	fout << CSV_TERM;
+  }
+  fout << CSV_TERM;
+}
+
+template <class T>
+void output_timed_csv(const std::vector<std::string>& field_row, const std::string& output_file, const timed_csv_data<T>& mat){
+  std::ofstream fout(output_file, std::ios::out);
+  check_stream(fout, output_file);
+
+  output_timed_csv_header(fout, field_row);
+  for(const auto& row: mat){
+	output_timed_csv_row(fout, row);
   }
   fout.close();
 }
@@ -234,6 +244,18 @@ void output_global_params(const string& output_dir){
   fout << "WARD_CONTAINMENT_THRESHOLD: " <<GLOBAL.WARD_CONTAINMENT_THRESHOLD << ";"<< endl;
   fout << "ENABLE_CONTAINMENT: " <<GLOBAL.ENABLE_CONTAINMENT << ";"<< endl;
   fout << "ENABLE_NBR_CELLS: " <<GLOBAL.ENABLE_NBR_CELLS << ";"<< endl;
+  fout << "COMMUNITY_KERNEL_SPARSITY_THRESHOLD: " << GLOBAL.COMMUNITY_KERNEL_SPARSITY_THRESHOLD << ";" << endl;
+  fout << "EVENT_DRIVEN_PROGRESSION: " << GLOBAL.EVENT_DRIVEN_PROGRESSION << ";" << endl;
+  fout << "INCREMENTAL_KAPPA_UPDATES: " << GLOBAL.INCREMENTAL_KAPPA_UPDATES << ";" << endl;
+  fout << "INDEXED_CONTACT_TRACING: " << GLOBAL.INDEXED_CONTACT_TRACING << ";" << endl;
+  fout << "RECORD_PHASE_TIMES: " << GLOBAL.RECORD_PHASE_TIMES << ";" << endl;
+  fout << "STREAM_OUTPUTS: " << GLOBAL.STREAM_OUTPUTS << ";" << endl;
+  fout << "output_series: ";
+  for(const auto& name: GLOBAL.output_series){
+	fout << name << " ";
+  }
+  fout << ";" << endl;
+  fout << "SKIP_PLOT_SCRIPTS: " << GLOBAL.SKIP_PLOT_SCRIPTS << ";" << endl;
 
   //Neighborhood containment
   fout << "ENABLE_NEIGHBORHOOD_SOFT_CONTAINMENT: "
@@ -257,11 +279,14 @@ void output_global_params(const string& output_dir){
     fout << "COHORT_SEVERITY_FRACTION: " << GLOBAL.COHORT_SEVERITY_FRACTION << ";" <<endl;
     fout << "COHORT_STRATEGY: " << (int)GLOBAL.COHORT_STRATEGY << ";" <<endl;
     fout << "TAKING_TRAIN_FRACTION: " << GLOBAL.taking_train_fraction << ";" <<endl;
+    fout << "train_cache_filename: " << GLOBAL.train_cache_filename << ";" <<endl;
   }
 
   // store or load state.
   fout << "STORE_STATE_TIME_STEP: " << GLOBAL.STORE_STATE_TIME_STEP << ";" <<endl;
   fout << "LOAD_STATE_TIME_STEP: " << GLOBAL.LOAD_STATE_TIME_STEP << ";" <<endl;
+  fout << "CHECKPOINT_TIME_STEP: " << GLOBAL.CHECKPOINT_TIME_STEP << ";" <<endl;
+  fout << "restore_checkpoint: " << GLOBAL.restore_checkpoint << ";" <<endl;
   fout << "ONE_OFF_TRAVELERS_RATIO: " << GLOBAL.ONE_OFF_TRAVELERS_RATIO << ";" <<endl;
 
 
@@ -288,7 +313,11 @@ void output_global_params(const string& output_dir){
 }
 
 
-gnuplot::gnuplot(const std::string& output_directory){
+gnuplot::gnuplot(const std::string& output_directory):
+  enabled(!GLOBAL.SKIP_PLOT_SCRIPTS){
+  if(!enabled){
+	return;
+  }
   std::string gnuplot_script_path = output_directory + "/gnuplot_script.gnuplot";
   fout.open(gnuplot_script_path);
   check_stream(fout, gnuplot_script_path);
@@ -309,6 +338,9 @@ gnuplot::gnuplot(const std::string& output_directory){
 }
 
 void gnuplot::plot_data(const string& name){
+  if(!enabled){
+	return;
+  }
   auto image_name = name + ".png";
   fout << "set output \"" << image_name << "\"" << std::endl;
   fout << "set title \"" <<  name << "\"" << std::endl;
@@ -317,160 +349,235 @@ void gnuplot::plot_data(const string& name){
 }
 
 gnuplot::~gnuplot(){
+  if(!enabled){
+	return;
+  }
   fout.close();
   html_out << "\n</body>\n</html>\n";
   html_out.close();
 }
 
 
-void output_csv_files(const std::string& output_directory,
-					  gnuplot& gnuplot,
-					  const plot_data_struct& plot_data){
-  for(const auto& elem: plot_data.nums){
-	std::string csvfile_name = elem.first + ".csv";
-	std::string csvfile_path = output_directory + "/" + csvfile_name;
-	if(elem.first == "csvContent"){
-	  //This file contains everything!
-	  output_timed_csv({"community",
-						"affected",
-						"susceptible",
-						"exposed",
-						"infective",
-						"symptomatic",
-						"hospitalised",
-						"critical",
-						"dead",
-						"recovered",
-						"recovered_from_infective",
-						"recovered_from_symptomatic",
-						"recovered_from_hospitalised",
-						"recovered_from_critical",
-						"hd_area_affected",
-						"hd_area_susceptible",
-						"hd_area_exposed",
-                        "hd_area_infective",
-						"hd_area_symptomatic",
-                        "hd_area_hospitalised",
-                        "hd_area_critical",
-                        "hd_area_dead",
-						"hd_area_recovered",
-						"hd_area_recovered_from_infective",
-						"hd_area_recovered_from_symptomatic",
-						"hd_area_recovered_from_hospitalised",
-						"hd_area_recovered_from_critical"
-		},
-		csvfile_path, elem.second);
-	} else {
-	  output_timed_csv({elem.first},
-					   csvfile_path,
-					   elem.second);
-	  gnuplot.plot_data(elem.first);
-	}
+std::vector<std::string> csv_field_row(const std::string& name){
+  if(name == "csvContent"){
+	//This file contains everything!
+	return {"community",
+			"affected",
+			"susceptible",
+			"exposed",
+			"infective",
+			"symptomatic",
+			"hospitalised",
+			"critical",
+			"dead",
+			"recovered",
+			"recovered_from_infective",
+			"recovered_from_symptomatic",
+			"recovered_from_hospitalised",
+			"recovered_from_critical",
+			"hd_area_affected",
+			"hd_area_susceptible",
+			"hd_area_exposed",
+			"hd_area_infective",
+			"hd_area_symptomatic",
+			"hd_area_hospitalised",
+			"hd_area_critical",
+			"hd_area_dead",
+			"hd_area_recovered",
+			"hd_area_recovered_from_infective",
+			"hd_area_recovered_from_symptomatic",
+			"hd_area_recovered_from_hospitalised",
+			"hd_area_recovered_from_critical"};
   }
-
-  //Now output lambdas
-  for(const auto& elem: plot_data.susceptible_lambdas){
-	std::string csvfile_name = elem.first + ".csv";
-	std::string csvfile_path = output_directory + "/" + csvfile_name;
-	output_timed_csv({elem.first},
-					 csvfile_path,
-					 elem.second);
-	gnuplot.plot_data(elem.first);
+  if(name == "quarantined_stats"){
+	return {"quarantined_individuals",
+			"quarantined_infectious",
+			"quarantined_cases","quarantined_individuals_cohorts","quarantined_infectious_cohorts"};
   }
-
-  //Now output fractional lambda contributions: total version
-  for(const auto& elem: plot_data.total_lambda_fractions){
-	std::string csvfile_name = elem.first + ".csv";
-	std::string csvfile_path = output_directory + "/" + csvfile_name;
-	output_timed_csv({elem.first},
-					 csvfile_path,
-					 elem.second);
-	gnuplot.plot_data(elem.first);
+  if(name == "curtailment_stats"){
+	return {"normal_interactions",
+			"curtailed_interactions"};
   }
-
-  //Now output fractional lambda contributions: mean version
-  for(const auto& elem: plot_data.mean_lambda_fractions){
-	std::string csvfile_name = elem.first + ".csv";
-	std::string csvfile_path = output_directory + "/" + csvfile_name;
-	output_timed_csv({elem.first},
-					 csvfile_path,
-					 elem.second);
-	gnuplot.plot_data(elem.first);
+  if(name == "disease_label_stats"){
+	return {"primary_contact",
+			"mild_symptomatic_tested",
+			"moderate_symptomatic_tested",
+			"severe_symptomatic_tested",
+			"icu","requested_tests","cumulative_positive_cases"};
   }
-
-  //Now output fractional lambda contributions: cumulative mean version
-  for(const auto& elem: plot_data.cumulative_mean_lambda_fractions){
-	std::string csvfile_name = elem.first + ".csv";
-	std::string csvfile_path = output_directory + "/" + csvfile_name;
-	output_timed_csv({elem.first},
-					 csvfile_path,
-					 elem.second);
-	gnuplot.plot_data(elem.first);
+  if(name == "coach_stats"){
+	return {"train_coaches_am",
+			"train_coaches_pm"};
+  }
+  if(name == "contact_tracing_stats"){
+	//Columns in the order of contact_tracing_counters::row()
+	return {"index_cases",
+			"traced_household",
+			"traced_workplace",
+			"traced_random_community",
+			"traced_nbr_cell",
+			"tests_requested"};
   }
+  if(name == "phase_times"){
+	//Columns in the order of timestep_phase in simulator.cc
+	return {"attendance",
+			"infection",
+			"kappa",
+			"testing",
+			"train_coaches",
+			"cohorts",
+			"location_lambdas",
+			"community_lambdas",
+			"nbr_cell_lambdas",
+			"agent_lambdas",
+			"statistics",
+			"outputs",
+			"total"};
+  }
+  return {name};
+}
 
-  //Now output infections by individuals that became infective at this time
-  for(const auto& elem: plot_data.infections_by_new_infectives){
-	std::string csvfile_name = elem.first + ".csv";
-	std::string csvfile_path = output_directory + "/" + csvfile_name;
-	output_timed_csv({elem.first},
-					 csvfile_path,
-					 elem.second);
-	gnuplot.plot_data(elem.first);
+std::vector<std::string> split_output_series(const std::string& names){
+  std::vector<std::string> series;
+  std::istringstream stream(names);
+  std::string name;
+  while(std::getline(stream, name, ',')){
+	if(!name.empty()){
+	  series.push_back(name);
+	}
   }
+  return series;
+}
 
-  for(const auto& elem: plot_data.quarantined_stats){
-    std::string csvfile_name = elem.first + ".csv";
-    std::string csvfile_path = output_directory + "/" + csvfile_name;
-    //This file contains quarantine_stats
-    output_timed_csv({"quarantined_individuals",
-            "quarantined_infectious",
-            "quarantined_cases","quarantined_individuals_cohorts","quarantined_infectious_cohorts"},
-    csvfile_path, elem.second);
+bool csv_series_selected(const std::string& name){
+  if(GLOBAL.output_series.empty()){
+	return true;
+  }
+  for(const auto& pattern: GLOBAL.output_series){
+	if(!pattern.empty() && pattern.back() == '*'){
+	  if(name.compare(0, pattern.size() - 1, pattern, 0, pattern.size() - 1) == 0){
+		return true;
+	  }
+	}
+	else if(name == pattern){
+	  return true;
+	}
   }
+  return false;
+}
 
-  for(const auto& elem: plot_data.curtailment_stats){
-    std::string csvfile_name = elem.first + ".csv";
-    std::string csvfile_path = output_directory + "/" + csvfile_name;
-    //This file contains quarantine_stats
-    output_timed_csv({"normal_interactions",
-            "curtailed_interactions"},
-    csvfile_path, elem.second);
+bool csv_series_enabled(const std::string& name){
+  if(!csv_series_selected(name)){
+	return false;
   }
-  for(const auto& elem: plot_data.disease_label_stats){
-    std::string csvfile_name = elem.first + ".csv";
-    std::string csvfile_path = output_directory + "/" + csvfile_name;
-    //This file contains quarantine_stats
-    output_timed_csv({"primary_contact",
-            "mild_symptomatic_tested",
-            "moderate_symptomatic_tested",
-            "severe_symptomatic_tested",
-            "icu","requested_tests","cumulative_positive_cases"},
-    csvfile_path, elem.second);
+  if(name == "coach_stats"){
+	return GLOBAL.ENABLE_COHORTS;
   }
-  for(const auto& elem: plot_data.ward_wise_stats){
-	std::string csvfile_name = elem.first + ".csv";
-	std::string csvfile_path = output_directory + "/" + csvfile_name;
-	output_timed_csv({elem.first}, csvfile_path, elem.second);	
+  if(name == "contact_tracing_stats"){
+	return GLOBAL.ENABLE_TESTING;
   }
+  if(name == "phase_times"){
+	return GLOBAL.RECORD_PHASE_TIMES;
+  }
+  return true;
+}
 
-  if(GLOBAL.ENABLE_COHORTS){
-    for(const auto& elem: plot_data.coach_stats){
-      std::string csvfile_name = elem.first + ".csv";
-      std::string csvfile_path = output_directory + "/" + csvfile_name;
-      //This file contains quarantine_stats
-      output_timed_csv({"train_coaches_am",
-                        "train_coaches_pm"},
-                       csvfile_path, elem.second);
-    }
+namespace {
+  //Writes each series of a plot_data group to its CSV file, unless it was
+  //streamed already, and adds it to the gnuplot script if plot is set
+  template <class T>
+  void output_csv_group(const std::string& output_directory,
+						gnuplot& gnuplot,
+						const std::map<std::string, timed_csv_data<T>>& group,
+						bool plot){
+	for(const auto& elem: group){
+	  if(!csv_series_enabled(elem.first)){
+		continue;
+	  }
+	  if(!GLOBAL.STREAM_OUTPUTS){
+		std::string csvfile_path = output_directory + "/" + elem.first + ".csv";
+		output_timed_csv(csv_field_row(elem.first), csvfile_path, elem.second);
+	  }
+	  if(plot && elem.first != "csvContent"){
+		gnuplot.plot_data(elem.first);
+	  }
+	}
   }
+}
+
+void output_csv_files(const std::string& output_directory,
+					  gnuplot& gnuplot,
+					  const plot_data_struct& plot_data){
+  output_csv_group(output_directory, gnuplot, plot_data.nums, true);
+
+  //Now output lambdas
+  output_csv_group(output_directory, gnuplot, plot_data.susceptible_lambdas, true);
+
+  //Now output fractional lambda contributions: total, mean and cumulative
+  //mean versions
+  output_csv_group(output_directory, gnuplot, plot_data.total_lambda_fractions, true);
+  output_csv_group(output_directory, gnuplot, plot_data.mean_lambda_fractions, true);
+  output_csv_group(output_directory, gnuplot, plot_data.cumulative_mean_lambda_fractions, true);
+
+  //Now output infections by individuals that became infective at this time
+  output_csv_group(output_directory, gnuplot, plot_data.infections_by_new_infectives, true);
+
+  output_csv_group(output_directory, gnuplot, plot_data.quarantined_stats, false);
+  output_csv_group(output_directory, gnuplot, plot_data.curtailment_stats, false);
+  output_csv_group(output_directory, gnuplot, plot_data.disease_label_stats, false);
+  output_csv_group(output_directory, gnuplot, plot_data.ward_wise_stats, false);
+  output_csv_group(output_directory, gnuplot, plot_data.coach_stats, false);
+  output_csv_group(output_directory, gnuplot, plot_data.contact_tracing_stats, false);
 
   // Add daily and cumulative tracking data output
-  for(const auto& elem: plot_data.daily_cumulative_stats){
-    std::string csvfile_name = elem.first + ".csv";
-    std::string csvfile_path = output_directory + "/" + csvfile_name;
-    output_timed_csv({elem.first},
-                     csvfile_path,
-                     elem.second);
-    gnuplot.plot_data(elem.first);
+  output_csv_group(output_directory, gnuplot, plot_data.daily_cumulative_stats, true);
+  output_csv_group(output_directory, gnuplot, plot_data.phase_times, false);
+}
+
+csv_stream::csv_stream(const std::string& output_directory):
+  output_directory(output_directory){}
+
+template <class T>
+void csv_stream::write_group(std::map<std::string, timed_csv_data<T>>& group){
+  for(auto& elem: group){
+	if(!csv_series_enabled(elem.first)){
+	  continue;
+	}
+	auto& file = files[elem.first];
+	if(!file.fout.is_open()){
+	  file.buffer.resize(BUFFER_SIZE);
+	  file.fout.rdbuf()->pubsetbuf(file.buffer.data(), file.buffer.size());
+	  std::string csvfile_path = output_directory + "/" + elem.first + ".csv";
+	  file.fout.open(csvfile_path, std::ios::out);
+	  check_stream(file.fout, csvfile_path);
+	  output_timed_csv_header(file.fout, csv_field_row(elem.first));
+	}
+	for(const auto& row: elem.second){
+	  output_timed_csv_row(file.fout, row);
+	}
+	elem.second.clear();
   }
-}
\ No newline at end of file
+}
+
+void csv_stream::write_rows(plot_data_struct& plot_data){
+  write_group(plot_data.nums);
+  write_group(plot_data.susceptible_lambdas);
+  write_group(plot_data.total_lambda_fractions);
+  write_group(plot_data.mean_lambda_fractions);
+  write_group(plot_data.cumulative_mean_lambda_fractions);
+  write_group(plot_data.infections_by_new_infectives);
+  write_group(plot_data.quarantined_stats);
+  write_group(plot_data.curtailment_stats);
+  write_group(plot_data.disease_label_stats);
+  write_group(plot_data.ward_wise_stats);
+  write_group(plot_data.coach_stats);
+  write_group(plot_data.contact_tracing_stats);
+  write_group(plot_data.daily_cumulative_stats);
+  write_group(plot_data.phase_times);
+}
+
+void csv_stream::flush(){
+  for(auto& elem: files){
+	elem.second.fout.flush();
+  }
+}
@@ -31,15 +31,34 @@ struct plot_data_struct{
   std::map<std::string, timed_csv_data<int>> ward_wise_stats;
 
   std::map<std::string, timed_csv_data<int>> coach_stats;
+
+  //Contacts traced and tested in each timestep, with ENABLE_TESTING
+  std::map<std::string, timed_csv_data<count_type>> contact_tracing_stats;
   
   // Add this new line for daily/cumulative tracking data
   std::map<std::string, timed_csv_data<count_type>> daily_cumulative_stats;
+
+  //Wall time (ms) of the phases of each timestep, with RECORD_PHASE_TIMES.
+  //Not part of the simulator state, so not stored in checkpoints.
+  std::map<std::string, timed_csv_data<double>> phase_times;
 };
 
 
 template <class T>
 void output_timed_csv(const std::vector<std::string>& field_row, const std::string& output_file, const timed_csv_data<T>& mat);
 
+//Column names, after Time, of the CSV file of the named plot_data series
+std::vector<std::string> csv_field_row(const std::string& name);
+
+//Splits a comma-separated list of output series names
+std::vector<std::string> split_output_series(const std::string& names);
+
+//Whether the named plot_data series is selected by output_series
+bool csv_series_selected(const std::string& name);
+
+//Whether the named plot_data series is written out in this run
+bool csv_series_enabled(const std::string& name);
+
 void output_global_params(const std::string& filename);
 
 struct gnuplot{
@@ -49,12 +68,43 @@ public:
   ~gnuplot();
   
 private:
+  //False with SKIP_PLOT_SCRIPTS, in which case nothing is written
+  bool enabled;
   std::ofstream fout;
   std::ofstream html_out;
 };
 
 void output_csv_files(const std::string& output_directory, gnuplot& gnuplot, const plot_data_struct& plot_data);
 
+//With STREAM_OUTPUTS, run_simulation appends the rows of the plot_data
+//series to their CSV files as each timestep completes, instead of keeping
+//them in memory for output_csv_files. Memory use then does not grow with
+//NUM_TIMESTEPS, and the rows written so far are usable if the run is killed.
+class csv_stream{
+public:
+  explicit csv_stream(const std::string& output_directory);
+
+  //Appends the rows added to plot_data since the last call, and removes them
+  //from plot_data. Files are created, with their header, on the first call.
+  void write_rows(plot_data_struct& plot_data);
+
+  void flush();
+
+private:
+  static constexpr std::size_t BUFFER_SIZE = 1 << 16;
+
+  struct buffered_file{
+	std::vector<char> buffer;
+	std::ofstream fout;
+  };
+
+  template <class T>
+  void write_group(std::map<std::string, timed_csv_data<T>>& group);
+
+  std::string output_directory;
+  std::map<std::string, buffered_file> files;
+};
+
 void check_stream(const std::ofstream& fout, const std::string& path);
 
 #endif
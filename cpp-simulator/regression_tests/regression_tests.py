@@ -80,38 +80,46 @@ def launch_regression(regression_tests):
 		launch_test(test['test_options'],test['test_flags'])
 ###################
 
-def compare_regressions():
-	result_array=[]
+def compare_test_files(reference_directory, output_directory, f, reference_root='reference_files', suffix=''):
+	test_pass = True
+	for reference_file in os.listdir(os.path.join(reference_root,reference_directory)):
+		if(not reference_file.endswith(suffix)):
+			continue
+		ref_file=os.path.join(reference_root,reference_directory,reference_file)
+		test_file =os.path.join('output_files',output_directory,reference_file)
+		if(os.path.exists(test_file)):
+			if(not filecmp.cmp(ref_file,test_file)):
+				temp= ref_file +" "+ test_file + " differ."
+				f.writelines(temp + "\n")
+				print(temp)
+				test_pass=False
+		else:
+			temp= test_file +" does not exist"
+			f.writelines(temp + "\n")
+			print(temp)
+			test_pass=False
+	if(test_pass):
+		temp="Test : " + output_directory + ": PASS"
+	else:
+		temp="Test : " + output_directory + ": FAIL"
+	print (temp)
+	f.writelines(temp + "\n")
+
+def compare_regressions(regression_tests):
 	f = open("regression_results.txt", "w")
 	for reference_directory in sorted(os.listdir('reference_files')):
-			test_pass = True
-			for reference_file in os.listdir(os.path.join('reference_files',reference_directory)):
-				ref_file=os.path.join('reference_files',reference_directory,reference_file)
-				test_file =os.path.join('output_files',reference_directory,reference_file)
-				if(os.path.exists(test_file)):
-					if(not filecmp.cmp(ref_file,test_file)):
-						temp= ref_file +" "+ test_file + " differ."
-						f.writelines(temp + "\n")
-						print(temp)
-						test_pass=False
-				else:
-					temp= test_file +" does not exist"
-					f.writelines(temp + "\n")
-					print(temp)
-					test_pass=False
-			if(test_pass):
-				temp="Test : " + reference_directory + ": PASS"
-				print (temp)
-				f.writelines(temp + "\n")
-			else:
-				temp="Test : " + reference_directory + ": FAIL"
-				print (temp)
-				f.writelines(temp + "\n")
-	
+		compare_test_files(reference_directory, reference_directory, f)
+	# Tests that must reproduce the outputs of another test
+	for test in regression_tests:
+		if('reference_id' in test):
+			compare_test_files(test['reference_id'], test['test_id'], f)
+	# Tests that must reproduce the CSV outputs of another test of this run
+	for test in regression_tests:
+		if('output_reference_id' in test):
+			compare_test_files(test['output_reference_id'], test['test_id'], f, 'output_files', '.csv')
 	f.close()
 	
 
-
 regression_tests= []
 
 ###############################################
@@ -296,6 +304,38 @@ current_test['test_flags'] = test_flags
 regression_tests.append(current_test)
 ## end of regresstion test addition
 
+## configure a new regression test
+# Same as smaller_networks_testing_002, long enough for the home quarantine of
+# tested and traced agents to expire. Its incremental kappa rerun below is
+# compared against its outputs.
+current_test={}
+test_id = 'smaller_networks_testing_002_60_days'
+
+test_options = default_options.copy()
+test_options['--output_directory'] += test_id
+test_options['--NUM_DAYS'] = 60
+test_options['--INTERVENTION'] = 15
+test_options['--WARD_CONTAINMENT_THRESHOLD'] = 0
+test_options['--BETA_CLASS']=0.1
+test_options['--BETA_PROJECT']=0.1
+test_options['--BETA_RANDOM_COMMUNITY']=0.1
+test_options['--BETA_NBR_CELLS']=0.1
+test_options['--PROVIDE_INITIAL_SEED_GRAPH']=4123
+test_options['--TESTING_PROTOCOL']=2
+test_options['--testing_protocol_filename']='../../../../cpp-simulator/regression_tests/input_files/testing_protocol_002.json'
+
+test_flags = default_flags.copy()
+test_flags['--ENABLE_CONTAINMENT'] = True
+test_flags['--ENABLE_NBR_CELLS'] = True
+test_flags['--ENABLE_TESTING'] = True
+
+current_test['test_id'] = test_id
+current_test['test_options'] = test_options
+current_test['test_flags'] = test_flags
+
+regression_tests.append(current_test)
+## end of regresstion test addition
+
 
 
 ## configure a new regression test
@@ -562,14 +602,115 @@ current_test['test_flags'] = test_flags
 
 regression_tests.append(current_test)
 
+### Checkpoint of a run with an intervention file, taken after the
+### interventions have started
+current_test={}
+test_id = 'checkpoint_store'
+
+test_options = default_options.copy()
+test_options['--output_directory'] += test_id
+test_options['--INTERVENTION'] = 16
+test_options['--intervention_filename']='../../../../cpp-simulator/regression_tests/input_files/intervention_07.json'
+test_options['--PROVIDE_INITIAL_SEED_GRAPH']=4123
+test_options['--CHECKPOINT_TIME_STEP'] = 41
+
+test_flags = default_flags.copy()
+
+current_test['test_id'] = test_id
+current_test['test_options'] = test_options
+current_test['test_flags'] = test_flags
+
+regression_tests.append(current_test)
+
+### Restore the checkpoint; the outputs must match the uninterrupted run.
+### NOTE: This is dependent on the checkpoint_store regression's output
+current_test={}
+test_id = 'checkpoint_restore'
+
+test_options = default_options.copy()
+test_options['--output_directory'] += test_id
+test_options['--INTERVENTION'] = 16
+test_options['--intervention_filename']='../../../../cpp-simulator/regression_tests/input_files/intervention_07.json'
+test_options['--PROVIDE_INITIAL_SEED_GRAPH']=4123
+test_options['--restore_checkpoint'] = './output_files/checkpoint_store/checkpoint.bin'
+
+test_flags = default_flags.copy()
+
+current_test['test_id'] = test_id
+current_test['test_options'] = test_options
+current_test['test_flags'] = test_flags
+current_test['output_reference_id'] = 'checkpoint_store'
+
+regression_tests.append(current_test)
+
+### Checkpoint of the cohorts_base run in the middle of a day, while the
+### cohorts ride the coaches built at the start of the day
+current_test={}
+test_id = 'cohorts_checkpoint_store'
+
+test_options = cohort_options.copy()
+test_options['--output_directory'] = test_options['--output_directory'][:-len('cohorts_base')] + test_id
+test_options['--CHECKPOINT_TIME_STEP'] = 103
+
+current_test['test_id'] = test_id
+current_test['test_options'] = test_options
+current_test['test_flags'] = cohort_flags.copy()
+
+regression_tests.append(current_test)
+
+### Restore the cohort checkpoint; all outputs, coach_stats.csv included, must
+### match the uninterrupted run.
+### NOTE: This is dependent on the cohorts_checkpoint_store regression's output
+current_test={}
+test_id = 'cohorts_checkpoint_restore'
+
+test_options = cohort_options.copy()
+test_options['--output_directory'] = test_options['--output_directory'][:-len('cohorts_base')] + test_id
+test_options['--restore_checkpoint'] = './output_files/cohorts_checkpoint_store/checkpoint.bin'
+
+current_test['test_id'] = test_id
+current_test['test_options'] = test_options
+current_test['test_flags'] = cohort_flags.copy()
+current_test['output_reference_id'] = 'cohorts_checkpoint_store'
+
+regression_tests.append(current_test)
+
 
 
 ## end of regresstion test addition
 
+## Incremental kappa updates must give the same outputs as recomputing the
+## kappas of every agent, so rerun the tests that do not load or store state
+## with INCREMENTAL_KAPPA_UPDATES and compare against the same references.
+for test in list(regression_tests):
+	if(test['test_id'] in ['store_state', 'load_state',
+						   'checkpoint_store', 'checkpoint_restore',
+						   'cohorts_checkpoint_store', 'cohorts_checkpoint_restore']):
+		continue
+	current_test={}
+	test_id = test['test_id']+'_incremental_kappa'
+
+	test_options = test['test_options'].copy()
+	test_options['--output_directory'] = test_options['--output_directory'][:-len(test['test_id'])] + test_id
+
+	test_flags = test['test_flags'].copy()
+	test_flags['--INCREMENTAL_KAPPA_UPDATES'] = True
+
+	current_test['test_id'] = test_id
+	current_test['test_options'] = test_options
+	current_test['test_flags'] = test_flags
+	# Tests without reference files are compared against their own outputs
+	if(os.path.isdir(os.path.join('reference_files', test['test_id']))):
+		current_test['reference_id'] = test['test_id']
+	else:
+		current_test['output_reference_id'] = test['test_id']
+
+	regression_tests.append(current_test)
+
 #remove old output files
 # os.system('rm -rf ./output_files/')
 
 # Launch all regresstion tests
 launch_regression(regression_tests)
 
-compare_regressions()
+compare_regressions(regression_tests)
@@ -4,6 +4,8 @@
 #include <algorithm>
 #include <map>
 #include <string>
+#include <limits>
+#include <chrono>
 
 #include "models.h"
 #include "initializers.h"
@@ -11,6 +13,7 @@
 #include "simulator.h"
 #include "testing.h"
 #include "cohorts.h"
+#include "checkpoint.h"
 
 using std::string;
 using std::vector;
@@ -39,6 +42,93 @@ int num_coaches(const std::unordered_map<count_type, std::vector<train_coach>>&
 	}
 	return i;
 }
+
+// Agents per block in the statistics pass of run_simulation
+#ifdef _OPENMP
+const count_type STATS_BLOCK_SIZE = 1 << 14;
+#else
+const count_type STATS_BLOCK_SIZE = std::numeric_limits<count_type>::max() / 2;
+#endif
+
+// Partial sums of the statistics pass over one block of agents
+struct stats_partial_sums
+{
+	double susceptible_lambda = 0;
+	double H = 0;
+	double W = 0;
+	double C = 0;
+	double T = 0;
+	double PROJECT = 0;
+	double NBR_CELL = 0;
+	double RANDOM_COMMUNITY = 0;
+	double curtailed_interaction = 0;
+	double normal_interaction = 0;
+};
+
+// Phases of a timestep recorded with RECORD_PHASE_TIMES, in the column order
+// of phase_times.csv
+enum class timestep_phase : count_type
+{
+	attendance = 0,
+	infection,
+	kappa,
+	testing,
+	train_coaches,
+	cohorts,
+	location_lambdas,
+	community_lambdas,
+	nbr_cell_lambdas,
+	agent_lambdas,
+	statistics,
+	outputs,
+	num_phases
+};
+
+// Wall time (ms) of the phases of one timestep. Each call to lap charges the
+// time since the previous lap, or since start, to a phase. Without
+// RECORD_PHASE_TIMES the calls do nothing.
+class phase_timer
+{
+public:
+	void start()
+	{
+		if (!GLOBAL.RECORD_PHASE_TIMES)
+		{
+			return;
+		}
+		times.assign(static_cast<count_type>(timestep_phase::num_phases) + 1, 0);
+		step_start = last = clock::now();
+	}
+
+	void lap(timestep_phase phase)
+	{
+		if (!GLOBAL.RECORD_PHASE_TIMES)
+		{
+			return;
+		}
+		auto now = clock::now();
+		times[static_cast<count_type>(phase)] += milliseconds(last, now);
+		last = now;
+	}
+
+	// Phase times followed by the total time since start
+	const std::vector<double>& finish()
+	{
+		times.back() = milliseconds(step_start, clock::now());
+		return times;
+	}
+
+private:
+	using clock = std::chrono::steady_clock;
+
+	static double milliseconds(clock::time_point start, clock::time_point end)
+	{
+		return std::chrono::duration<double, std::milli>(end - start).count();
+	}
+
+	std::vector<double> times;
+	clock::time_point step_start, last;
+};
 }
 
 plot_data_struct run_simulation()
@@ -52,22 +142,35 @@ plot_data_struct run_simulation()
 	auto workplaces = init_workplaces();
 	auto communities = init_community();
 	auto nodes = init_nodes();
-	auto nbr_cells = init_nbr_cells();
-	auto intv_params = init_intervention_params();
+	auto nbr_cells = init_nbr_cells(homes);
+	auto intv_schedule = compile_intervention_schedule(init_intervention_params());
 	auto testing_protocol_file_read = init_testing_protocol();
 	auto train_loader = init_TrainLoader();
 	auto cohorts = make_cohorts(nodes, GLOBAL.COHORT_SIZE, train_loader);
 	// std::cout<<"\nNum Cohorts: " << get_num_cohorts(cohorts)<< std::endl;
 	auto one_off_cohorts = make_oneoff_cohorts(nodes, train_loader);
 	// std::cout<<"One Off Cohorts: " << get_num_cohorts(one_off_cohorts)<< std::endl;
-	merge_cohorts(cohorts, one_off_cohorts);
+	merge_cohorts(cohorts, std::move(one_off_cohorts));
 	// std::cout<<"Merged Cohorts: " << get_num_cohorts(cohorts)<< std::endl;
 	bool coaches_created = false;
+	train_coach_builder coach_builder(train_loader);
 	std::unordered_map<count_type, std::vector<train_coach>> train_coaches_am;
 	std::unordered_map<count_type, std::vector<train_coach>> train_coaches_pm;
+	// Regular and one-off cohorts share the coaches of each trip
+	auto build_train_coaches = [&]()
+	{
+		coach_builder.clear(train_coaches_am);
+		coach_builder.add_coaches(cohorts, true, false, train_coaches_am);
+		coach_builder.add_coaches(cohorts, true, true, train_coaches_am);
+
+		coach_builder.clear(train_coaches_pm);
+		coach_builder.add_coaches(cohorts, false, false, train_coaches_pm);
+		coach_builder.add_coaches(cohorts, false, true, train_coaches_pm);
+	};
 
 	auto community_dist_matrix = compute_community_distances(communities);
 	auto community_fk_matrix = compute_community_distances_fkernel(community_dist_matrix);
+	auto community_fk_kernel = compute_community_kernel(community_fk_matrix);
 
 	svd home_age_matrix,
 		school_age_matrix,
@@ -81,6 +184,12 @@ plot_data_struct run_simulation()
 		workplace_age_matrix = init_workplace_age_interaction_matrix();
 		community_age_matrix = init_community_age_interaction_matrix();
 	}
+	location_age_mixing age_mixing;
+	if (GLOBAL.USE_AGE_DEPENDENT_MIXING)
+	{
+		age_mixing = init_location_age_mixing(homes, workplaces, home_age_matrix,
+											  school_age_matrix, workplace_age_matrix);
+	}
 
 #ifdef TIMING
 	auto end_time = std::chrono::high_resolution_clock::now();
@@ -91,6 +200,10 @@ plot_data_struct run_simulation()
 	assign_individual_home_community(nodes, homes, workplaces, communities);
 	//assign_individual_home_community must be called before assign_homes_nbr_cell
 	assign_homes_nbr_cell(homes, nbr_cells);
+	if (GLOBAL.INDEXED_CONTACT_TRACING)
+	{
+		index_nbr_cell_residents(nodes, homes, nbr_cells);
+	}
 	assign_individual_projects(workplaces, nodes);
 	assign_household_community(communities, nodes, homes);
 	assign_household_random_community(homes, communities);
@@ -162,8 +275,13 @@ plot_data_struct run_simulation()
 		elem.second.reserve(GLOBAL.NUM_TIMESTEPS);
 	}	
 
+	// Per-community rows are only kept if csvContent is to be written
+	const bool record_community_rows = csv_series_enabled("csvContent");
 	plot_data.nums["csvContent"] = {};
-	plot_data.nums["csvContent"].reserve(GLOBAL.NUM_TIMESTEPS * GLOBAL.num_communities);
+	if (record_community_rows && !GLOBAL.STREAM_OUTPUTS)
+	{
+		plot_data.nums["csvContent"].reserve(GLOBAL.NUM_TIMESTEPS * GLOBAL.num_communities);
+	}
 
 	plot_data.susceptible_lambdas =
 		{
@@ -227,6 +345,11 @@ plot_data_struct run_simulation()
 		{
 			{"coach_stats", {}},
 		};
+	plot_data.contact_tracing_stats =
+		{
+			{"contact_tracing_stats", {}},
+		};
+	const bool record_contact_tracing = csv_series_enabled("contact_tracing_stats");
 	std::cout << "plot done"<<std::endl;
 
 #ifdef TIMING
@@ -269,6 +392,50 @@ plot_data_struct run_simulation()
 	}
 	#endif
 
+	run_counters counters;
+	simulation_state state{nodes, homes, workplaces, communities, nbr_cells, cohorts,
+						   train_coaches_am, train_coaches_pm, coaches_created, counters, plot_data};
+	// home_ward_infected is a variable-length array, which lambdas and OpenMP
+	// array sections cannot name directly
+	int* ward_infected = home_ward_infected;
+	auto save_counters = [&]() {
+		counters.num_cases = num_cases;
+		counters.quarantined_num_cases = quarantined_num_cases;
+		counters.num_cumulative_hospitalizations = num_cumulative_hospitalizations;
+		counters.num_cumulative_infective = num_cumulative_infective;
+		counters.num_total_infections = num_total_infections;
+		counters.travel_fraction = travel_fraction;
+		counters.cumulative_mean_lambda_fraction_data = cumulative_mean_lambda_fraction_data;
+		counters.infections_by_new_infectives = infections_by_new_infectives;
+		counters.home_ward_infected.assign(ward_infected, ward_infected + GLOBAL.num_wards);
+	};
+	if (!GLOBAL.restore_checkpoint.empty())
+	{
+		if (!load_checkpoint(GLOBAL.restore_checkpoint, time_step_start, state))
+		{
+			std::cout << "ERROR: Restoring checkpoint failed" << std::endl;
+			return plot_data;
+		}
+		num_cases = counters.num_cases;
+		quarantined_num_cases = counters.quarantined_num_cases;
+		num_cumulative_hospitalizations = counters.num_cumulative_hospitalizations;
+		num_cumulative_infective = counters.num_cumulative_infective;
+		num_total_infections = counters.num_total_infections;
+		travel_fraction = counters.travel_fraction;
+		cumulative_mean_lambda_fraction_data = counters.cumulative_mean_lambda_fraction_data;
+		infections_by_new_infectives = counters.infections_by_new_infectives;
+		std::copy(counters.home_ward_infected.begin(), counters.home_ward_infected.end(), ward_infected);
+		std::cout << "Restored checkpoint at timestep " << time_step_start << std::endl;
+	}
+
+	progression_schedule schedule;
+	if (GLOBAL.EVENT_DRIVEN_PROGRESSION)
+	{
+		build_progression_schedule(schedule, nodes, time_step_start);
+	}
+
+	phase_timer timer;
+	csv_stream stream(GLOBAL.output_path);
 	for (count_type time_step = time_step_start; time_step < GLOBAL.NUM_TIMESTEPS; ++time_step)
 	{
 #ifdef DEBUG
@@ -284,6 +451,15 @@ plot_data_struct run_simulation()
 			std::cout << "Stored state" << std::endl;
 		}
 		#endif
+		if (GLOBAL.CHECKPOINT_TIME_STEP > 0 && time_step == GLOBAL.CHECKPOINT_TIME_STEP)
+		{
+			save_counters();
+			if (store_checkpoint(GLOBAL.output_path + "/" + GLOBAL.checkpoint_file, time_step, state))
+			{
+				std::cout << "Stored checkpoint at timestep " << time_step << std::endl;
+			}
+		}
+		timer.start();
 		if (time_step % GLOBAL.SIM_STEPS_PER_DAY == 0)
 		{
 			for (count_type j = 0; j < GLOBAL.num_people; ++j)
@@ -298,6 +474,7 @@ plot_data_struct run_simulation()
 			 // Reset daily counters at the start of each day
 			 reset_daily_counters();
 		}
+		timer.lap(timestep_phase::attendance);
 
 		//#pragma omp parallel for
 		//
@@ -305,7 +482,7 @@ plot_data_struct run_simulation()
 		// global state, parallelizing this loop is not straightforward.
 		// Puttting the generator in a critical section can keep it
 		// correct, but slows down the code too much.
-		for (count_type j = 0; j < NUM_PEOPLE; ++j)
+		auto update_node = [&](count_type j)
 		{
 			auto node_update_status = update_infection(nodes[j], time_step);
 			nodes[j].psi_T = psi_T(nodes[j], time_step);
@@ -340,9 +517,38 @@ plot_data_struct run_simulation()
 			{
 				++num_cumulative_infective;
 			}
+		};
+
+		if (GLOBAL.EVENT_DRIVEN_PROGRESSION)
+		{
+			// Skipped agents are not infective and have no transition due,
+			// so update_infection would leave them unchanged apart from
+			// drawing a random number for susceptibles with zero lambda.
+			for_each_agent_to_update(schedule, nodes, time_step, [&](count_type j)
+			{
+				auto previous_status = nodes[j].infection_status;
+				update_node(j);
+				if (nodes[j].infection_status != previous_status)
+				{
+					schedule_next_transition(schedule, nodes[j], j, time_step);
+				}
+				if (nodes[j].infective)
+				{
+					schedule.infective.push_back(j);
+				}
+			});
+		}
+		else
+		{
+			for (count_type j = 0; j < NUM_PEOPLE; ++j)
+			{
+				update_node(j);
+			}
 		}
+		timer.lap(timestep_phase::infection);
 
-		update_all_kappa(nodes, homes, workplaces, communities, nbr_cells, intv_params, time_step);
+		update_all_kappa(nodes, homes, workplaces, communities, nbr_cells, intv_schedule, time_step);
+		timer.lap(timestep_phase::kappa);
 
 		// std::cout << "update_all_kappa done"<<std::endl;
 		if (GLOBAL.ENABLE_TESTING)
@@ -350,7 +556,12 @@ plot_data_struct run_simulation()
 			update_test_status(nodes, time_step);
 			update_infection_testing(nodes, homes, time_step);
 			update_test_request(nodes, homes, workplaces, communities, nbr_cells, time_step, testing_protocol_file_read);
+			if (record_contact_tracing)
+			{
+				plot_data.contact_tracing_stats["contact_tracing_stats"].push_back({time_step, TRACING_COUNTERS.row()});
+			}
 		}
+		timer.lap(timestep_phase::testing);
 		if (GLOBAL.ENABLE_COHORTS && GLOBAL.TRAINS_RUNNING)
 		{
 			cohort_strategy current_strategy = GLOBAL.COHORT_STRATEGY;
@@ -358,34 +569,15 @@ plot_data_struct run_simulation()
 			if (current_strategy == cohort_strategy::static_cohorts_dynamic_coaches &&
 				(time_step % GLOBAL.SIM_STEPS_PER_DAY == 0))
 			{
-				// std::cout<< "\n Calling make_train_coaches AM ";
-				train_coaches_am = make_train_coaches(cohorts, train_loader, true, false);
-				// std::cout << " coach # " << num_coaches(train_coaches_am) ;
-				auto one_off_train_coaches_am = make_train_coaches(cohorts, train_loader, true, true);
-				// std::cout << " one-off coach # " << num_coaches(one_off_train_coaches_am) ;
-				merge_coaches(train_coaches_am, one_off_train_coaches_am);
-				// std::cout << " merged coach # " << num_coaches(train_coaches_am) << std::endl;
-
-				// std::cout<< "\n Calling make_train_coaches PM ";
-				train_coaches_pm = make_train_coaches(cohorts, train_loader, false, false);
-				// std::cout << " coach # " << num_coaches(train_coaches_pm) ;
-				auto one_off_train_coaches_pm = make_train_coaches(cohorts, train_loader, false, true);
-				// std::cout << " one-off coach # " << num_coaches(one_off_train_coaches_pm) ;
-				merge_coaches(train_coaches_pm, one_off_train_coaches_pm);
-				// std::cout << " merged coach # " << num_coaches(train_coaches_pm) << std::endl;
+				build_train_coaches();
 				coaches_created = true;
 			}
 			else if (current_strategy == cohort_strategy::static_cohorts_static_coaches && !coaches_created)
 			{
-				train_coaches_am = make_train_coaches(cohorts, train_loader, true, false);
-				auto one_off_train_coaches_am = make_train_coaches(cohorts, train_loader, true, true);
-				merge_coaches(train_coaches_am, one_off_train_coaches_am);
-
-				train_coaches_pm = make_train_coaches(cohorts, train_loader, false, false);
-				auto one_off_train_coaches_pm = make_train_coaches(cohorts, train_loader, false, true);
-				merge_coaches(train_coaches_pm, one_off_train_coaches_pm);
+				build_train_coaches();
 				coaches_created = true;
 			}
+			timer.lap(timestep_phase::train_coaches);
 			//add coach stats
 			plot_data.coach_stats["coach_stats"].push_back({time_step, {num_coaches(train_coaches_am), num_coaches(train_coaches_pm)}});
 
@@ -396,49 +588,9 @@ plot_data_struct run_simulation()
 			update_lambda_inter_cohort(train_coaches_am, train_coaches_pm, cohorts, train_loader, time_step); //TODO[v2]: Enable this function when inter-cohort interactions are done
 			// std::cout<<"cohort kappas, lambdas updated" << std::endl;
 		}
-		if (GLOBAL.USE_AGE_DEPENDENT_MIXING)
-		{
-			for (count_type h = 0; h < GLOBAL.num_homes; ++h)
-			{
-				updated_lambda_h_age_dependent(nodes, homes[h],
-											   home_age_matrix.u,
-											   home_age_matrix.sigma,
-											   home_age_matrix.vT);
-			}
-			for (count_type w = 0; w < GLOBAL.num_schools + GLOBAL.num_workplaces; ++w)
-			{
-				if (workplaces[w].workplace_type == WorkplaceType::school)
-				{
-					updated_lambda_w_age_dependent(nodes, workplaces[w],
-												   school_age_matrix.u,
-												   school_age_matrix.sigma,
-												   school_age_matrix.vT);
-				}
-				else
-				{
-					updated_lambda_w_age_dependent(nodes, workplaces[w],
-												   workplace_age_matrix.u,
-												   workplace_age_matrix.sigma,
-												   workplace_age_matrix.vT);
-				}
-				updated_lambda_project(nodes, workplaces[w]);
-			}
-		}
-		else
-		{
-			for (count_type h = 0; h < GLOBAL.num_homes; ++h)
-			{
-				updated_lambda_h_age_independent(nodes, homes[h]);
-				//FEATURE_PROPOSAL: make the mixing dependent on node.age_group;
-			}
+		timer.lap(timestep_phase::cohorts);
 
-			for (count_type w = 0; w < GLOBAL.num_schools + GLOBAL.num_workplaces; ++w)
-			{
-				updated_lambda_w_age_independent(nodes, workplaces[w]);
-				updated_lambda_project(nodes, workplaces[w]);
-				//FEATURE_PROPOSAL: make the mixing dependent on node.age_group;
-			}
-		}
+		update_location_lambdas(nodes, homes, workplaces, age_mixing);
 
 		if (GLOBAL.ENABLE_NEIGHBORHOOD_SOFT_CONTAINMENT)
 		{
@@ -446,14 +598,18 @@ plot_data_struct run_simulation()
 										GLOBAL.LOCKED_NEIGHBORHOOD_LEAKAGE,
 										GLOBAL.NEIGHBORHOOD_LOCK_THRESHOLD);
 		}
+		timer.lap(timestep_phase::location_lambdas);
 
 		for (count_type c = 0; c < GLOBAL.num_communities; ++c)
 		{
 			auto temp_stats = get_infected_community(nodes, communities[c]);
 			//let row = [time_step/SIM_STEPS_PER_DAY,c,temp_stats[0],temp_stats[1],temp_stats[2],temp_stats[3],temp_stats[4]].join(",");
-			plot_data.nums["csvContent"].push_back({time_step, {c, temp_stats.affected, temp_stats.susceptible, temp_stats.exposed, temp_stats.infective, temp_stats.symptomatic, temp_stats.hospitalised, temp_stats.critical, temp_stats.dead, temp_stats.recovered, temp_stats.recovered_from_infective, temp_stats.recovered_from_symptomatic, temp_stats.recovered_from_hospitalised, temp_stats.recovered_from_critical, temp_stats.hd_area_affected, temp_stats.hd_area_susceptible, temp_stats.hd_area_exposed, temp_stats.hd_area_infective, temp_stats.hd_area_symptomatic, temp_stats.hd_area_hospitalised, temp_stats.hd_area_critical, temp_stats.hd_area_dead, temp_stats.hd_area_recovered, temp_stats.hd_area_recovered_from_infective, temp_stats.hd_area_recovered_from_symptomatic, temp_stats.hd_area_recovered_from_hospitalised, temp_stats.hd_area_recovered_from_critical}});
+			if (record_community_rows)
+			{
+				plot_data.nums["csvContent"].push_back({time_step, {c, temp_stats.affected, temp_stats.susceptible, temp_stats.exposed, temp_stats.infective, temp_stats.symptomatic, temp_stats.hospitalised, temp_stats.critical, temp_stats.dead, temp_stats.recovered, temp_stats.recovered_from_infective, temp_stats.recovered_from_symptomatic, temp_stats.recovered_from_hospitalised, temp_stats.recovered_from_critical, temp_stats.hd_area_affected, temp_stats.hd_area_susceptible, temp_stats.hd_area_exposed, temp_stats.hd_area_infective, temp_stats.hd_area_symptomatic, temp_stats.hd_area_hospitalised, temp_stats.hd_area_critical, temp_stats.hd_area_dead, temp_stats.hd_area_recovered, temp_stats.hd_area_recovered_from_infective, temp_stats.hd_area_recovered_from_symptomatic, temp_stats.hd_area_recovered_from_hospitalised, temp_stats.hd_area_recovered_from_critical}});
+			}
 
-			//Update w_c value for this community, followed by update of lambdas
+			//Update w_c value for this community; its lambda is updated below
 			if (communities[c].individuals.size() > 0)
 			{
 				communities[c].w_c = interpolate(1.0, GLOBAL.LOCKED_COMMUNITY_LEAKAGE,
@@ -464,13 +620,16 @@ plot_data_struct run_simulation()
 			{
 				communities[c].w_c = 1;
 			}
-
-			updated_lambda_c_local(nodes, communities[c]);
 		}
 
+		updated_lambda_c_local_communities(nodes, communities);
+
 		updated_lambda_c_local_random_community(nodes, communities, homes);
-		update_lambda_c_global(communities, community_fk_matrix);
+		update_lambda_c_global(communities, community_fk_kernel);
+		timer.lap(timestep_phase::community_lambdas);
+
 		update_lambda_nbr_cells(nodes, nbr_cells, homes, communities);
+		timer.lap(timestep_phase::nbr_cell_lambdas);
 
 		travel_fraction = updated_travel_fraction(nodes, time_step);
 
@@ -485,6 +644,12 @@ plot_data_struct run_simulation()
 		{//Cohort lambda for each node is updated only here.
 			update_individual_lambda_cohort(nodes, time_step, cohorts);
 		}
+		if (GLOBAL.EVENT_DRIVEN_PROGRESSION)
+		{
+			collect_susceptible_agents(schedule, nodes, homes, workplaces, communities, nbr_cells,
+									   cohorts, travel_fraction, time_step);
+		}
+		timer.lap(timestep_phase::agent_lambdas);
 
 
 
@@ -526,127 +691,149 @@ plot_data_struct run_simulation()
 					                //work_ward_infected[nwards] = 0;
 	        //}
 
-#pragma omp parallel for firstprivate(NUM_PEOPLE) default(none) shared(nodes, GLOBAL)          \
-	reduction(+                                                                   \
-			  : n_infected, n_exposed,                                            \
-				n_hospitalised, n_symptomatic,                                    \
-				n_critical, n_fatalities,                                         \
-				n_recovered, n_affected, n_infective,                             \
-				susceptible_lambda, susceptible_lambda_H,                         \
-				susceptible_lambda_W, susceptible_lambda_C,                       \
-				susceptible_lambda_T, susceptible_lambda_PROJECT,                 \
-				susceptible_lambda_NBR_CELL, susceptible_lambda_RANDOM_COMMUNITY, \
-				quarantined_infectious, quarantined_individuals,                  \
-				quarantined_infectious_cohorts, quarantined_individuals_cohorts,  \
-				curtailed_interaction, normal_interaction,                        \
-				n_primary_contact,                                                \
-				n_mild_symptomatic_tested,                                        \
-				n_moderate_symptomatic_tested,                                    \
-				n_severe_symptomatic_tested,                                      \
-				n_icu, n_requested_tests, n_tested_positive)
-		for (count_type j = 0; j < NUM_PEOPLE; ++j)
+		// The double sums are accumulated per block of agents and the blocks are
+		// added in order, so the results do not depend on the number of threads.
+		// Without OpenMP there is a single block, which keeps the plain
+		// sequential summation order.
+		const count_type NUM_STATS_BLOCKS = (NUM_PEOPLE + STATS_BLOCK_SIZE - 1) / STATS_BLOCK_SIZE;
+		std::vector<stats_partial_sums> block_sums(NUM_STATS_BLOCKS);
+
+#pragma omp parallel for firstprivate(NUM_PEOPLE, NUM_STATS_BLOCKS, STATS_BLOCK_SIZE) default(none) \
+	shared(nodes, GLOBAL, block_sums)                                     \
+	reduction(+                                                           \
+			  : n_infected, n_exposed,                                    \
+				n_hospitalised, n_symptomatic,                            \
+				n_critical, n_fatalities,                                 \
+				n_recovered, n_affected, n_infective,                     \
+				quarantined_infectious, quarantined_individuals,          \
+				quarantined_infectious_cohorts, quarantined_individuals_cohorts, \
+				n_primary_contact,                                        \
+				n_mild_symptomatic_tested,                                \
+				n_moderate_symptomatic_tested,                            \
+				n_severe_symptomatic_tested,                              \
+				n_icu, n_requested_tests, n_tested_positive,              \
+				ward_infected[:GLOBAL.num_wards])
+		for (count_type b = 0; b < NUM_STATS_BLOCKS; ++b)
 		{
-			auto infection_status = nodes[j].infection_status;
-			if (infection_status == Progression::susceptible)
-			{
-				susceptible_lambda += nodes[j].lambda;
-				susceptible_lambda_H += nodes[j].lambda_incoming.home;
-				susceptible_lambda_W += nodes[j].lambda_incoming.work;
-				susceptible_lambda_C += nodes[j].lambda_incoming.community;
-				susceptible_lambda_T += nodes[j].lambda_incoming.travel;
-				susceptible_lambda_PROJECT += nodes[j].lambda_incoming.project;
-				susceptible_lambda_NBR_CELL += nodes[j].lambda_incoming.nbr_cell;
-				susceptible_lambda_RANDOM_COMMUNITY += nodes[j].lambda_incoming.random_community;
-			}
-			if (infection_status == Progression::infective || infection_status == Progression::symptomatic || infection_status == Progression::hospitalised || infection_status == Progression::critical)
-			{
-				n_infected += 1;
-				home_ward_infected[nodes[j].home_ward] += 1;
-				//work_ward_infected[nodes[j].work_ward] += 1;
-			}
-			else if (infection_status != Progression::dead)
-			{
-				curtailed_interaction += (nodes[j].kappa_H_incoming * GLOBAL.BETA_H + nodes[j].kappa_C_incoming * GLOBAL.BETA_C + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_W : 0) * nodes[j].kappa_W_incoming + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_S : 0) * nodes[j].kappa_W_incoming + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_PROJECT : 0) * nodes[j].kappa_W_incoming + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_CLASS : 0) * nodes[j].kappa_W_incoming + nodes[j].kappa_C_incoming * GLOBAL.BETA_NBR_CELLS + nodes[j].kappa_C_incoming * GLOBAL.BETA_RANDOM_COMMUNITY + ((nodes[j].has_to_travel) ? GLOBAL.BETA_TRAVEL : 0) * nodes[j].travels());
-				normal_interaction += (GLOBAL.BETA_H + GLOBAL.BETA_C + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_W : 0) + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_S : 0) + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_PROJECT : 0) + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_CLASS : 0) + GLOBAL.BETA_NBR_CELLS + GLOBAL.BETA_RANDOM_COMMUNITY + ((nodes[j].has_to_travel) ? GLOBAL.BETA_TRAVEL : 0));
-			}
-			if (infection_status == Progression::exposed)
-			{
-				n_exposed += 1;
-			}
-			if (infection_status == Progression::hospitalised)
-			{
-				n_hospitalised += 1;
-			}
-			if (infection_status == Progression::symptomatic)
-			{
-				n_symptomatic += 1;
-			}
-			if (infection_status == Progression::critical)
-			{
-				n_critical += 1;
-			}
-			if (infection_status == Progression::dead)
-			{
-				n_fatalities += 1;
-			}
-			if (infection_status == Progression::recovered)
-			{
-				n_recovered += 1;
-			}
-			if (infection_status != Progression::susceptible)
-			{
-				n_affected += 1;
-			}
-			if (nodes[j].infective)
-			{
-				n_infective += 1;
-			}
-			if (nodes[j].quarantined)
-			{
-				quarantined_individuals += 1;
-			}
-			if (nodes[j].quarantined && (infection_status == Progression::infective || infection_status == Progression::symptomatic || infection_status == Progression::hospitalised || infection_status == Progression::critical))
+			auto& sums = block_sums[b];
+			const count_type block_end = std::min(NUM_PEOPLE, (b + 1) * STATS_BLOCK_SIZE);
+			for (count_type j = b * STATS_BLOCK_SIZE; j < block_end; ++j)
 			{
-				quarantined_infectious += 1;
-			}
-			if (nodes[j].quarantined && nodes[j].my_cohort.quarantined)
-			{
-				quarantined_individuals_cohorts += 1;
-			}
-			if (nodes[j].quarantined && (infection_status == Progression::infective || infection_status == Progression::symptomatic || infection_status == Progression::hospitalised || infection_status == Progression::critical) && nodes[j].my_cohort.quarantined)
-			{
-				quarantined_infectious_cohorts += 1;
-			}
+				auto infection_status = nodes[j].infection_status;
+				if (infection_status == Progression::susceptible)
+				{
+					sums.susceptible_lambda += nodes[j].lambda;
+					sums.H += nodes[j].lambda_incoming.home;
+					sums.W += nodes[j].lambda_incoming.work;
+					sums.C += nodes[j].lambda_incoming.community;
+					sums.T += nodes[j].lambda_incoming.travel;
+					sums.PROJECT += nodes[j].lambda_incoming.project;
+					sums.NBR_CELL += nodes[j].lambda_incoming.nbr_cell;
+					sums.RANDOM_COMMUNITY += nodes[j].lambda_incoming.random_community;
+				}
+				if (infection_status == Progression::infective || infection_status == Progression::symptomatic || infection_status == Progression::hospitalised || infection_status == Progression::critical)
+				{
+					n_infected += 1;
+					ward_infected[nodes[j].details().home_ward] += 1;
+					//work_ward_infected[nodes[j].details().work_ward] += 1;
+				}
+				else if (infection_status != Progression::dead)
+				{
+					sums.curtailed_interaction += (nodes[j].kappa_H_incoming * GLOBAL.BETA_H + nodes[j].kappa_C_incoming * GLOBAL.BETA_C + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_W : 0) * nodes[j].kappa_W_incoming + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_S : 0) * nodes[j].kappa_W_incoming + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_PROJECT : 0) * nodes[j].kappa_W_incoming + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_CLASS : 0) * nodes[j].kappa_W_incoming + nodes[j].kappa_C_incoming * GLOBAL.BETA_NBR_CELLS + nodes[j].kappa_C_incoming * GLOBAL.BETA_RANDOM_COMMUNITY + ((nodes[j].has_to_travel) ? GLOBAL.BETA_TRAVEL : 0) * nodes[j].travels());
+					sums.normal_interaction += (GLOBAL.BETA_H + GLOBAL.BETA_C + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_W : 0) + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_S : 0) + ((nodes[j].workplace_type == WorkplaceType::office) ? GLOBAL.BETA_PROJECT : 0) + ((nodes[j].workplace_type == WorkplaceType::school) ? GLOBAL.BETA_CLASS : 0) + GLOBAL.BETA_NBR_CELLS + GLOBAL.BETA_RANDOM_COMMUNITY + ((nodes[j].has_to_travel) ? GLOBAL.BETA_TRAVEL : 0));
+				}
+				if (infection_status == Progression::exposed)
+				{
+					n_exposed += 1;
+				}
+				if (infection_status == Progression::hospitalised)
+				{
+					n_hospitalised += 1;
+				}
+				if (infection_status == Progression::symptomatic)
+				{
+					n_symptomatic += 1;
+				}
+				if (infection_status == Progression::critical)
+				{
+					n_critical += 1;
+				}
+				if (infection_status == Progression::dead)
+				{
+					n_fatalities += 1;
+				}
+				if (infection_status == Progression::recovered)
+				{
+					n_recovered += 1;
+				}
+				if (infection_status != Progression::susceptible)
+				{
+					n_affected += 1;
+				}
+				if (nodes[j].infective)
+				{
+					n_infective += 1;
+				}
+				if (nodes[j].quarantined)
+				{
+					quarantined_individuals += 1;
+				}
+				if (nodes[j].quarantined && (infection_status == Progression::infective || infection_status == Progression::symptomatic || infection_status == Progression::hospitalised || infection_status == Progression::critical))
+				{
+					quarantined_infectious += 1;
+				}
+				if (nodes[j].quarantined && nodes[j].my_cohort.quarantined)
+				{
+					quarantined_individuals_cohorts += 1;
+				}
+				if (nodes[j].quarantined && (infection_status == Progression::infective || infection_status == Progression::symptomatic || infection_status == Progression::hospitalised || infection_status == Progression::critical) && nodes[j].my_cohort.quarantined)
+				{
+					quarantined_infectious_cohorts += 1;
+				}
 
-			if (nodes[j].disease_label == DiseaseLabel::primary_contact)
-			{
-				n_primary_contact += 1;
-			}
-			if (nodes[j].disease_label == DiseaseLabel::mild_symptomatic_tested)
-			{
-				n_mild_symptomatic_tested += 1;
-			}
-			if (nodes[j].disease_label == DiseaseLabel::moderate_symptomatic_tested)
-			{
-				n_moderate_symptomatic_tested += 1;
-			}
-			if (nodes[j].disease_label == DiseaseLabel::severe_symptomatic_tested)
-			{
-				n_severe_symptomatic_tested += 1;
-			}
-			if (nodes[j].disease_label == DiseaseLabel::icu)
-			{
-				n_icu += 1;
-			}
-			if (nodes[j].test_status.test_requested)
-			{
-				n_requested_tests += 1;
-			}
-			if (nodes[j].test_status.tested_positive)
-			{
-				n_tested_positive += 1;
+				if (nodes[j].disease_label == DiseaseLabel::primary_contact)
+				{
+					n_primary_contact += 1;
+				}
+				if (nodes[j].disease_label == DiseaseLabel::mild_symptomatic_tested)
+				{
+					n_mild_symptomatic_tested += 1;
+				}
+				if (nodes[j].disease_label == DiseaseLabel::moderate_symptomatic_tested)
+				{
+					n_moderate_symptomatic_tested += 1;
+				}
+				if (nodes[j].disease_label == DiseaseLabel::severe_symptomatic_tested)
+				{
+					n_severe_symptomatic_tested += 1;
+				}
+				if (nodes[j].disease_label == DiseaseLabel::icu)
+				{
+					n_icu += 1;
+				}
+				if (nodes[j].test_status.test_requested)
+				{
+					n_requested_tests += 1;
+				}
+				if (nodes[j].test_status.tested_positive)
+				{
+					n_tested_positive += 1;
+				}
 			}
 		}
+		for (const auto& sums : block_sums)
+		{
+			susceptible_lambda += sums.susceptible_lambda;
+			susceptible_lambda_H += sums.H;
+			susceptible_lambda_W += sums.W;
+			susceptible_lambda_C += sums.C;
+			susceptible_lambda_T += sums.T;
+			susceptible_lambda_PROJECT += sums.PROJECT;
+			susceptible_lambda_NBR_CELL += sums.NBR_CELL;
+			susceptible_lambda_RANDOM_COMMUNITY += sums.RANDOM_COMMUNITY;
+			curtailed_interaction += sums.curtailed_interaction;
+			normal_interaction += sums.normal_interaction;
+		}
 
 		//Apportion new expected infections (in next time step) to currently
 		//infective nodes
@@ -661,6 +848,7 @@ plot_data_struct run_simulation()
 				}
 			}
 		}
+		timer.lap(timestep_phase::statistics);
 
 		plot_data.nums["num_infected"].push_back({time_step, {n_infected}});
 		plot_data.nums["num_exposed"].push_back({time_step, {n_exposed}});
@@ -747,6 +935,19 @@ plot_data_struct run_simulation()
 			{
 				update_cumulative_counters();
 			}
+		if (GLOBAL.STREAM_OUTPUTS)
+		{
+			stream.write_rows(plot_data);
+			if ((time_step + 1) % GLOBAL.SIM_STEPS_PER_DAY == 0)
+			{
+				stream.flush();
+			}
+		}
+		timer.lap(timestep_phase::outputs);
+		if (GLOBAL.RECORD_PHASE_TIMES)
+		{
+			plot_data.phase_times["phase_times"].push_back({time_step, timer.finish()});
+		}
 #ifdef DEBUG
 		cerr << std::endl
 			 << "time_step: " << time_step;
@@ -768,6 +969,10 @@ plot_data_struct run_simulation()
 		plot_data.infections_by_new_infectives["infections_by_new_infectives"].push_back({time_step,
 																						  {infections_by_new_infectives[time_step]}});
 	}
+	if (GLOBAL.STREAM_OUTPUTS)
+	{
+		stream.write_rows(plot_data);
+	}
 
 #ifdef TIMING
 	end_time = std::chrono::high_resolution_clock::now();
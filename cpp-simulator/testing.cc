@@ -3,39 +3,128 @@
 #include "models.h"
 #include "testing.h"
 #include "intervention_primitives.h"
+#include "interventions.h"
+#include <algorithm>
 #include <cassert>
 using std::vector;
 
+contact_tracing_counters TRACING_COUNTERS;
 
-void reset_nbr_cell_index_stats(matrix<nbr_cell>& nbr_cells){
-	count_type size_x = nbr_cells.size();
-	for(count_type i=0 ; i < size_x ; ++i){
-		count_type size_y = nbr_cells[i].size();
-		for(count_type j=0; j<size_y; ++j){
-			nbr_cells[i][j].num_index_hospitalised = 0;
-			nbr_cells[i][j].num_index_positive = 0;
-			nbr_cells[i][j].num_index_symptomatic = 0;
+namespace {
+  //Count an agent that triggered contact tracing in its neighbourhood cell
+  void add_nbr_cell_index_case(const agent& node, nbr_cell& neighbourhood){
+	if(node.test_status.node_test_trigger == test_trigger::symptomatic){
+	  neighbourhood.num_index_symptomatic += 1;
+	}
+	else if(node.test_status.node_test_trigger == test_trigger::hospitalised){
+	  neighbourhood.num_index_hospitalised += 1;
+	}
+	else if(node.test_status.node_test_trigger == test_trigger::contact_traced){
+	  neighbourhood.num_index_positive += 1;
+	}
+  }
+
+  //Contact trace, and possibly test, one resident of a neighbourhood cell
+  //given the index cases counted in the cell
+  void contact_trace_nbr_cell_resident(agent& node,
+									   const nbr_cell& neighbourhood,
+									   const testing_probability& probabilities,
+									   const int current_time){
+    //This is the probability with which a person would be quarantined as a primary contact. 
+    double quarantine_prob = 1 -
+	  (std::pow(1 - probabilities.prob_contact_trace_neighbourhood_symptomatic,
+				neighbourhood.num_index_symptomatic)
+	   * std::pow(1 - probabilities.prob_contact_trace_neighbourhood_hospitalised,
+				  neighbourhood.num_index_hospitalised)
+	   * std::pow(1 - probabilities.prob_contact_trace_neighbourhood_positive,
+				  neighbourhood.num_index_positive));
+    
+    if(bernoulli(quarantine_prob) && !node.test_status.tested_positive){
+      //We contact trace the individual only if he was never tested positive and if the contact trace Bernoulli for the individual is one.
+      ++TRACING_COUNTERS.traced_nbr_cell;
+      node.test_status.contact_traced_epoch = current_time;
+      if(node.disease_label == DiseaseLabel::asymptomatic){
+		node.disease_label = DiseaseLabel::primary_contact;
+      }
+      // Figure out if this node is to be tested or not
+      if(current_time - node.test_status.tested_epoch >
+		 static_cast<signed int>(GLOBAL.SIM_STEPS_PER_DAY*GLOBAL.MINIMUM_TEST_INTERVAL)){
+		// Test only if not tested too recently
+		double test_probability = 0;
+		if(node.infection_status == Progression::symptomatic){
+		  // Compute the testing probability, which is the conditional probability given this node is quarantined.
+		  // Computed as Pr[node quarantined and tested] / Pr[node quarantined]
+		  test_probability =
+			(1 -
+			 (std::pow(1 - (probabilities.prob_test_neighbourhood_hospitalised_symptomatic
+							* probabilities.prob_contact_trace_neighbourhood_hospitalised),
+					   neighbourhood.num_index_hospitalised)
+			  * std::pow(1 - (probabilities.prob_test_neighbourhood_positive_symptomatic
+							  * probabilities.prob_contact_trace_neighbourhood_positive),
+						 neighbourhood.num_index_positive)
+			  * std::pow(1 - (probabilities.prob_test_neighbourhood_symptomatic_symptomatic
+							  *probabilities.prob_contact_trace_neighbourhood_symptomatic),
+						 neighbourhood.num_index_symptomatic))) / quarantine_prob;
+		}
+		else if((node.infection_status == Progression::susceptible ||
+				 node.infection_status == Progression::exposed ||
+				 node.infection_status == Progression::infective ||
+				 (node.infection_status == Progression::recovered &&
+				  !node.entered_hospitalised_state))){
+		  //figure out test probability
+		  test_probability =
+			(1 -
+			 (std::pow(1 - (probabilities.prob_test_neighbourhood_hospitalised_asymptomatic
+							* probabilities.prob_contact_trace_neighbourhood_hospitalised),
+					   neighbourhood.num_index_hospitalised)
+			  * std::pow(1 - (probabilities.prob_test_neighbourhood_positive_asymptomatic
+							  * probabilities.prob_contact_trace_neighbourhood_positive),
+						 neighbourhood.num_index_positive)
+			  * std::pow(1 - (probabilities.prob_test_neighbourhood_symptomatic_asymptomatic
+							  * probabilities.prob_contact_trace_neighbourhood_symptomatic),
+						 neighbourhood.num_index_symptomatic))) / quarantine_prob;
 		}
+		if(bernoulli(test_probability)){
+		  node.test_status.test_requested = true;
+		  node.test_status.node_test_trigger = test_trigger::contact_traced;
+		  ++TRACING_COUNTERS.tests_requested;
+		}
+      }
+    }
+  }
+}
+
+
+void reset_nbr_cell_index_stats(nbr_cell_grid& nbr_cells){
+	for(auto& cell: nbr_cells){
+		cell.num_index_hospitalised = 0;
+		cell.num_index_positive = 0;
+		cell.num_index_symptomatic = 0;
 	}
 }
 
 void set_test_request(vector<agent>& nodes,
 		      const vector<house>& homes,
 		      const vector<workplace>& workplaces,
-		      vector<vector<nbr_cell>>& nbr_cells,
+		      nbr_cell_grid& nbr_cells,
 		      const vector<community>& communities,
 		      const testing_probability probabilities,
 		      const count_type current_time){
-	
+  //With INDEXED_CONTACT_TRACING, the agents that triggered contact tracing
+  //in this timestep, whose neighbourhood cells are traced after the sweep.
+  //The sweep itself still visits every agent, for the test requests and the
+  //newly tested positive agents.
+  vector<count_type> index_nodes;
+
   for(count_type i=0; i<nodes.size(); ++i){
 	double time_since_hospitalised = current_time
                 - (nodes[i].time_of_infection
-                        + nodes[i].incubation_period
-                        + nodes[i].asymptomatic_period
-                        + nodes[i].symptomatic_period);
+                        + nodes[i].details().incubation_period
+                        + nodes[i].details().asymptomatic_period
+                        + nodes[i].details().symptomatic_period);
 	double time_since_symptomatic = current_time - (nodes[i].time_of_infection
-                        + nodes[i].incubation_period
-                        + nodes[i].asymptomatic_period);
+                        + nodes[i].details().incubation_period
+                        + nodes[i].details().asymptomatic_period);
 
   	//double time_since_tested = current_time - nodes[i].test_status.tested_epoch;
 
@@ -71,6 +160,7 @@ void set_test_request(vector<agent>& nodes,
 	// Trigger contact trace from node. Enter only if the node has not yet triggered a contact trace, and if the node tested postive.
 	if(!nodes[i].test_status.triggered_contact_trace && nodes[i].test_status.tested_positive){
 		nodes[i].test_status.triggered_contact_trace = true; // record that contact tracing was triggered.
+		++TRACING_COUNTERS.index_cases;
 		if(nodes[i].test_status.node_test_trigger == test_trigger::symptomatic){
 		test_contact_trace_household(i,nodes,homes,probabilities.prob_contact_trace_household_symptomatic,probabilities.prob_test_household_symptomatic_symptomatic,probabilities.prob_test_household_symptomatic_asymptomatic, current_time);
 		}
@@ -123,27 +213,24 @@ void set_test_request(vector<agent>& nodes,
 		
 #ifndef DISABLE_CONTACT_TRACE_NBR_CELLS
 		// Test people in neighbourhood cell
-		auto node_nbr_cell_x = homes[nodes[i].home].neighbourhood.cell_x,
-		  node_nbr_cell_y = homes[nodes[i].home].neighbourhood.cell_y;
-		if(nodes[i].test_status.node_test_trigger == test_trigger::symptomatic){
-		  nbr_cells[node_nbr_cell_x][node_nbr_cell_y].num_index_symptomatic += 1;
-		  //test_contact_trace_neighbourhood_cell(i,nodes,homes,nbr_cells,probabilities.prob_contact_trace_neighbourhood_symptomatic,probabilities.prob_test_neighbourhood_symptomatic_symptomatic,probabilities.prob_test_neighbourhood_symptomatic_asymptomatic, current_time);
-		}
-		else if(nodes[i].test_status.node_test_trigger == test_trigger::hospitalised){
-		  nbr_cells[node_nbr_cell_x][node_nbr_cell_y].num_index_hospitalised += 1;
-		  //test_contact_trace_neighbourhood_cell(i,nodes,homes,nbr_cells,probabilities.prob_contact_trace_neighbourhood_hospitalised,probabilities.prob_test_neighbourhood_hospitalised_symptomatic,probabilities.prob_test_neighbourhood_hospitalised_asymptomatic, current_time);
+		if(GLOBAL.INDEXED_CONTACT_TRACING){
+		  index_nodes.push_back(i);
 		}
-		else if(nodes[i].test_status.node_test_trigger == test_trigger::contact_traced){
-		  nbr_cells[node_nbr_cell_x][node_nbr_cell_y].num_index_positive += 1;
-		  //test_contact_trace_neighbourhood_cell(i,nodes,homes,nbr_cells,probabilities.prob_contact_trace_neighbourhood_positive,probabilities.prob_test_neighbourhood_positive_symptomatic,probabilities.prob_test_neighbourhood_positive_asymptomatic, current_time);
+		else{
+		  add_nbr_cell_index_case(nodes[i], nbr_cells.of(homes[nodes[i].home]));
 		}
 #endif
 	}
   }
 #ifndef DISABLE_CONTACT_TRACE_NBR_CELLS
   // Test people in neighbourhood cell
-  contact_trace_nbr_cells(nodes, homes, nbr_cells, probabilities, current_time);
-  reset_nbr_cell_index_stats(nbr_cells);
+  if(GLOBAL.INDEXED_CONTACT_TRACING){
+	contact_trace_indexed_nbr_cells(index_nodes, nodes, homes, nbr_cells, probabilities, current_time);
+  }
+  else{
+	contact_trace_nbr_cells(nodes, homes, nbr_cells, probabilities, current_time);
+	reset_nbr_cell_index_stats(nbr_cells);
+  }
 #endif
 
 }
@@ -190,6 +277,7 @@ void update_infection_testing(vector<agent>& nodes, vector<house>& houses, count
 	if(node.disease_label==DiseaseLabel::primary_contact || node.disease_label==DiseaseLabel::mild_symptomatic_tested || node.disease_label==DiseaseLabel::moderate_symptomatic_tested){
 		if(current_time - node.test_status.contact_traced_epoch <= HOME_QUARANTINE_DAYS*GLOBAL.SIM_STEPS_PER_DAY){
 			modify_kappa_case_isolate_node(node);
+			mark_kappas_modified(node);
 		}
 		else{
 				node.disease_label=DiseaseLabel::asymptomatic;
@@ -200,7 +288,7 @@ void update_infection_testing(vector<agent>& nodes, vector<house>& houses, count
 }
 
 void set_test_request_fileread(vector<agent>& nodes, const vector<house>& homes,
-						 const vector<workplace>& workplaces, matrix<nbr_cell>& nbr_cells,
+						 const vector<workplace>& workplaces, nbr_cell_grid& nbr_cells,
 						 const vector<community>& communities,						 
 						 const vector<testing_probability>& testing_probability_vector, const int cur_time){
   count_type time_threshold = GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS;
@@ -226,6 +314,7 @@ void set_test_request_fileread(vector<agent>& nodes, const vector<house>& homes,
 void test_contact_trace_household(count_type node_index, vector<agent>& nodes, const vector<house>& homes, double probability_contact_trace, double probability_test_symptomatic, double probability_test_asymptomatic, const count_type current_time ){
 	for(auto household_member: homes[nodes[node_index].home].individuals){
 		if(bernoulli(probability_contact_trace)){//contact trace a household individual with this probability.
+		  ++TRACING_COUNTERS.traced_household;
 		  nodes[household_member].test_status.contact_traced_epoch = current_time;
 		  if(nodes[household_member].disease_label == DiseaseLabel::asymptomatic){
 			nodes[household_member].disease_label = DiseaseLabel::primary_contact;
@@ -237,6 +326,7 @@ void test_contact_trace_household(count_type node_index, vector<agent>& nodes, c
 			 bernoulli(probability_test_symptomatic)){
 			  nodes[household_member].test_status.test_requested = true;
 			  nodes[household_member].test_status.node_test_trigger = test_trigger::contact_traced;
+			  ++TRACING_COUNTERS.tests_requested;
 			}
 			else if((nodes[household_member].infection_status == Progression::susceptible ||
 					nodes[household_member].infection_status == Progression::exposed ||
@@ -246,6 +336,7 @@ void test_contact_trace_household(count_type node_index, vector<agent>& nodes, c
 					bernoulli(probability_test_asymptomatic)){
 			  nodes[household_member].test_status.test_requested = true;
 			  nodes[household_member].test_status.node_test_trigger = test_trigger::contact_traced;
+			  ++TRACING_COUNTERS.tests_requested;
 			}
 		  }
 		}
@@ -256,6 +347,7 @@ void test_contact_trace_project(count_type node_index, vector<agent>& nodes, con
 	for(const auto colleague_index: workplaces[nodes[node_index].workplace].projects[nodes[node_index].workplace_subnetwork].individuals){
 		if(bernoulli(probability_contact_trace) && 
 		!nodes[colleague_index].test_status.tested_positive){
+			++TRACING_COUNTERS.traced_workplace;
 			nodes[colleague_index].test_status.contact_traced_epoch = current_time;
 			if(nodes[colleague_index].disease_label == DiseaseLabel::asymptomatic){
 				nodes[colleague_index].disease_label = DiseaseLabel::primary_contact;
@@ -266,6 +358,7 @@ void test_contact_trace_project(count_type node_index, vector<agent>& nodes, con
 				 bernoulli(probability_test_symptomatic)){
 					nodes[colleague_index].test_status.test_requested = true;
 					nodes[colleague_index].test_status.node_test_trigger= test_trigger::contact_traced;
+					++TRACING_COUNTERS.tests_requested;
 				}
 				else if((nodes[colleague_index].infection_status == Progression::susceptible ||
 						nodes[colleague_index].infection_status == Progression::exposed ||
@@ -275,6 +368,7 @@ void test_contact_trace_project(count_type node_index, vector<agent>& nodes, con
 						bernoulli(probability_test_asymptomatic)){
 					nodes[colleague_index].test_status.test_requested = true;
 					nodes[colleague_index].test_status.node_test_trigger= test_trigger::contact_traced;
+					++TRACING_COUNTERS.tests_requested;
 				}
 			}
 		}
@@ -285,6 +379,7 @@ void test_contact_trace_random_community(count_type node_index, vector<agent>& n
 	for(count_type k=0; k<homes[nodes[node_index].home].random_households.households.size(); k++){
 		if(bernoulli(probability_contact_trace)){//Within random community, we think of household connections, to model say family friends.
 		  for(const auto cohabitant_index: homes[homes[nodes[node_index].home].random_households.households[k]].individuals){
+			++TRACING_COUNTERS.traced_random_community;
 			nodes[cohabitant_index].test_status.contact_traced_epoch = current_time;
 			if(nodes[cohabitant_index].disease_label == DiseaseLabel::asymptomatic){
 			  nodes[cohabitant_index].disease_label = DiseaseLabel::primary_contact;
@@ -296,6 +391,7 @@ void test_contact_trace_random_community(count_type node_index, vector<agent>& n
 			   bernoulli(probability_test_symptomatic)){
 				nodes[cohabitant_index].test_status.test_requested = true;
 				nodes[cohabitant_index].test_status.node_test_trigger = test_trigger::contact_traced;
+				++TRACING_COUNTERS.tests_requested;
 			  }
 			  else if((nodes[cohabitant_index].infection_status == Progression::susceptible ||
 					  nodes[cohabitant_index].infection_status == Progression::exposed ||
@@ -305,6 +401,7 @@ void test_contact_trace_random_community(count_type node_index, vector<agent>& n
 					  bernoulli(probability_test_asymptomatic)){
 				nodes[cohabitant_index].test_status.test_requested = true;
 				nodes[cohabitant_index].test_status.node_test_trigger = test_trigger::contact_traced;
+				++TRACING_COUNTERS.tests_requested;
 			  }
 			}
 		  }
@@ -316,13 +413,12 @@ void test_contact_trace_random_community(count_type node_index, vector<agent>& n
 void test_contact_trace_neighbourhood_cell(count_type node_index,
 					   vector<agent>& nodes,
 					   const vector<house>& homes,
-					   const matrix<nbr_cell> nbr_cells,
+					   const nbr_cell_grid nbr_cells,
 					   double probability_contact_trace,
 					   double probability_test_symptomatic,
 					   double probability_test_asymptomatic,
 					   const count_type current_time ){
-	grid_cell my_grid_cell = homes[nodes[node_index].home].neighbourhood;
-	nbr_cell my_nbr_cell = nbr_cells[my_grid_cell.cell_x][my_grid_cell.cell_y];
+	nbr_cell my_nbr_cell = nbr_cells.of(homes[nodes[node_index].home]);
 	count_type my_nbr_size = my_nbr_cell.houses_list.size();
 	for(count_type k=0; k<my_nbr_size; k++){
 		for(const auto neighbor_index: homes[my_nbr_cell.houses_list[k]].individuals){
@@ -355,70 +451,41 @@ void test_contact_trace_neighbourhood_cell(count_type node_index,
 
 void contact_trace_nbr_cells(vector <agent>& nodes,
 			     const vector<house>& homes,
-				 const matrix<nbr_cell>& nbr_cells,
+				 const nbr_cell_grid& nbr_cells,
 			     const testing_probability probabilities,
 			     const int current_time){
   for(auto& node: nodes){
-    const nbr_cell* const neighbourhood = &nbr_cells[homes[node.home].neighbourhood.cell_x][homes[node.home].neighbourhood.cell_y];
-    
-    //This is the probability with which a person would be quarantined as a primary contact. 
-    double quarantine_prob = 1 -
-	  (std::pow(1 - probabilities.prob_contact_trace_neighbourhood_symptomatic,
-				neighbourhood->num_index_symptomatic)
-	   * std::pow(1 - probabilities.prob_contact_trace_neighbourhood_hospitalised,
-				  neighbourhood->num_index_hospitalised)
-	   * std::pow(1 - probabilities.prob_contact_trace_neighbourhood_positive,
-				  neighbourhood->num_index_positive));
-    
-    if(bernoulli(quarantine_prob) && !node.test_status.tested_positive){
-      //We contact trace the individual only if he was never tested positive and if the contact trace Bernoulli for the individual is one.
-      node.test_status.contact_traced_epoch = current_time;
-      if(node.disease_label == DiseaseLabel::asymptomatic){
-		node.disease_label = DiseaseLabel::primary_contact;
-      }
-      // Figure out if this node is to be tested or not
-      if(current_time - node.test_status.tested_epoch >
-		 static_cast<signed int>(GLOBAL.SIM_STEPS_PER_DAY*GLOBAL.MINIMUM_TEST_INTERVAL)){
-		// Test only if not tested too recently
-		double test_probability = 0;
-		if(node.infection_status == Progression::symptomatic){
-		  // Compute the testing probability, which is the conditional probability given this node is quarantined.
-		  // Computed as Pr[node quarantined and tested] / Pr[node quarantined]
-		  test_probability =
-			(1 -
-			 (std::pow(1 - (probabilities.prob_test_neighbourhood_hospitalised_symptomatic
-							* probabilities.prob_contact_trace_neighbourhood_hospitalised),
-					   neighbourhood->num_index_hospitalised)
-			  * std::pow(1 - (probabilities.prob_test_neighbourhood_positive_symptomatic
-							  * probabilities.prob_contact_trace_neighbourhood_positive),
-						 neighbourhood->num_index_positive)
-			  * std::pow(1 - (probabilities.prob_test_neighbourhood_symptomatic_symptomatic
-							  *probabilities.prob_contact_trace_neighbourhood_symptomatic),
-						 neighbourhood->num_index_symptomatic))) / quarantine_prob;
-		}
-		else if((node.infection_status == Progression::susceptible ||
-				 node.infection_status == Progression::exposed ||
-				 node.infection_status == Progression::infective ||
-				 (node.infection_status == Progression::recovered &&
-				  !node.entered_hospitalised_state))){
-		  //figure out test probability
-		  test_probability =
-			(1 -
-			 (std::pow(1 - (probabilities.prob_test_neighbourhood_hospitalised_asymptomatic
-							* probabilities.prob_contact_trace_neighbourhood_hospitalised),
-					   neighbourhood->num_index_hospitalised)
-			  * std::pow(1 - (probabilities.prob_test_neighbourhood_positive_asymptomatic
-							  * probabilities.prob_contact_trace_neighbourhood_positive),
-						 neighbourhood->num_index_positive)
-			  * std::pow(1 - (probabilities.prob_test_neighbourhood_symptomatic_asymptomatic
-							  * probabilities.prob_contact_trace_neighbourhood_symptomatic),
-						 neighbourhood->num_index_symptomatic))) / quarantine_prob;
-		}
-		if(bernoulli(test_probability)){
-		  node.test_status.test_requested = true;
-		  node.test_status.node_test_trigger = test_trigger::contact_traced;
-		}
-      }
-    }
+	contact_trace_nbr_cell_resident(node,
+									nbr_cells.of(homes[node.home]),
+									probabilities, current_time);
+  }
+}
+
+void contact_trace_indexed_nbr_cells(const vector<count_type>& index_nodes,
+									 vector<agent>& nodes,
+									 const vector<house>& homes,
+									 nbr_cell_grid& nbr_cells,
+									 const testing_probability probabilities,
+									 const int current_time){
+  if(!GLOBAL.ENABLE_NBR_CELLS || index_nodes.empty()){
+	return;
+  }
+  vector<count_type> index_cells;
+  index_cells.reserve(index_nodes.size());
+  for(const auto i: index_nodes){
+	add_nbr_cell_index_case(nodes[i], nbr_cells.of(homes[nodes[i].home]));
+	index_cells.push_back(homes[nodes[i].home].nbr_cell_index);
+  }
+  std::sort(index_cells.begin(), index_cells.end());
+  index_cells.erase(std::unique(index_cells.begin(), index_cells.end()), index_cells.end());
+
+  for(const auto c: index_cells){
+	nbr_cell& neighbourhood = nbr_cells[c];
+	for(const auto resident: MEMBERSHIP.nbr_cells.of(c)){
+	  contact_trace_nbr_cell_resident(nodes[resident], neighbourhood, probabilities, current_time);
+	}
+	neighbourhood.num_index_hospitalised = 0;
+	neighbourhood.num_index_positive = 0;
+	neighbourhood.num_index_symptomatic = 0;
   }
 }
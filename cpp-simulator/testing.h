@@ -10,23 +10,43 @@ struct node_update_status_testing{
   bool new_hospitalization = false;
 };
 
-void reset_nbr_cell_index_stats(matrix<nbr_cell>& nbr_cells);
+//Contact tracing done in one timestep, written to contact_tracing_stats.csv
+struct contact_tracing_counters{
+  count_type index_cases = 0; //agents that triggered contact tracing
+  count_type traced_household = 0;
+  count_type traced_workplace = 0; //project or class
+  count_type traced_random_community = 0;
+  count_type traced_nbr_cell = 0;
+  count_type tests_requested = 0; //tests requested for traced contacts
+
+  std::vector<count_type> row() const{
+	return {index_cases, traced_household, traced_workplace,
+			traced_random_community, traced_nbr_cell, tests_requested};
+  }
+};
+
+extern contact_tracing_counters TRACING_COUNTERS;
+
+void reset_nbr_cell_index_stats(nbr_cell_grid& nbr_cells);
 void set_test_request(std::vector<agent>& nodes,
 		      const std::vector<house>& homes,
 		      const std::vector<workplace>& workplaces,
-		      std::vector<std::vector<nbr_cell>>& nbr_cells,
+		      nbr_cell_grid& nbr_cells,
 		      const std::vector<community>& communities,
 		      const testing_probability probabilities,
 		      const count_type current_time);
 void update_infection_testing(std::vector<agent>& nodes, std::vector<house>& homes, count_type current_time);
 void set_test_request_fileread(std::vector<agent>& nodes, const std::vector<house>& homes,
-						 const std::vector<workplace>& workplaces, matrix<nbr_cell>& nbr_cells,
+						 const std::vector<workplace>& workplaces, nbr_cell_grid& nbr_cells,
 						 const std::vector<community>& communities,						 
 						 const std::vector<testing_probability>& testing_probability_vector, const int cur_time);
 void test_contact_trace_household(count_type node_index, std::vector<agent>& nodes, const std::vector<house>& homes, double probability_contact_trace, double probability_test_symptomatic, double probability_test_asymptomatic, const count_type current_time );
 void test_contact_trace_project(count_type node_index, std::vector<agent>& nodes, const std::vector<workplace>& workplaces, double probability_contact_trace, double probability_test_symptomatic, double probability_test_asymptomatic, const count_type current_time );
 void test_contact_trace_random_community(count_type node_index, std::vector<agent>& nodes, const std::vector<house>& homes, double probability_contact_trace, double probability_test_symptomatic, double probability_test_asymptomatic, const count_type current_time );
 
-[[deprecated("Replace with contact_trace_nbr_cells()")]] void test_contact_trace_neighbourhood_cell(count_type node_index, std::vector<agent>& nodes, const std::vector<house>& homes, matrix<nbr_cell> nbr_cells, double probability_contact_trace, double probability_test_symptomatic, double probability_test_asymptomatic, const count_type current_time );
-void contact_trace_nbr_cells(std::vector <agent>& nodes, const std::vector<house>& homes, const matrix<nbr_cell>& nbr_cells, const testing_probability probabilities, const int current_time);
+[[deprecated("Replace with contact_trace_nbr_cells()")]] void test_contact_trace_neighbourhood_cell(count_type node_index, std::vector<agent>& nodes, const std::vector<house>& homes, nbr_cell_grid nbr_cells, double probability_contact_trace, double probability_test_symptomatic, double probability_test_asymptomatic, const count_type current_time );
+void contact_trace_nbr_cells(std::vector <agent>& nodes, const std::vector<house>& homes, const nbr_cell_grid& nbr_cells, const testing_probability probabilities, const int current_time);
+//Contact trace only the neighbourhood cells of index_nodes, through
+//MEMBERSHIP.nbr_cells, and reset their index case counts
+void contact_trace_indexed_nbr_cells(const std::vector<count_type>& index_nodes, std::vector<agent>& nodes, const std::vector<house>& homes, nbr_cell_grid& nbr_cells, const testing_probability probabilities, const int current_time);
 #endif
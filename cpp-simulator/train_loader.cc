@@ -7,7 +7,9 @@
 #include <iostream>
 #include <rapidjson/document.h>
 #include <fstream>
+#include <iterator>
 #include <string>
+#include <type_traits>
 #include <vector>
 #include <regex>
 #include <rapidjson/istreamwrapper.h>
@@ -40,14 +42,88 @@ namespace {
     }
     return legs;
   }
+
+  const char TRAIN_CACHE_MAGIC[8] = {'E', 'P', 'I', 'T', 'R', 'N', 'S', '\0'};
+  // Bump this whenever the layout of the cache file changes
+  const std::uint32_t TRAIN_CACHE_VERSION = 1;
+
+  struct overlap_entry {
+    count_type key;
+    int overlap_minutes;
+  };
+
+  template<class T>
+  void write_value(std::ostream& out, const T& value){
+    static_assert(std::is_trivially_copyable<T>::value, "raw write of a non-trivial type");
+    out.write(reinterpret_cast<const char*>(&value), sizeof(T));
+  }
+
+  template<class T>
+  void read_value(std::istream& in, T& value){
+    static_assert(std::is_trivially_copyable<T>::value, "raw read of a non-trivial type");
+    in.read(reinterpret_cast<char*>(&value), sizeof(T));
+  }
+
+  template<class T>
+  void write_vector(std::ostream& out, const std::vector<T>& values){
+    write_value(out, count_type(values.size()));
+    out.write(reinterpret_cast<const char*>(values.data()), sizeof(T) * values.size());
+  }
+
+  template<class T>
+  void read_vector(std::istream& in, std::vector<T>& values){
+    count_type size = 0;
+    read_value(in, size);
+    if(!in){
+      return;
+    }
+    values.resize(size);
+    in.read(reinterpret_cast<char*>(values.data()), sizeof(T) * size);
+  }
+
+  // FNV-1a hash of the contents of the files
+  std::uint64_t HashFiles(const std::vector<std::string>& filenames) {
+    std::uint64_t hash = 14695981039346656037ULL;
+    for (const auto& filename: filenames) {
+      std::ifstream in(filename, std::ios::binary);
+      std::string contents((std::istreambuf_iterator<char>(in)), std::istreambuf_iterator<char>());
+      // Separate the files, so that moving bytes between them changes the hash
+      contents += '\0';
+      for (unsigned char c: contents) {
+        hash = (hash ^ c) * 1099511628211ULL;
+      }
+    }
+    return hash;
+  }
 }
 
 TrainLoader::TrainLoader(const std::string& overlapFile,
   const std::string& journeyFile,
-  const std::string & routeFile) {
+  const std::string & routeFile,
+  const std::string& cacheFile) {
   if(GLOBAL.ENABLE_COHORTS){
     std::cout<<"\nLOADING TRAIN STATIC DATA...";
+    std::uint64_t inputs_hash = 0;
+    bool cached = false;
+    if (!cacheFile.empty()) {
+      inputs_hash = HashFiles({overlapFile, journeyFile, routeFile});
+      cached = ReadCache(cacheFile, inputs_hash);
+    }
+    if (cached) {
+      std::cout << "read from " << cacheFile << "...DONE" << std::endl;
+    } else {
+      LoadJSON(overlapFile, journeyFile, routeFile);
+      if (!cacheFile.empty() && WriteCache(cacheFile, inputs_hash)) {
+        std::cout << "tables cached in " << cacheFile << std::endl;
+      }
+    }
+  }
+  BuildTables();
+}
 
+void TrainLoader::LoadJSON(const std::string& overlapFile,
+  const std::string& journeyFile,
+  const std::string & routeFile) {
     // load travel time.
     std::cout<<"starting to read station JSONs...";
     auto travelJSON = readJSONFile(journeyFile);
@@ -101,7 +177,147 @@ TrainLoader::TrainLoader(const std::string& overlapFile,
       overlap_times[key] = overlap_time_min;
     }
     std::cout << " overlap time loaded...DONE" << std::endl;
+}
+
+// The cache holds journeys, train_lines and overlap_times as read from the
+// input files, after a hash of the input files.
+bool TrainLoader::ReadCache(const std::string& cacheFile, std::uint64_t inputsHash) {
+  std::ifstream in(cacheFile, std::ios::binary);
+  if (!in.good()) {
+    return false;
+  }
+  char magic[sizeof(TRAIN_CACHE_MAGIC)];
+  in.read(magic, sizeof(magic));
+  std::uint32_t version = 0;
+  std::uint64_t hash = 0;
+  read_value(in, version);
+  read_value(in, hash);
+  if (!in || !std::equal(magic, magic + sizeof(magic), TRAIN_CACHE_MAGIC)
+      || version != TRAIN_CACHE_VERSION || hash != inputsHash) {
+    std::cout << "cache " << cacheFile << " is out of date...";
+    return false;
+  }
+
+  count_type size = 0;
+  read_value(in, size);
+  for (count_type i = 0; in && i < size; ++i) {
+    count_type key = 0;
+    TrainJourney train_journey;
+    read_value(in, key);
+    read_value(in, train_journey.journey_minutes);
+    read_vector(in, train_journey.legs);
+    journeys[key] = std::move(train_journey);
+  }
+  read_value(in, size);
+  for (count_type i = 0; in && i < size; ++i) {
+    int line = 0;
+    read_value(in, line);
+    read_vector(in, train_lines[line]);
+  }
+  std::vector<overlap_entry> overlaps;
+  read_vector(in, overlaps);
+  overlap_times.reserve(overlaps.size());
+  for (const auto& overlap: overlaps) {
+    overlap_times[overlap.key] = overlap.overlap_minutes;
+  }
+
+  if (!in) {
+    std::cout << "cache " << cacheFile << " is truncated...";
+    journeys.clear();
+    train_lines.clear();
+    overlap_times.clear();
+    return false;
+  }
+  return true;
+}
+
+bool TrainLoader::WriteCache(const std::string& cacheFile, std::uint64_t inputsHash) const {
+  std::ofstream out(cacheFile, std::ios::binary);
+  if (!out.good()) {
+    std::cout << "ERROR: train cache file " << cacheFile << " can't be opened" << std::endl;
+    return false;
+  }
+  out.write(TRAIN_CACHE_MAGIC, sizeof(TRAIN_CACHE_MAGIC));
+  write_value(out, TRAIN_CACHE_VERSION);
+  write_value(out, inputsHash);
+
+  write_value(out, count_type(journeys.size()));
+  for (const auto& journey: journeys) {
+    write_value(out, journey.first);
+    write_value(out, journey.second.journey_minutes);
+    write_vector(out, journey.second.legs);
+  }
+  write_value(out, count_type(train_lines.size()));
+  for (const auto& line: train_lines) {
+    write_value(out, line.first);
+    write_vector(out, line.second);
+  }
+  std::vector<overlap_entry> overlaps;
+  overlaps.reserve(overlap_times.size());
+  for (const auto& overlap: overlap_times) {
+    overlaps.push_back({overlap.first, overlap.second});
+  }
+  write_vector(out, overlaps);
+
+  out.close();
+  if (!out) {
+    std::cout << "ERROR: Writing train cache file " << cacheFile << " failed" << std::endl;
+    return false;
+  }
+  return true;
+}
+
+void TrainLoader::BuildTables() {
+  // Journey keys are 100 * src + dest
+  count_type max_station = 0;
+  for (const auto& journey: journeys) {
+    max_station = std::max({max_station, journey.first / 100, journey.first % 100});
+  }
+  num_stations = journeys.empty() ? 0 : max_station + 1;
+  num_lines = 0;
+  for (const auto& line: train_lines) {
+    num_lines = std::max(num_lines, line.first);
   }
+
+  journey_index.assign(num_stations * num_stations, -1);
+  journey_table.clear();
+  journey_table.reserve(journeys.size());
+  journey_minutes.clear();
+  line_leg.clear();
+  for (auto& journey: journeys) {
+    const auto src = journey.first / 100, dest = journey.first % 100;
+    journey_index[src * num_stations + dest] = journey_table.size();
+    int minutes = 0;
+    for (const auto& leg: journey.second.legs) {
+      minutes += leg.journeyLegTime;
+    }
+    journey_minutes.push_back(minutes);
+    for (int line = 1; line <= num_lines; ++line) {
+      const auto& legs = journey.second.legs;
+      auto leg = std::find_if(legs.begin(), legs.end(),
+                              [line](const JourneyLeg& l){ return l.trainLine == line; });
+      line_leg.push_back(leg == legs.end() ? -1 : leg - legs.begin());
+    }
+    journey_table.push_back(std::move(journey.second));
+  }
+  // The tables hold the journeys from here on
+  journeys.clear();
+}
+
+const TrainJourney* TrainLoader::FindJourney(int src, int dest) const {
+  if (src >= 0 && dest >= 0 && count_type(src) < num_stations && count_type(dest) < num_stations) {
+    auto index = journey_index[src * num_stations + dest];
+    if (index >= 0) {
+      return &journey_table[index];
+    }
+  }
+  count_type key = src*100 + dest;
+  std::cout<<"\n\n\n INVALID INPUT FOR TRAIN OVERLAP"
+      << " src="  << src
+      << " dest=" << dest
+      << " key="   << key
+      << std::endl;
+  return nullptr; // Invalid input.
 }
 
 int TrainLoader::GetOverlapMinutes(
@@ -140,30 +356,15 @@ int TrainLoader::GetOverlapMinutes(
 } */
 
 int TrainLoader::GetJourneyMinutes(int src, int dest) const {
-  auto journey_legs = GetJourneyLegs( src, dest);
-  int journey_time = 0;
-  for(auto& journey_leg: journey_legs){
-    journey_time+=journey_leg.journeyLegTime;
-  }
-  return journey_time;
+  auto journey = FindJourney(src, dest);
+  return journey ? journey_minutes[journey - journey_table.data()] : 0;
 }
 
 
-std::vector<JourneyLeg> TrainLoader::GetJourneyLegs(int src, int dest) const {
-  // keeping key human readable.
-// uint64_t key = src*100 + dest;
-  count_type key = src*100 + dest;
-  auto citer = journeys.find(key);
-  if (citer == journeys.end()) {
-    std::cout<<"\n\n\n INVALID INPUT FOR TRAIN OVERLAP"
-        << " src="  << src
-        << " dest=" << dest
-        << " key="   << key
-        << std::endl;
-    std::vector<JourneyLeg> legs;
-    return legs; // Invalid input.
-  }
-  return citer->second.legs;
+const std::vector<JourneyLeg>& TrainLoader::GetJourneyLegs(int src, int dest) const {
+  static const std::vector<JourneyLeg> no_legs;
+  auto journey = FindJourney(src, dest);
+  return journey ? journey->legs : no_legs;
 }
 
 
@@ -184,7 +385,9 @@ std::vector<int> TrainLoader::GetTrainLineStations(
 
 bool TrainLoader::GetJourneyLegStationsAndIsDown(
   int trainLine, int src, int dest, std::vector<int>& v) const {
-  auto train_line = GetTrainLineStations(trainLine, true);
+  static const std::vector<int> no_stations;
+  auto citer = train_lines.find(trainLine);
+  const auto& train_line = (citer == train_lines.end()) ? no_stations : citer->second;
 
   int start_index = -1;
   int end_index = -1;
@@ -218,26 +421,17 @@ bool TrainLoader::GetJourneyLegStationsAndIsDown(
 int TrainLoader::GetOverlapMinutesAlongLine(
   int line, int src1, int dest1, int src2, int dest2) const
 {
-  auto journey1 = GetJourneyLegs(src1, dest1);
-  auto journey2 = GetJourneyLegs(src2, dest2);
-  int legIndex1 = -1;
-  int legIndex2 = -1;
-  for (size_t index =0; index < journey1.size(); index++) {
-    if (journey1[index].trainLine == line) {
-      legIndex1 = index;
-      break;
-    }
-  }
-  for (size_t index =0; index < journey2.size(); index++) {
-    if (journey2[index].trainLine == line) {
-      legIndex2 = index;
-      break;
-    }
+  auto journey1 = FindJourney(src1, dest1);
+  auto journey2 = FindJourney(src2, dest2);
+  if(!journey1 || !journey2 || line < 1 || line > num_lines) {
+    return 0;
   }
+  int legIndex1 = line_leg[(journey1 - journey_table.data()) * num_lines + line - 1];
+  int legIndex2 = line_leg[(journey2 - journey_table.data()) * num_lines + line - 1];
   if(legIndex1<0 || legIndex2<0) {
     return 0;
   }
 
-  return GetOverlapMinutes(journey1[legIndex1].src, journey1[legIndex1].dest,
-                           journey2[legIndex2].src, journey2[legIndex2].dest);
+  return GetOverlapMinutes(journey1->legs[legIndex1].src, journey1->legs[legIndex1].dest,
+                           journey2->legs[legIndex2].src, journey2->legs[legIndex2].dest);
 }
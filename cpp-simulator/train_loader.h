@@ -4,6 +4,7 @@
 #define TRAIN_LOADER_H_
 
 // #include <bits/stdint-uintn.h>
+#include <cstdint>
 #include <string>
 #include <unordered_map>
 #include <vector>
@@ -22,16 +23,21 @@ struct TrainJourney {
   int journey_minutes;
 };
 
+// Train journeys, routes and overlap times. The journeys are kept in tables
+// indexed by (source, destination) station pair, built at load time, so that
+// the lookups made by the cohort code every day do not hash or copy.
 class TrainLoader
 {
 public:
+  // If cacheFile is not empty, the tables are read from it when it was
+  // written from the same input files, and are written to it otherwise.
   TrainLoader(const std::string& overlapFile, const std::string& journeyFile,
-  const std::string & routeFile);
+  const std::string & routeFile, const std::string& cacheFile = "");
   ~TrainLoader() {} // Empty dtor.
 
   int GetOverlapMinutes(int src1, int dest1, int src2, int dest2) const;
   int GetJourneyMinutes(int src, int dest) const;
-  std::vector<JourneyLeg> GetJourneyLegs(int src, int dest) const;
+  const std::vector<JourneyLeg>& GetJourneyLegs(int src, int dest) const;
 
   std::vector<int> GetTrainLineStations(int trainLine, bool isDown) const;
   bool GetJourneyLegStationsAndIsDown(int trainLine, int src, int dest, std::vector<int>& stations) const;
@@ -39,9 +45,30 @@ public:
 
 
 private:
+  void LoadJSON(const std::string& overlapFile, const std::string& journeyFile,
+  const std::string & routeFile);
+  bool ReadCache(const std::string& cacheFile, std::uint64_t inputsHash);
+  bool WriteCache(const std::string& cacheFile, std::uint64_t inputsHash) const;
+  void BuildTables();
+  // Journey from src to dest, or nullptr (with a message) if there is none
+  const TrainJourney* FindJourney(int src, int dest) const;
+
   std::unordered_map<count_type, int> overlap_times;
   std::unordered_map<count_type, TrainJourney> journeys;
   std::unordered_map<int, std::vector<int>> train_lines;
+
+  // Tables built from journeys and train_lines by BuildTables
+  count_type num_stations = 0;
+  int num_lines = 0;
+  std::vector<TrainJourney> journey_table;
+  // Index in journey_table of the journey from src to dest, at
+  // src * num_stations + dest, or -1
+  std::vector<int> journey_index;
+  // Sum of the leg times of each journey in journey_table
+  std::vector<int> journey_minutes;
+  // Index of the first leg of journey j on line l, at j * num_lines + l - 1,
+  // or -1
+  std::vector<int> line_leg;
 };
 
 #endif // TRAIN_LOADER_H_
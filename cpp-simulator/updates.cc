@@ -5,11 +5,15 @@
 #include <cstdlib>
 #include <iostream>
 #include <unordered_map>
+#ifdef USE_BLAS
+#include <cblas.h>
+#endif
 
 #include "updates.h"
 #include "interventions.h"
 #include "testing.h"
 #include "train_loader.h"
+#include "cohorts.h"
 
 using std::cerr;
 using std::vector;
@@ -23,6 +27,127 @@ namespace {
       }
     }
   }
+
+  //Adds to the lambda_interaction_external of each cohort in the coaches the
+  //contributions of the other cohorts in its coach. The sums over the other
+  //cohorts are taken in parallel over coaches, and added to the cohorts in
+  //coach order afterwards, as a cohort travelling on several lines is in
+  //several coaches. The results are those of a serial pass.
+  void add_inter_cohort_lambdas(
+    const std::unordered_map<count_type, vector<train_coach>>& coaches,
+    const TrainLoader& trains, bool isAM){
+    vector<const train_coach*> coach_list;
+    vector<count_type> offsets{0};
+    for (const auto& coach_line : coaches) {
+      for (const auto& coach : coach_line.second) {
+        coach_list.push_back(&coach);
+        offsets.push_back(offsets.back() + coach.cohorts.size());
+      }
+    }
+    vector<double> contributions(offsets.back());
+    const count_type NUM_COACHES = coach_list.size();
+
+#pragma omp parallel for default(none) \
+  shared(coach_list, offsets, contributions, trains, isAM, NUM_COACHES) \
+  schedule(dynamic, 16)
+    for (count_type c = 0; c < NUM_COACHES; ++c) {
+      const auto& coach = *coach_list[c];
+      const count_type SIZE = coach.cohorts.size();
+      for (count_type i = 0; i < SIZE; ++i) {
+        const auto cohort_ptr = coach.cohorts[i];
+        double sum_value = 0.0;
+        for (const auto cohort_ptr2: coach.cohorts) {
+          if (cohort_ptr == cohort_ptr2) {
+            continue;
+          }
+          // Reversing src dest for PM.
+          double overlap_time = isAM
+            ? trains.GetOverlapMinutesAlongLine(
+                coach.trainLine,
+                cohort_ptr->source_station,
+                cohort_ptr->destination_station,
+                cohort_ptr2->source_station,
+                cohort_ptr2->destination_station)
+            : trains.GetOverlapMinutesAlongLine(
+                coach.trainLine,
+                cohort_ptr->destination_station,
+                cohort_ptr->source_station,
+                cohort_ptr2->destination_station,
+                cohort_ptr2->source_station);
+          sum_value += cohort_ptr2->lambda_interaction_internal * overlap_time;
+        }
+        contributions[offsets[c] + i] = sum_value;
+      }
+    }
+
+    for (count_type c = 0; c < NUM_COACHES; ++c) {
+      const auto& cohorts = coach_list[c]->cohorts;
+      for (count_type i = 0; i < cohorts.size(); ++i) {
+        cohorts[i]->lambda_interaction_external += contributions[offsets[c] + i];
+      }
+    }
+  }
+
+  //Age-dependent mixing of the locations in a batch, written to their
+  //age_dependent_mixing. The member lambdas of each location are summed by
+  //age group into one row of a contiguous matrix, the truncated vT is applied
+  //to all rows, and then u*sigma, so the cost per location is proportional to
+  //SIGNIFICANT_EIGEN_VALUES. The sums are taken in the same order as for a
+  //single location, so the results do not depend on the batching or on the
+  //number of threads.
+  template<typename Location, typename LambdaOf>
+  void update_age_dependent_mixing(const vector<agent>& nodes,
+                                   vector<Location>& locations,
+                                   age_mixing_batch& batch,
+                                   LambdaOf lambda_of){
+    const count_type NUM_LOCATIONS = batch.locations.size();
+    const count_type NUM_AGE_GROUPS = GLOBAL.NUM_AGE_GROUPS;
+    const count_type RANK = batch.factors.rank;
+    const count_type SIZE = batch.factors.size;
+    const double* u_sigma = batch.factors.u_sigma.data();
+    const double* vT = batch.factors.vT.data();
+    double* age_component = batch.age_component.data();
+    double* projected = batch.projected.data();
+
+    //Sizes vary widely among workplaces, hence the dynamic schedule
+#pragma omp parallel for default(none) \
+  shared(nodes, locations, batch, lambda_of, NUM_LOCATIONS, NUM_AGE_GROUPS, age_component) \
+  schedule(dynamic, 64)
+    for(count_type i = 0; i < NUM_LOCATIONS; ++i){
+      double* row = age_component + i * NUM_AGE_GROUPS;
+      std::fill(row, row + NUM_AGE_GROUPS, 0.0);
+      for(const auto individual: locations[batch.locations[i]].individuals){
+        row[nodes[individual].age_group] += lambda_of(nodes[individual]);
+      }
+    }
+
+#pragma omp parallel for default(none) \
+  shared(NUM_LOCATIONS, NUM_AGE_GROUPS, RANK, SIZE, vT, age_component, projected)
+    for(count_type i = 0; i < NUM_LOCATIONS; ++i){
+      const double* row = age_component + i * NUM_AGE_GROUPS;
+      for(count_type k = 0; k < RANK; ++k){
+        double sum_value = 0;
+        for(count_type a = 0; a < SIZE; ++a){
+          sum_value += vT[k * SIZE + a] * row[a];
+        }
+        projected[i * RANK + k] = sum_value;
+      }
+    }
+
+#pragma omp parallel for default(none) \
+  shared(locations, batch, NUM_LOCATIONS, NUM_AGE_GROUPS, RANK, u_sigma, projected)
+    for(count_type i = 0; i < NUM_LOCATIONS; ++i){
+      auto& location = locations[batch.locations[i]];
+      const double* row = projected + i * RANK;
+      for(count_type g = 0; g < NUM_AGE_GROUPS; ++g){
+        double sum_value = 0;
+        for(count_type k = 0; k < RANK; ++k){
+          sum_value += u_sigma[g * RANK + k] * row[k];
+        }
+        location.age_dependent_mixing[g] = sum_value * location.scale;
+      }
+    }
+  }
 }
 
 bool mask_active(int cur_time){
@@ -106,7 +231,7 @@ node_update_status update_infection(agent& node, int cur_time){
     }
     // EXPOSED → PRE_SYMPTOMATIC (infective)
     else if(node.infection_status == Progression::exposed
-            && (double(cur_time) - node.time_of_infection >= node.incubation_period)){
+            && (double(cur_time) - node.time_of_infection >= node.details().incubation_period)){
         node.infection_status = Progression::infective; // This is PRE_SYMPTOMATIC
         node.infective = true;
         node.time_became_infective = cur_time;
@@ -116,7 +241,7 @@ node_update_status update_infection(agent& node, int cur_time){
     // PRE_SYMPTOMATIC → SYMPTOMATIC or RECOVERED
     else if(node.infection_status == Progression::infective
             && (double(cur_time) - node.time_of_infection 
-                >= (node.incubation_period + node.asymptomatic_period))){
+                >= (node.details().incubation_period + node.details().asymptomatic_period))){
         transition = bernoulli(GLOBAL.SYMPTOMATIC_FRACTION);
         if(transition){
             node.infection_status = Progression::symptomatic;
@@ -136,7 +261,7 @@ node_update_status update_infection(agent& node, int cur_time){
     // SYMPTOMATIC → HOSPITALISED or RECOVERED (with detection logic)
     else if(node.infection_status == Progression::symptomatic
             && (double(cur_time) - node.time_of_infection 
-                >= (node.incubation_period + node.asymptomatic_period + node.symptomatic_period))){
+                >= (node.details().incubation_period + node.details().asymptomatic_period + node.details().symptomatic_period))){
         
         // DETECTION LOGIC - happens ONCE here, matching JavaScript
         bool detected_during_symptomatic = false;
@@ -176,8 +301,8 @@ node_update_status update_infection(agent& node, int cur_time){
     // HOSPITALISED → CRITICAL or RECOVERED
     else if(node.infection_status == Progression::hospitalised
             && (double(cur_time) - node.time_of_infection 
-                >= (node.incubation_period + node.asymptomatic_period 
-                    + node.symptomatic_period + node.hospital_regular_period))){
+                >= (node.details().incubation_period + node.details().asymptomatic_period 
+                    + node.details().symptomatic_period + node.details().hospital_regular_period))){
         // All hospitalized people are already detected and counted
         transition = bernoulli(STATE_TRAN[age_index][1]);
         if(transition){
@@ -195,9 +320,9 @@ node_update_status update_infection(agent& node, int cur_time){
     // CRITICAL → DEAD or RECOVERED
     else if(node.infection_status == Progression::critical
             && (double(cur_time) - node.time_of_infection 
-                >= (node.incubation_period + node.asymptomatic_period 
-                    + node.symptomatic_period + node.hospital_regular_period 
-                    + node.hospital_critical_period))){
+                >= (node.details().incubation_period + node.details().asymptomatic_period 
+                    + node.details().symptomatic_period + node.details().hospital_regular_period 
+                    + node.details().hospital_critical_period))){
         // All critical people are already detected and counted
         transition = bernoulli(STATE_TRAN[age_index][2]);
         if(transition){
@@ -222,7 +347,199 @@ node_update_status update_infection(agent& node, int cur_time){
     return update_status;
 }
 
-void update_all_kappa(vector<agent>& nodes, vector<house>& homes, vector<workplace>& workplaces, vector<community>& communities, matrix<nbr_cell>& nbr_cells, vector<intervention_params>& intv_params, int cur_time){
+int next_transition_time(const agent& node, int cur_time){
+  //Thresholds on the time since infection, summed as in update_infection
+  double threshold;
+  switch(node.infection_status){
+  case Progression::exposed:
+	threshold = node.details().incubation_period;
+	break;
+  case Progression::infective:
+	threshold = node.details().incubation_period + node.details().asymptomatic_period;
+	break;
+  case Progression::symptomatic:
+	threshold = node.details().incubation_period + node.details().asymptomatic_period
+	  + node.details().symptomatic_period;
+	break;
+  case Progression::hospitalised:
+	threshold = node.details().incubation_period + node.details().asymptomatic_period
+	  + node.details().symptomatic_period + node.details().hospital_regular_period;
+	break;
+  case Progression::critical:
+	threshold = node.details().incubation_period + node.details().asymptomatic_period
+	  + node.details().symptomatic_period + node.details().hospital_regular_period
+	  + node.details().hospital_critical_period;
+	break;
+  default:
+	return -1;
+  }
+  int time = std::max(cur_time + 1,
+					  int(std::ceil(node.time_of_infection + threshold)));
+  //Settle on the first step that passes the test in update_infection, in
+  //case rounding of the sum above differs from that of the test
+  while(time > cur_time + 1
+		&& double(time - 1) - node.time_of_infection >= threshold){
+	--time;
+  }
+  while(double(time) - node.time_of_infection < threshold){
+	++time;
+  }
+  return time;
+}
+
+void schedule_next_transition(progression_schedule& schedule, const agent& node,
+							  count_type index, int cur_time){
+  int time = next_transition_time(node, cur_time);
+  if(time >= 0 && count_type(time) < schedule.due.size()){
+	schedule.due[time].push_back(index);
+  }
+}
+
+namespace {
+  void add_susceptible_agent(progression_schedule& schedule, const agent& node, count_type j){
+	if(node.infection_status == Progression::susceptible && node.lambda > 0
+	   && !schedule.marked[j]){
+	  schedule.marked[j] = 1;
+	  schedule.agents.push_back(j);
+	}
+  }
+
+  bool has_nonzero(const vector<double>& values){
+	return std::any_of(values.begin(), values.end(), [](double value){ return value != 0; });
+  }
+
+  //Calls f on the members of every home, workplace, community and cohort
+  //whose lambdas give its members a nonzero lambda in update_lambdas and
+  //update_individual_lambda_cohort; the other lambdas of agents are zero,
+  //apart from travel
+  template<class F>
+  void visit_exposed_members(const vector<house>& homes, const vector<workplace>& workplaces,
+							 const vector<community>& communities, const nbr_cell_grid& nbr_cells,
+							 std::unordered_map<count_type, vector<cohort_space>>& cohorts,
+							 int cur_time, F f){
+	for(const auto& home: homes){
+	  const bool mixing = GLOBAL.USE_AGE_DEPENDENT_MIXING?
+		has_nonzero(home.age_dependent_mixing): home.age_independent_mixing != 0;
+	  if(mixing || home.random_households.lambda_random_community != 0
+		 || (nbr_cells.size() > 0 && nbr_cells.of(home).lambda_nbr != 0)){
+		f(home.individuals);
+	  }
+	}
+	for(const auto& workplace: workplaces){
+	  bool mixing = GLOBAL.USE_AGE_DEPENDENT_MIXING?
+		has_nonzero(workplace.age_dependent_mixing): workplace.age_independent_mixing != 0;
+	  for(const auto& project: workplace.projects){
+		mixing = mixing || project.age_independent_mixing != 0;
+	  }
+	  if(mixing){
+		f(workplace.individuals);
+	  }
+	}
+	for(const auto& community: communities){
+	  if(community.lambda_community_global != 0){
+		f(community.individuals);
+	  }
+	}
+	//Agents only get a cohort lambda in the steps in which
+	//update_individual_lambda_cohort sets it
+	if(GLOBAL.ENABLE_COHORTS && GLOBAL.TRAINS_RUNNING && (cur_time % 2)){
+	  for(const auto cohort: list_cohorts(cohorts)){
+		if(cohort->lambda_interaction_internal * cohort->commute_time
+		   + cohort->lambda_interaction_external != 0){
+		  f(cohort->internal_nodes);
+		}
+	  }
+	}
+  }
+}
+
+void build_progression_schedule(progression_schedule& schedule,
+								const vector<agent>& nodes, int cur_time){
+  schedule.due.assign(GLOBAL.NUM_TIMESTEPS, vector<count_type>());
+  schedule.infective.clear();
+  schedule.agents.clear();
+  schedule.marked.assign(nodes.size(), 0);
+  schedule.sweep = true;
+  for(count_type j = 0; j < nodes.size(); ++j){
+	schedule_next_transition(schedule, nodes[j], j, cur_time - 1);
+	if(nodes[j].infective){
+	  schedule.infective.push_back(j);
+	}
+  }
+}
+
+void collect_susceptible_agents(progression_schedule& schedule,
+								const vector<agent>& nodes,
+								const vector<house>& homes,
+								const vector<workplace>& workplaces,
+								const vector<community>& communities,
+								const nbr_cell_grid& nbr_cells,
+								std::unordered_map<count_type, vector<cohort_space>>& cohorts,
+								double travel_fraction, int cur_time){
+  schedule.agents.clear();
+  //The travel lambda only depends on the agent, see update_lambdas
+  schedule.sweep = (cur_time % 2) && GLOBAL.BETA_TRAVEL * travel_fraction != 0;
+  if(!schedule.sweep){
+	count_type num_members = 0;
+	visit_exposed_members(homes, workplaces, communities, nbr_cells, cohorts, cur_time,
+						  [&](const auto& members){ num_members += members.size(); });
+	//Members of different locations are far apart in nodes, so visiting a
+	//good part of the agents that way is slower than the pass over nodes
+	//that updates them
+	schedule.sweep = (num_members > nodes.size() / 4);
+  }
+  if(schedule.sweep){
+	return;
+  }
+  visit_exposed_members(homes, workplaces, communities, nbr_cells, cohorts, cur_time,
+						[&](const auto& members){
+						  for(const auto j: members){
+							add_susceptible_agent(schedule, nodes[j], j);
+						  }
+						});
+}
+
+void list_agents_to_update(progression_schedule& schedule, int cur_time){
+  auto& agents = schedule.agents;
+  auto& marked = schedule.marked;
+  auto add = [&](count_type j){
+	if(!marked[j]){
+	  marked[j] = 1;
+	  if(!schedule.sweep){
+		agents.push_back(j);
+	  }
+	}
+  };
+  for(auto j: schedule.due[cur_time]){
+	add(j);
+  }
+  for(auto j: schedule.infective){
+	add(j);
+  }
+  vector<count_type>().swap(schedule.due[cur_time]);
+  if(schedule.sweep){
+	return;
+  }
+  //Once a good part of the agents is listed, a pass over the flags puts them
+  //in order faster than sorting
+  if(agents.size() > marked.size() / 16){
+	count_type next = 0;
+	for(count_type j = 0; j < marked.size(); ++j){
+	  if(marked[j]){
+		agents[next++] = j;
+		marked[j] = 0;
+	  }
+	}
+  }
+  else{
+	std::sort(agents.begin(), agents.end());
+	for(auto j: agents){
+	  marked[j] = 0;
+	}
+  }
+}
+
+void update_all_kappa(vector<agent>& nodes, vector<house>& homes, vector<workplace>& workplaces, vector<community>& communities, nbr_cell_grid& nbr_cells, intervention_schedule& intv_schedule, int cur_time){
   intervention_params intv_params_local;
   if(cur_time < GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS*GLOBAL.SIM_STEPS_PER_DAY){
     //get_kappa_no_intervention(nodes, homes, workplaces, communities,cur_time);
@@ -303,7 +620,7 @@ void update_all_kappa(vector<agent>& nodes, vector<house>& homes, vector<workpla
       get_kappa_containment(nodes, homes, workplaces, communities, nbr_cells, cur_time, GLOBAL.FIRST_PERIOD, Intervention::intv_ward_containment);
       break;
     case Intervention::intv_file_read:
-      get_kappa_file_read(nodes, homes, workplaces, communities, nbr_cells, intv_params, cur_time);
+      get_kappa_file_read(nodes, homes, workplaces, communities, nbr_cells, intv_schedule, cur_time);
       break;
     default:
       //get_kappa_no_intervention(nodes, homes, workplaces, communities, cur_time);
@@ -345,18 +662,21 @@ double get_individual_lambda_cohort(const agent& node, int cur_time){
 }
 
 void update_lambda_intra_cohort(std::unordered_map<count_type, vector<cohort_space>>& cohorts, vector<agent>& nodes, int cur_time){
-
-	for (auto& it1: cohorts) { //cohort_hash (src*100) + dst
-		for (auto& cohort_it: it1.second) {
-			double sum_value = 0;
-			if(cur_time % 2){
-				for (auto& j: cohort_it.internal_nodes){
-					sum_value += get_individual_lambda_cohort(nodes[j], cur_time);
-				}
+	const auto cohort_list = list_cohorts(cohorts);
+	const count_type NUM_COHORTS = cohort_list.size();
+	const bool travelling = cur_time % 2;
+
+#pragma omp parallel for default(none) shared(cohort_list, nodes, cur_time, travelling, NUM_COHORTS) \
+  schedule(dynamic, 64)
+	for (count_type c = 0; c < NUM_COHORTS; ++c) {
+		auto& cohort_it = *cohort_list[c];
+		double sum_value = 0;
+		if(travelling){
+			for (auto& j: cohort_it.internal_nodes){
+				sum_value += get_individual_lambda_cohort(nodes[j], cur_time);
 			}
-			cohort_it.lambda_interaction_internal = cohort_it.scale * sum_value;
-			// if (bernoulli(0.01)){std::cout<<cohort_it.lambda_interaction_internal<<cohort_it.internal_nodes.size()<<std::endl;}
 		}
+		cohort_it.lambda_interaction_internal = cohort_it.scale * sum_value;
 	}
 }
 
@@ -373,54 +693,45 @@ void update_lambda_inter_cohort(
   reset_cohort_lambdas(cohorts);
   //morning trip
   if (cur_time % GLOBAL.SIM_STEPS_PER_DAY == 1){
-    for (auto& coach_line : am_coachs) {
-      for (auto& coach : coach_line.second) {
-        for (auto& cohort_ptr: coach.cohorts) {
-          // auto current_cohort = cohorts[unordered_index][vector_index];
-          double sum_value = 0.0;
-
-          for (auto& cohort_ptr2: coach.cohorts) {
-            if (cohort_ptr == cohort_ptr2) {
-              continue;
-            }
-            // auto other_cohort = cohorts[unordered_index2][vector_index2];
-            double overlap_time = trains.GetOverlapMinutesAlongLine(
-              coach.trainLine,
-              cohort_ptr->source_station,
-              cohort_ptr->destination_station,
-              cohort_ptr2->source_station,
-              cohort_ptr2->destination_station);
-            sum_value += cohort_ptr2->lambda_interaction_internal * overlap_time;
-          }
-          cohort_ptr->lambda_interaction_external += sum_value;
-        }
-      }
-    }
+    add_inter_cohort_lambdas(am_coachs, trains, true);
   }
   //evening trip
   else if (cur_time % GLOBAL.SIM_STEPS_PER_DAY == 3){
-    for (auto& coach_line : pm_coachs) {
-      for (auto& coach : coach_line.second) {
-        for (auto& cohort_ptr: coach.cohorts) {
-          double sum_value = 0.0;
-
-          for (auto& cohort_ptr2: coach.cohorts) {
-            if (cohort_ptr == cohort_ptr2) {
-              continue;
-            }
-			// Reversing src dest for PM.
-            double overlap_time = trains.GetOverlapMinutesAlongLine(
-              coach.trainLine,
-              cohort_ptr->destination_station,
-              cohort_ptr->source_station,
-              cohort_ptr2->destination_station,
-              cohort_ptr2->source_station);
-            sum_value += cohort_ptr2->lambda_interaction_internal * overlap_time;
-          }
-          cohort_ptr->lambda_interaction_external += sum_value;
-        }
-      }
-    }
+    add_inter_cohort_lambdas(pm_coachs, trains, false);
+  }
+}
+
+void update_location_lambdas(const vector<agent>& nodes, vector<house>& homes,
+							 vector<workplace>& workplaces,
+							 location_age_mixing& age_mixing){
+  const auto NUM_HOMES = homes.size();
+  const auto NUM_WORKPLACES = workplaces.size();
+  if(GLOBAL.USE_AGE_DEPENDENT_MIXING){
+	update_age_dependent_mixing(nodes, homes, age_mixing.homes,
+								[](const agent& node){ return node.lambda_h; });
+	update_age_dependent_mixing(nodes, workplaces, age_mixing.schools,
+								[](const agent& node){ return node.lambda_w; });
+	update_age_dependent_mixing(nodes, workplaces, age_mixing.workplaces,
+								[](const agent& node){ return node.lambda_w; });
+#pragma omp parallel for default(none) shared(nodes, workplaces, NUM_WORKPLACES) \
+  schedule(dynamic, 64)
+	for(count_type w = 0; w < NUM_WORKPLACES; ++w){
+	  updated_lambda_project(nodes, workplaces[w]);
+	}
+  }
+  else{
+#pragma omp parallel for default(none) shared(nodes, homes, NUM_HOMES)
+	for(count_type h = 0; h < NUM_HOMES; ++h){
+	  updated_lambda_h_age_independent(nodes, homes[h]);
+	  //FEATURE_PROPOSAL: make the mixing dependent on node.age_group;
+	}
+#pragma omp parallel for default(none) shared(nodes, workplaces, NUM_WORKPLACES) \
+  schedule(dynamic, 64)
+	for(count_type w = 0; w < NUM_WORKPLACES; ++w){
+	  updated_lambda_w_age_independent(nodes, workplaces[w]);
+	  updated_lambda_project(nodes, workplaces[w]);
+	  //FEATURE_PROPOSAL: make the mixing dependent on node.age_group;
+	}
   }
 }
 
@@ -441,66 +752,6 @@ void updated_lambda_h_age_independent(const vector<agent>& nodes,  house& home){
   home.age_independent_mixing =  home.scale*sum_value;
 }
 
-void updated_lambda_h_age_dependent(const vector<agent>& nodes,  house& home, const matrix<double>& home_tx_u, const vector<double>& home_tx_sigma, const matrix<double>& home_tx_vT){
-  auto size = home_tx_u.size();
-
-  vector<double> age_component(GLOBAL.NUM_AGE_GROUPS, 0.0);
-  vector<double> lambda_age_group(GLOBAL.NUM_AGE_GROUPS, 0.0);
-  vector<double> V_tx(GLOBAL.SIGNIFICANT_EIGEN_VALUES, 0.0);
-
-  for (count_type i=0; i<home.individuals.size(); ++i){
-      int ind_age_group = nodes[home.individuals[i]].age_group;
-      age_component[ind_age_group] += nodes[home.individuals[i]].lambda_h;
-  }
-
-  for (count_type eigen_count=0; eigen_count<GLOBAL.SIGNIFICANT_EIGEN_VALUES; ++eigen_count){
-    for(count_type count=0; count<size; ++count){
-      V_tx[eigen_count] += home_tx_vT[eigen_count][count]
-                           * age_component[count];
-    }
-  }
-
-  for (count_type count=0; count<GLOBAL.NUM_AGE_GROUPS; ++count){
-    for (count_type eigen_count=0; eigen_count<GLOBAL.SIGNIFICANT_EIGEN_VALUES; ++eigen_count){
-      lambda_age_group[count] += home_tx_u[count][eigen_count]
-                          * home_tx_sigma[eigen_count]
-                          * V_tx[eigen_count];
-    }
-	lambda_age_group[count] *= home.scale;
-  }
-  home.age_dependent_mixing = std::move(lambda_age_group);
-}
-
-void updated_lambda_w_age_dependent(const vector<agent>& nodes, workplace& workplace, const matrix<double>& workplace_tx_u, const vector<double>& workplace_tx_sigma, const matrix<double>& workplace_tx_vT){
-
-    auto size = workplace_tx_u.size();
-
-    vector<double> age_component(GLOBAL.NUM_AGE_GROUPS, 0.0);
-    vector<double> lambda_age_group(GLOBAL.NUM_AGE_GROUPS, 0.0);
-    vector<double> V_tx(GLOBAL.SIGNIFICANT_EIGEN_VALUES, 0.0);
-    for (count_type i=0; i<workplace.individuals.size(); ++i){
-        int ind_age_group = nodes[workplace.individuals[i]].age_group;
-        age_component[ind_age_group] += nodes[workplace.individuals[i]].lambda_w;
-    }
-
-    for (count_type eigen_count=0; eigen_count<GLOBAL.SIGNIFICANT_EIGEN_VALUES; ++eigen_count){
-      for(count_type count=0; count<size; ++count){
-        V_tx[eigen_count] += workplace_tx_vT[eigen_count][count]
-                             * age_component[count];
-      }
-    }
-
-    for (count_type count=0; count<GLOBAL.NUM_AGE_GROUPS; ++count){
-      for (count_type eigen_count=0; eigen_count<GLOBAL.SIGNIFICANT_EIGEN_VALUES; ++eigen_count){
-        lambda_age_group[count] += workplace_tx_u[count][eigen_count]
-                            * workplace_tx_sigma[eigen_count]
-                            * V_tx[eigen_count];
-      }
-	  lambda_age_group[count] *=  workplace.scale;
-    }
-    workplace.age_dependent_mixing = std::move(lambda_age_group);
-}
-
 vector<double> updated_lambda_c_local_age_dependent(const vector<agent>& nodes, const community& community, const matrix<double>& community_tx_u, const vector<double>& community_tx_sigma, const matrix<double>& community_tx_vT){
 
   auto size = community_tx_u.size();
@@ -552,9 +803,9 @@ double updated_travel_fraction(const vector<agent>& nodes, const int cur_time){
 		mask_factor = MASK_FACTOR;
 	  }
 	  ++actual_travellers;
-	  total_distance += nodes[i].commute_distance;
+	  total_distance += nodes[i].details().commute_distance;
 	  if(nodes[i].infective){
-		infected_distance += nodes[i].commute_distance * mask_factor;
+		infected_distance += nodes[i].details().commute_distance * mask_factor;
 	  }
 	}
   }
@@ -568,7 +819,7 @@ double updated_travel_fraction(const vector<agent>& nodes, const int cur_time){
 }
 
 //TODO: add cohorts here!!
-void update_lambdas(agent&node, const vector<house>& homes, const vector<workplace>& workplaces, const vector<community>& communities, const vector<vector<nbr_cell>>& nbr_cells, const double travel_fraction, const int cur_time, std::unordered_map<count_type, vector<cohort_space>>& cohorts){
+void update_lambdas(agent&node, const vector<house>& homes, const vector<workplace>& workplaces, const vector<community>& communities, const nbr_cell_grid& nbr_cells, const double travel_fraction, const int cur_time, std::unordered_map<count_type, vector<cohort_space>>& cohorts){
   node.lambda_incoming.set_zero();
   //Contributions from home, workplace, community, and travel
   if (GLOBAL.USE_AGE_DEPENDENT_MIXING){
@@ -622,7 +873,7 @@ void update_lambdas(agent&node, const vector<house>& homes, const vector<workpla
   if(nbr_cells.size()>0){
 	node.lambda_incoming.nbr_cell = node.kappa_C_incoming
 	  * node.zeta_a
-	  * nbr_cells[homes[node.home].neighbourhood.cell_x][homes[node.home].neighbourhood.cell_y].lambda_nbr
+	  * nbr_cells.of(homes[node.home]).lambda_nbr
 	  * node.hd_area_factor;
   }
   else{
@@ -633,7 +884,7 @@ void update_lambdas(agent&node, const vector<house>& homes, const vector<workpla
   //Travel only happens at "odd" times, twice a day
   if((cur_time % 2) && node.travels()){
 	node.lambda_incoming.travel = GLOBAL.BETA_TRAVEL
-	  * node.commute_distance
+	  * node.details().commute_distance
 	  * travel_fraction;
   }
 
@@ -656,21 +907,27 @@ void update_individual_lambda_cohort(vector<agent>&nodes, const int cur_time, st
 	if (!GLOBAL.ENABLE_COHORTS || !GLOBAL.TRAINS_RUNNING || ((cur_time % 2 )==0) ){
 		return;
 	}
-	for (auto& it1:cohorts){
-		for (auto& it2:it1.second){
-			for (auto indiv:it2.internal_nodes){				
-				auto& node=nodes[indiv];
-				if(node.attending){
-					double sum_interactions = it2.lambda_interaction_internal * it2.commute_time + it2.lambda_interaction_external;
-					//FIX: Possible problem related to GLOBAL.SIM_STEPS_PER_DAY. SHould cohorts lambda scale with GLOBAL.SIM_STEPS_PER_DAY?
-					node.lambda_incoming.cohorts = sum_interactions * node.kappa_W_incoming; //
-				
-					if(mask_active(cur_time) && node.compliant){	
-						node.lambda_incoming.cohorts *= GLOBAL.MASK_FACTOR;
-  					}
-				}				
-				node.lambda = node.lambda_incoming.sum();
+	const auto cohort_list = list_cohorts(cohorts);
+	const count_type NUM_COHORTS = cohort_list.size();
+	const bool masks = mask_active(cur_time);
+	const double MASK_FACTOR = GLOBAL.MASK_FACTOR;
+
+#pragma omp parallel for default(none) shared(cohort_list, nodes, masks, MASK_FACTOR, NUM_COHORTS) \
+  schedule(dynamic, 64)
+	for (count_type c = 0; c < NUM_COHORTS; ++c){
+		const auto& it2 = *cohort_list[c];
+		for (auto indiv:it2.internal_nodes){
+			auto& node=nodes[indiv];
+			if(node.attending){
+				double sum_interactions = it2.lambda_interaction_internal * it2.commute_time + it2.lambda_interaction_external;
+				//FIX: Possible problem related to GLOBAL.SIM_STEPS_PER_DAY. SHould cohorts lambda scale with GLOBAL.SIM_STEPS_PER_DAY?
+				node.lambda_incoming.cohorts = sum_interactions * node.kappa_W_incoming; //
+
+				if(masks && node.compliant){
+					node.lambda_incoming.cohorts *= MASK_FACTOR;
+				}
 			}
+			node.lambda = node.lambda_incoming.sum();
 		}
 	}
 	return;
@@ -680,7 +937,8 @@ void updated_lambda_c_local(const vector<agent>& nodes, community& community){
   double sum_value = 0;
   const auto SIZE = community.individuals.size();
 
-#pragma omp parallel for default(none) shared(nodes, community, SIZE) reduction (+: sum_value)
+  //Summed sequentially; run_simulation calls this for all communities in
+  //parallel
   for(count_type i = 0; i < SIZE; ++i){
 	sum_value
 	  += nodes[community.individuals[i]].lambda_c
@@ -690,6 +948,14 @@ void updated_lambda_c_local(const vector<agent>& nodes, community& community){
   community.lambda_community = community.scale*sum_value;
 }
 
+void updated_lambda_c_local_communities(const vector<agent>& nodes, vector<community>& communities){
+  const auto SIZE = communities.size();
+#pragma omp parallel for default(none) shared(nodes, communities, SIZE) schedule(dynamic, 1)
+  for(count_type c = 0; c < SIZE; ++c){
+	updated_lambda_c_local(nodes, communities[c]);
+  }
+}
+
 void updated_lambda_c_local_random_community(const vector<agent>& nodes, const vector<community>& communities, vector<house>& houses){
   const auto HOUSES_SIZE = houses.size();
 #pragma omp parallel for default(none) shared(houses, nodes, HOUSES_SIZE)
@@ -712,53 +978,73 @@ void updated_lambda_c_local_random_community(const vector<agent>& nodes, const v
   }
 }
 
-void update_lambda_nbr_cells(const vector<agent>& nodes, vector<vector<nbr_cell>>& nbr_cells, const vector<house>& houses, const vector<community>& communities){
-  for(count_type i=0; i<nbr_cells.size(); ++i){
-	for(count_type j=0; j<nbr_cells[i].size(); ++j){
-	  double sum_values = 0;
+void update_lambda_nbr_cells(const vector<agent>& nodes, nbr_cell_grid& nbr_cells, const vector<house>& houses, const vector<community>& communities){
+  //Cells are independent and each cell is summed sequentially, so the
+  //result does not depend on the number of threads
+  const auto SIZE = nbr_cells.size();
 #pragma omp parallel for default(none)					\
-  shared(nbr_cells, communities, nodes,					\
-		 houses, i, j)									\
-  reduction (+: sum_values)
-	  for(count_type h=0; h<nbr_cells[i][j].houses_list.size(); ++h){
-		const auto house_index = nbr_cells[i][j].houses_list[h];
-		for(count_type k=0; k<houses[house_index].individuals.size(); ++k){
-		  sum_values += nodes[houses[house_index].individuals[k]].lambda_nbr_cell
-			* std::min(communities[houses[house_index].community].w_c,
-					   houses[house_index].neighborhood_access_factor);
-		}
+  shared(nbr_cells, communities, nodes, houses, SIZE)	\
+  schedule(dynamic, 64)
+  for(count_type c=0; c<SIZE; ++c){
+	double sum_values = 0;
+	for(count_type h=0; h<nbr_cells[c].houses_list.size(); ++h){
+	  const auto house_index = nbr_cells[c].houses_list[h];
+	  for(count_type k=0; k<houses[house_index].individuals.size(); ++k){
+		sum_values += nodes[houses[house_index].individuals[k]].lambda_nbr_cell
+		  * std::min(communities[houses[house_index].community].w_c,
+					 houses[house_index].neighborhood_access_factor);
 	  }
-	  nbr_cells[i][j].lambda_nbr = nbr_cells[i][j].scale*sum_values;
 	}
+	nbr_cells[c].lambda_nbr = nbr_cells[c].scale*sum_values;
   }
 }
 
 
 void update_lambda_c_global(vector<community>& communities,
-							const matrix<double>& community_distance_fk_matrix){
+							const community_kernel& kernel){
   const auto SIZE = communities.size();
-  for (count_type c1 = 0; c1 < SIZE; ++c1){
-	double num = 0;
-	double denom = 0;
-
+  vector<double> num(SIZE, 0);
+  if(kernel.sparse){
+	for (count_type c1 = 0; c1 < SIZE; ++c1){
+	  for(count_type k = kernel.row_offsets[c1]; k < kernel.row_offsets[c1 + 1]; ++k){
+		num[c1] += kernel.values[k] * communities[kernel.columns[k]].lambda_community;
+	  }
+	}
+  } else {
+	vector<double> lambda_community(SIZE);
 	for (count_type c2 = 0; c2 < SIZE; ++c2){
-	  double fk_val = community_distance_fk_matrix[c1][c2];
-	  num += fk_val * communities[c2].lambda_community;
-	  denom += fk_val;
+	  lambda_community[c2] = communities[c2].lambda_community;
 	}
-	if(denom==0){
+#ifdef USE_BLAS
+	cblas_dgemv(CblasRowMajor, CblasNoTrans, SIZE, SIZE, 1.0,
+				kernel.weights.data(), SIZE, lambda_community.data(), 1,
+				0.0, num.data(), 1);
+#else
+	for (count_type c1 = 0; c1 < SIZE; ++c1){
+	  const double* row = kernel.weights.data() + c1 * SIZE;
+	  double row_num = 0;
+	  for (count_type c2 = 0; c2 < SIZE; ++c2){
+		row_num += row[c2] * lambda_community[c2];
+	  }
+	  num[c1] = row_num;
+	}
+#endif
+  }
+
+  for (count_type c1 = 0; c1 < SIZE; ++c1){
+	if(kernel.row_sum[c1]==0){
 		communities[c1].lambda_community_global = 0;
 	} else{
-		communities[c1].lambda_community_global = communities[c1].w_c*num/denom;
+		communities[c1].lambda_community_global = communities[c1].w_c*num[c1]/kernel.row_sum[c1];
 	}
-
   }
 }
 
 void update_test_request(vector<agent>& nodes, const vector<house>& homes,
 						 const vector<workplace>& workplaces, const vector<community>& communities,
-						 vector<vector<nbr_cell>>& nbr_cells, const count_type current_time, const vector<testing_probability>& testing_protocol){
+						 nbr_cell_grid& nbr_cells, const count_type current_time, const vector<testing_probability>& testing_protocol){
   testing_probability probabilities;
+  TRACING_COUNTERS = contact_tracing_counters();
   if(current_time >= GLOBAL.NUM_DAYS_BEFORE_INTERVENTIONS*GLOBAL.SIM_STEPS_PER_DAY){
 	switch(GLOBAL.TESTING_PROTOCOL){
 	case Testing_Protocol::no_testing:
@@ -998,42 +1284,39 @@ casualty_stats get_infected_community(const vector<agent>& nodes, const communit
   // Populate it afterwards...
 }
 
-void update_grid_cell_statistics(matrix<nbr_cell>& nbr_cells,
+void update_grid_cell_statistics(nbr_cell_grid& nbr_cells,
 								 vector<house>& homes,
 								 vector<agent>& nodes,
 								 const double locked_neighborhood_leakage,
 								 const double locked_neighborhood_threshold) {
-  for(auto& nbr_cell_row: nbr_cells){
-	for(auto& nbr_cell: nbr_cell_row){
-
-	  const auto SIZE = nbr_cell.houses_list.size();
-	  count_type num_active_hospitalisations = 0;
-
-#pragma omp parallel for shared(homes, nodes, nbr_cell) \
-  reduction(+: num_active_hospitalisations)
-	  for(count_type i = 0; i < SIZE; ++i){
-		for(const auto individual_index: homes[nbr_cell.houses_list[i]].individuals){
-		  if(nodes[individual_index].infection_status
-			 == Progression::hospitalised){
-			++num_active_hospitalisations;
-		  }
+  //Every home is in exactly one cell, so the cells are updated in parallel
+  //without sharing any home or agent
+  const auto NUM_CELLS = nbr_cells.size();
+#pragma omp parallel for shared(homes, nodes, nbr_cells) \
+  schedule(dynamic, 64)
+  for(count_type c = 0; c < NUM_CELLS; ++c){
+	auto& nbr_cell = nbr_cells[c];
+	count_type num_active_hospitalisations = 0;
+	for(const auto house_index: nbr_cell.houses_list){
+	  for(const auto individual_index: homes[house_index].individuals){
+		if(nodes[individual_index].infection_status
+		   == Progression::hospitalised){
+		  ++num_active_hospitalisations;
 		}
 	  }
-	  nbr_cell.num_active_hospitalisations = num_active_hospitalisations;
-	  nbr_cell.access_factor = interpolate(1.0, locked_neighborhood_leakage,
-										   double(nbr_cell.num_active_hospitalisations)/double(nbr_cell.population),
-										   locked_neighborhood_threshold);
-
-#pragma omp parallel for shared(homes, nodes, nbr_cell)
-	  for(count_type i = 0; i < SIZE; ++i){
-		homes[nbr_cell.houses_list[i]].neighborhood_access_factor
+	}
+	nbr_cell.num_active_hospitalisations = num_active_hospitalisations;
+	nbr_cell.access_factor = interpolate(1.0, locked_neighborhood_leakage,
+										 double(nbr_cell.num_active_hospitalisations)/double(nbr_cell.population),
+										 locked_neighborhood_threshold);
+
+	for(const auto house_index: nbr_cell.houses_list){
+	  homes[house_index].neighborhood_access_factor
+		= nbr_cell.access_factor;
+	  for(const auto individual_index: homes[house_index].individuals){
+		nodes[individual_index].neighborhood_access_factor
 		  = nbr_cell.access_factor;
-		for(const auto individual_index: homes[nbr_cell.houses_list[i]].individuals){
-		  nodes[individual_index].neighborhood_access_factor
-			= nbr_cell.access_factor;
-		}
 	  }
-
 	}
   }
 }
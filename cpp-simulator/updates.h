@@ -26,12 +26,85 @@ struct node_update_status{
 //Returns whether the node was infected or turned symptomatic in this time step
 node_update_status update_infection(agent& node, int cur_time);
 
+//Pending disease-state transitions, used when EVENT_DRIVEN_PROGRESSION is
+//enabled. due[t] lists the agents whose current state ends at timestep t and
+//infective lists the agents whose outgoing lambdas change from step to step.
+//agents lists the susceptible agents with a nonzero lambda, collected from
+//the locations and cohorts with a nonzero lambda, unless sweep is set, in
+//which case the next step goes over every agent to find them. marked flags
+//the agents listed while the agents of a step are gathered.
+struct progression_schedule{
+  std::vector<std::vector<count_type>> due;
+  std::vector<count_type> infective;
+  std::vector<count_type> agents;
+  std::vector<char> marked;
+  bool sweep = true;
+};
+
+//First timestep after cur_time at which update_infection moves the node out
+//of its current state, or -1 if the state has no scheduled end.
+int next_transition_time(const agent& node, int cur_time);
+
+void schedule_next_transition(progression_schedule& schedule, const agent& node,
+                              count_type index, int cur_time);
+
+//Schedules every agent from its current state; cur_time is the first
+//timestep to be simulated.
+void build_progression_schedule(progression_schedule& schedule,
+                                const std::vector<agent>& nodes, int cur_time);
+
+//Lists the susceptible agents with a nonzero lambda after the agent lambdas
+//of timestep cur_time are updated, by visiting the members of the homes,
+//workplaces, communities and cohorts whose lambdas can give an agent a
+//nonzero lambda. If these cover a good part of the agents, or travel can
+//give any agent a lambda, it sets sweep instead.
+void collect_susceptible_agents(progression_schedule& schedule,
+                                const std::vector<agent>& nodes,
+                                const std::vector<house>& homes,
+                                const std::vector<workplace>& workplaces,
+                                const std::vector<community>& communities,
+                                const nbr_cell_grid& nbr_cells,
+                                std::unordered_map<count_type, std::vector<cohort_space>>& cohorts,
+                                double travel_fraction, int cur_time);
+
+//Takes the agents with a transition due at cur_time and the infective agents
+//off the schedule, and either flags them, with sweep, or adds them to the
+//susceptible agents listed and sorts the list.
+void list_agents_to_update(progression_schedule& schedule, int cur_time);
+
+//Calls f, in increasing order, on every agent update_infection has to be
+//called on at cur_time: agents with a transition due, infective agents and
+//susceptible agents with a nonzero lambda. For every other agent
+//update_infection would change nothing. infective is emptied before the
+//first call, so that f can list the agents that are infective afterwards.
+template<class F>
+void for_each_agent_to_update(progression_schedule& schedule,
+                              const std::vector<agent>& nodes, int cur_time, F f){
+  list_agents_to_update(schedule, cur_time);
+  schedule.infective.clear();
+  if(schedule.sweep){
+    for(count_type j = 0; j < nodes.size(); ++j){
+      const bool update = schedule.marked[j]
+        || (nodes[j].infection_status == Progression::susceptible && nodes[j].lambda > 0);
+      schedule.marked[j] = 0;
+      if(update){
+        f(j);
+      }
+    }
+  }
+  else{
+    for(const auto j: schedule.agents){
+      f(j);
+    }
+  }
+}
+
 void update_all_kappa(std::vector<agent>& nodes, 
                       std::vector<house>& homes,
                       std::vector<workplace>& workplaces, 
                       std::vector<community>& communities, 
-                      matrix<nbr_cell>& nbr_cells, 
-                      std::vector<intervention_params>& intv_params, 
+                      nbr_cell_grid& nbr_cells, 
+                      intervention_schedule& intv_schedule, 
                       int cur_time);
 
 void updated_lambda_w_age_independent(const std::vector<agent>& nodes, 
@@ -39,22 +112,36 @@ void updated_lambda_w_age_independent(const std::vector<agent>& nodes,
 
 void updated_lambda_h_age_independent(const std::vector<agent>& nodes, house& home);
 
+//Home, workplace and project lambdas of all locations. Locations are updated
+//in parallel and each sums over its members in a fixed order, so the results
+//do not depend on the number of threads. With USE_AGE_DEPENDENT_MIXING, the
+//age-dependent mixing is computed in batches using age_mixing, as set up by
+//init_location_age_mixing.
+void update_location_lambdas(const std::vector<agent>& nodes,
+                             std::vector<house>& homes,
+                             std::vector<workplace>& workplaces,
+                             location_age_mixing& age_mixing);
+
 double updated_travel_fraction(const std::vector<agent>& nodes, int cur_time);
 
 void update_lambdas(agent&node, const std::vector<house>& homes, 
                     const std::vector<workplace>& workplaces, 
                     const std::vector<community>& communities, 
-                    const std::vector<std::vector<nbr_cell>>& nbr_cells, 
+                    const nbr_cell_grid& nbr_cells, 
                     const double travel_fraction, 
                     const int cur_time, 
                     std::unordered_map<count_type, std::vector<cohort_space>>& cohorts);
 
 void updated_lambda_c_local(const std::vector<agent>& nodes, community& community);
+
+//updated_lambda_c_local for every community, in parallel over communities
+void updated_lambda_c_local_communities(const std::vector<agent>& nodes,
+                                        std::vector<community>& communities);
 void updated_lambda_c_local_random_community(const std::vector<agent>& nodes, 
                                               const std::vector<community>& communities, 
                                               std::vector<house>& houses);
 void update_lambda_nbr_cells(const std::vector<agent>& nodes, 
-                              std::vector<std::vector<nbr_cell>>& nbr_cells, 
+                              nbr_cell_grid& nbr_cells, 
                               const std::vector<house>& houses, 
                               const std::vector<community>& communities);
 
@@ -76,26 +163,15 @@ void update_test_request(std::vector<agent>& nodes,
                          const std::vector<house>& homes, 
                          const std::vector<workplace>& workplaces, 
                          const std::vector<community>& communities, 
-                         std::vector<std::vector<nbr_cell>>& nbr_cells, 
+                         nbr_cell_grid& nbr_cells, 
                          const count_type current_time, 
                          const std::vector<testing_probability>& testing_protocol);
 void update_test_status(std::vector<agent>& nodes, count_type current_time);
 
 
 // Age stratification update functions.
-void updated_lambda_w_age_dependent(const std::vector<agent>& nodes, 
-                                    workplace& workplace, 
-                                    const matrix<double>& workplace_tx_u, 
-                                    const std::vector<double>& workplace_tx_sigma, 
-                                    const matrix<double>& workplace_tx_vT);
 void updated_lambda_project(const std::vector<agent>& nodes, workplace& workplace);
 
-void updated_lambda_h_age_dependent(const std::vector<agent>& nodes, 
-                                    house& home, 
-                                    const matrix<double>& home_tx_u,
-                                    const std::vector<double>& home_tx_sigma, 
-                                    const matrix<double>& home_tx_vT);
-
 std::vector<double> updated_lambda_c_local_age_dependent(
                       const std::vector<agent>& nodes, 
                       const community& community,
@@ -104,7 +180,7 @@ std::vector<double> updated_lambda_c_local_age_dependent(
                       const matrix<double>& community_tx_vT);
 
 void update_lambda_c_global(std::vector<community>& communities, 
-                            const matrix<double>& community_distance_matrix);
+                            const community_kernel& kernel);
 
 struct casualty_stats{
   count_type affected = 0;
@@ -141,7 +217,7 @@ struct casualty_stats{
 casualty_stats get_infected_community(const std::vector<agent>& nodes, 
                                       const community& community);
 
-void update_grid_cell_statistics(matrix<nbr_cell>& nbr_cells,
+void update_grid_cell_statistics(nbr_cell_grid& nbr_cells,
 								 std::vector<house>& homes,
 								 std::vector<agent>& nodes,
 								 double locked_neighborhood_leakage,
@@ -11,11 +11,71 @@ import matplotlib.pyplot as plt
 import numpy as np
 import os
 import re
+import sys
+import json
+import time
 from collections import defaultdict
+from contextlib import contextmanager
 import argparse
 from matplotlib.patches import Rectangle
 import matplotlib.patches as mpatches
 
+# Per-stage profile of the analysis: wall time, peak RSS and the CSV files
+# read in each stage. Written as JSON by write_stage_report.
+STAGE_REPORT = []
+_IO_COUNTERS = {'files_read': 0, 'bytes_read': 0}
+
+def get_peak_rss_mb():
+    """Peak resident set size of this process in MB (0 if unavailable)"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def read_csv(file_path, **kwargs):
+    """pd.read_csv that also counts files and bytes for the stage report"""
+    df = pd.read_csv(file_path, **kwargs)
+    _IO_COUNTERS['files_read'] += 1
+    _IO_COUNTERS['bytes_read'] += os.path.getsize(file_path)
+    return df
+
+@contextmanager
+def profile_stage(name, **labels):
+    """Record wall time, peak RSS and files/bytes read for one analysis stage"""
+    files_before = _IO_COUNTERS['files_read']
+    bytes_before = _IO_COUNTERS['bytes_read']
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = {'stage': name}
+        entry.update(labels)
+        entry.update({
+            'wall_time_s': round(time.perf_counter() - start, 4),
+            'peak_rss_mb': round(get_peak_rss_mb(), 1),
+            'files_read': _IO_COUNTERS['files_read'] - files_before,
+            'bytes_read': _IO_COUNTERS['bytes_read'] - bytes_before
+        })
+        STAGE_REPORT.append(entry)
+
+def write_stage_report(output_dir, filename='stage_timings.json'):
+    """Write the stages recorded so far and reset the report"""
+    report = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'total_wall_time_s': round(sum(entry['wall_time_s'] for entry in STAGE_REPORT), 4),
+        'peak_rss_mb': round(get_peak_rss_mb(), 1),
+        'stages': list(STAGE_REPORT)
+    }
+    report_path = os.path.join(output_dir, filename)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved stage timings: {report_path}")
+    STAGE_REPORT.clear()
+    return report_path
+
 def setup_plot_style():
     """Configure matplotlib to match JavaScript styling"""
     plt.rcParams.update({
@@ -276,7 +336,7 @@ def load_city_data_for_comparison(city_dirs, metric_file):
         file_path = os.path.join(city_info['path'], metric_file)
         if os.path.exists(file_path):
             try:
-                df = pd.read_csv(file_path)
+                df = read_csv(file_path)
                 if len(df.columns) >= 2:
                     # Normalize to percentage of population
                     normalized_data = normalize_to_percentage(
@@ -295,6 +355,79 @@ def load_city_data_for_comparison(city_dirs, metric_file):
     
     return city_data
 
+# Metric files read by the comparative views; each is read once per city by
+# extract_comparison_metrics.
+COMPARISON_METRIC_FILES = {
+    'infected': 'num_infected.csv',
+    'cases': 'num_cases.csv',
+    'hospitalised': 'num_hospitalised.csv',
+    'fatalities': 'num_fatalities.csv',
+    'recovered': 'num_recovered.csv',
+    'affected': 'num_affected.csv'
+}
+
+def estimate_doubling_time(time, values, lower=10, upper_fraction=0.5):
+    """Doubling time (days) from a log-linear fit to the early growth phase"""
+    values = np.asarray(values, dtype=float)
+    time = np.asarray(time, dtype=float)
+    if len(values) == 0:
+        return np.nan
+    # Growth phase: from the first `lower` counts up to a fraction of the peak
+    peak_idx = int(np.argmax(values))
+    mask = (values[:peak_idx + 1] >= lower) & (values[:peak_idx + 1] <= upper_fraction * values[peak_idx])
+    if mask.sum() < 2:
+        return np.nan
+    slope = np.polyfit(time[:peak_idx + 1][mask], np.log(values[:peak_idx + 1][mask]), 1)[0]
+    if slope <= 0:
+        return np.nan
+    return np.log(2) / slope
+
+def extract_comparison_metrics(city_dirs, metric_files=COMPARISON_METRIC_FILES):
+    """Read every metric file once per city into one tidy table
+    (one row per city and metric)"""
+    rows = []
+    for city_info in city_dirs:
+        population = city_info['population_num']
+        for metric, metric_file in metric_files.items():
+            file_path = os.path.join(city_info['path'], metric_file)
+            if not os.path.exists(file_path):
+                continue
+            try:
+                df = read_csv(file_path)
+            except Exception as e:
+                print(f"Error loading {metric_file} for {city_info['full_name']}: {e}")
+                continue
+            if len(df.columns) < 2 or len(df) == 0:
+                continue
+            time = df.iloc[:, 0].values
+            values = df.iloc[:, 1].values
+            peak_idx = int(np.argmax(values))
+            final_value = values[-1]
+            rows.append({
+                'city': city_info['city'],
+                'full_name': city_info['full_name'],
+                'population': city_info['population'],
+                'population_num': population,
+                'metric': metric,
+                'peak_value': values[peak_idx],
+                'peak_day': time[peak_idx],
+                'peak_pct': normalize_to_percentage(values[peak_idx], population),
+                'final_value': final_value,
+                'final_pct': normalize_to_percentage(final_value, population),
+                'attack_rate': normalize_to_percentage(final_value, population) if metric == 'affected' else np.nan,
+                'doubling_time': estimate_doubling_time(time, values) if metric == 'affected' else np.nan
+            })
+    return pd.DataFrame(rows, columns=['city', 'full_name', 'population', 'population_num', 'metric',
+                                       'peak_value', 'peak_day', 'peak_pct', 'final_value', 'final_pct',
+                                       'attack_rate', 'doubling_time'])
+
+def lookup_metric(metrics_df, city_info, metric):
+    """Row of the tidy metrics table for one city and metric, or None"""
+    row = metrics_df[(metrics_df['full_name'] == city_info['full_name']) & (metrics_df['metric'] == metric)]
+    if row.empty:
+        return None
+    return row.iloc[0]
+
 def create_javascript_style_plots(output_dir, city_info, case_detection_ratio=0.8):
     """Create plots matching JavaScript sim.js styling and structure"""
     
@@ -353,7 +486,7 @@ def create_javascript_style_plots(output_dir, city_info, case_detection_ratio=0.
         for i, filename in enumerate(config['files']):
             if os.path.exists(filename):
                 try:
-                    df = pd.read_csv(filename)
+                    df = read_csv(filename)
                     if len(df.columns) >= 2:
                         time_col = df.columns[0]
                         metric_col = df.columns[1]
@@ -462,7 +595,7 @@ def create_transmission_subplot(axes, start_idx, colors):
         for filename, label, color in transmission_files:
             if os.path.exists(filename):
                 try:
-                    df = pd.read_csv(filename)
+                    df = read_csv(filename)
                     if len(df.columns) >= 2:
                         ax.plot(df.iloc[:, 0], df.iloc[:, 1], 
                                label=label, color=color, linewidth=3, alpha=0.8)
@@ -584,7 +717,7 @@ def create_daily_plots(output_dir, city_info):
         
         if os.path.exists(config['file']):
             try:
-                df = pd.read_csv(config['file'])
+                df = read_csv(config['file'])
                 if len(df.columns) >= 2:
                     time_col = df.columns[0]
                     metric_col = df.columns[1]
@@ -758,7 +891,7 @@ def create_cumulative_plots(output_dir, city_info):
         
         if os.path.exists(config['file']):
             try:
-                df = pd.read_csv(config['file'])
+                df = read_csv(config['file'])
                 if len(df.columns) >= 2:
                     time_col = df.columns[0]
                     metric_col = df.columns[1]
@@ -885,7 +1018,7 @@ def create_comprehensive_current_state_plots(output_dir, city_info):
         
         if os.path.exists(config['file']):
             try:
-                df = pd.read_csv(config['file'])
+                df = read_csv(config['file'])
                 if len(df.columns) >= 2:
                     time_col = df.columns[0]
                     metric_col = df.columns[1]
@@ -998,7 +1131,7 @@ def create_comprehensive_lambda_plots(output_dir, city_info):
         for location, (filename, color) in category_files.items():
             if os.path.exists(filename):
                 try:
-                    df = pd.read_csv(filename)
+                    df = read_csv(filename)
                     if len(df.columns) >= 2:
                         time_col = df.columns[0]
                         metric_col = df.columns[1]
@@ -1042,7 +1175,7 @@ def create_surveillance_analysis(output_dir, city_info, case_detection_ratios=[0
         return
     
     try:
-        df = pd.read_csv('num_infected.csv')
+        df = read_csv('num_infected.csv')
         if len(df.columns) < 2:
             print("Invalid infection data format")
             return
@@ -1119,7 +1252,7 @@ def analyze_simulation_parameters(city_info):
         print("\n" + "="*50)
         print("DISEASE STATISTICS SUMMARY") 
         print("="*50)
-        df = pd.read_csv('disease_label_stats.csv')
+        df = read_csv('disease_label_stats.csv')
         print(df.head(10))
 
 def print_key_statistics(city_info):
@@ -1141,7 +1274,7 @@ def print_key_statistics(city_info):
     
     for filename, description in key_files:
         if os.path.exists(filename):
-            df = pd.read_csv(filename)
+            df = read_csv(filename)
             if len(df.columns) >= 2:
                 max_val = df.iloc[:, 1].max()
                 final_val = df.iloc[-1, 1]
@@ -1244,15 +1377,19 @@ def create_comparative_dashboard(output_dir, city_dirs):
     plt.show()
     plt.close()
 
-def create_peak_comparison_bar_chart(output_dir, city_dirs):
+def create_peak_comparison_bar_chart(output_dir, city_dirs, metrics_df=None):
     """Create bar chart comparing peak values across cities"""
     
     colors = get_enhanced_colorblind_palette()
     
+    if metrics_df is None:
+        metrics_df = extract_comparison_metrics(city_dirs)
+    
+    # Fatalities are cumulative, so their final value is shown
     metrics = {
-        'Peak Infections (%)': 'num_infected.csv',
-        'Peak Hospitalizations (%)': 'num_hospitalised.csv',
-        'Total Fatalities (%)': 'num_fatalities.csv'
+        'Peak Infections (%)': ('infected', 'peak_pct'),
+        'Peak Hospitalizations (%)': ('hospitalised', 'peak_pct'),
+        'Total Fatalities (%)': ('fatalities', 'final_pct')
     }
     
     fig, axes = plt.subplots(1, 3, figsize=(20, 8))
@@ -1260,7 +1397,7 @@ def create_peak_comparison_bar_chart(output_dir, city_dirs):
                 'Normalized as Percentage of Population (0-100% Scale)', 
                 fontsize=18, fontweight='bold', y=0.95)
     
-    for idx, (metric_name, metric_file) in enumerate(metrics.items()):
+    for idx, (metric_name, (metric, column)) in enumerate(metrics.items()):
         ax = axes[idx]
         
         # Collect peak values for all cities
@@ -1268,24 +1405,10 @@ def create_peak_comparison_bar_chart(output_dir, city_dirs):
         peak_values = []
         
         for city_info in city_dirs:
-            file_path = os.path.join(city_info['path'], metric_file)
-            if os.path.exists(file_path):
-                try:
-                    df = pd.read_csv(file_path)
-                    if len(df.columns) >= 2:
-                        if 'Fatalities' in metric_name:
-                            # For fatalities, use final value (cumulative)
-                            raw_value = df.iloc[-1, 1]
-                        else:
-                            # For others, use peak value
-                            raw_value = df.iloc[:, 1].max()
-                        
-                        percentage = normalize_to_percentage(raw_value, city_info['population_num'])
-                        
-                        city_names.append(city_info['city'])
-                        peak_values.append(percentage)
-                except Exception as e:
-                    print(f"Error processing {metric_file} for {city_info['full_name']}: {e}")
+            row = lookup_metric(metrics_df, city_info, metric)
+            if row is not None:
+                city_names.append(city_info['city'])
+                peak_values.append(row[column])
         
         if peak_values:
             # Create bar chart
@@ -1327,15 +1450,20 @@ def create_peak_comparison_bar_chart(output_dir, city_dirs):
     plt.show()
     plt.close()
 
-def create_summary_statistics_table(output_dir, city_dirs):
+def create_summary_statistics_table(output_dir, city_dirs, metrics_df=None):
     """Create comprehensive summary statistics table"""
     
-    metrics_files = {
-        'Peak Infections (%)': 'num_infected.csv',
-        'Total Cases (%)': 'num_cases.csv',
-        'Peak Hospitalizations (%)': 'num_hospitalised.csv',
-        'Total Fatalities (%)': 'num_fatalities.csv',
-        'Final Recoveries (%)': 'num_recovered.csv'
+    if metrics_df is None:
+        metrics_df = extract_comparison_metrics(city_dirs)
+    
+    metrics_columns = {
+        'Peak Infections (%)': ('infected', 'peak_pct'),
+        'Total Cases (%)': ('cases', 'final_pct'),
+        'Peak Hospitalizations (%)': ('hospitalised', 'peak_pct'),
+        'Total Fatalities (%)': ('fatalities', 'final_pct'),
+        'Final Recoveries (%)': ('recovered', 'final_pct'),
+        'Attack Rate (%)': ('affected', 'attack_rate'),
+        'Doubling Time (days)': ('affected', 'doubling_time')
     }
     
     # Collect data
@@ -1344,23 +1472,14 @@ def create_summary_statistics_table(output_dir, city_dirs):
     for city_info in city_dirs:
         row = {'City': city_info['city'], 'Population': city_info['population']}
         
-        for metric_name, metric_file in metrics_files.items():
-            file_path = os.path.join(city_info['path'], metric_file)
-            if os.path.exists(file_path):
-                try:
-                    df = pd.read_csv(file_path)
-                    if len(df.columns) >= 2:
-                        if 'Peak' in metric_name:
-                            raw_value = df.iloc[:, 1].max()
-                        else:
-                            raw_value = df.iloc[-1, 1]  # Final value
-                        
-                        percentage = normalize_to_percentage(raw_value, city_info['population_num'])
-                        row[metric_name] = f"{percentage:.2f}%"
-                except Exception as e:
-                    row[metric_name] = "N/A"
-            else:
+        for metric_name, (metric, column) in metrics_columns.items():
+            metric_row = lookup_metric(metrics_df, city_info, metric)
+            if metric_row is None or pd.isna(metric_row[column]):
                 row[metric_name] = "N/A"
+            elif column == 'doubling_time':
+                row[metric_name] = f"{metric_row[column]:.2f}"
+            else:
+                row[metric_name] = f"{metric_row[column]:.2f}%"
         
         summary_data.append(row)
     
@@ -1413,14 +1532,17 @@ def create_summary_statistics_table(output_dir, city_dirs):
     df_summary.to_csv(csv_filename, index=False)
     print(f"Saved CSV: {csv_filename}")
 
-def create_timeline_comparison(output_dir, city_dirs):
+def create_timeline_comparison(output_dir, city_dirs, metrics_df=None):
     """Create timeline comparison showing when peaks occur"""
     
     colors = get_enhanced_colorblind_palette()
     
+    if metrics_df is None:
+        metrics_df = extract_comparison_metrics(city_dirs)
+    
     metrics = {
-        'Peak Infections': 'num_infected.csv',
-        'Peak Hospitalizations': 'num_hospitalised.csv'
+        'Peak Infections': 'infected',
+        'Peak Hospitalizations': 'hospitalised'
     }
     
     fig, axes = plt.subplots(1, 2, figsize=(16, 8))
@@ -1428,7 +1550,7 @@ def create_timeline_comparison(output_dir, city_dirs):
                 'Y-axis: Peak Value as % of Population (0-100% Scale)', 
                 fontsize=18, fontweight='bold', y=0.95)
     
-    for idx, (metric_name, metric_file) in enumerate(metrics.items()):
+    for idx, (metric_name, metric) in enumerate(metrics.items()):
         ax = axes[idx]
         
         city_names = []
@@ -1436,21 +1558,11 @@ def create_timeline_comparison(output_dir, city_dirs):
         peak_percentages = []
         
         for city_info in city_dirs:
-            file_path = os.path.join(city_info['path'], metric_file)
-            if os.path.exists(file_path):
-                try:
-                    df = pd.read_csv(file_path)
-                    if len(df.columns) >= 2:
-                        peak_idx = df.iloc[:, 1].idxmax()
-                        peak_day = df.iloc[peak_idx, 0]
-                        peak_value = df.iloc[peak_idx, 1]
-                        peak_percentage = normalize_to_percentage(peak_value, city_info['population_num'])
-                        
-                        city_names.append(city_info['city'])
-                        peak_days.append(peak_day)
-                        peak_percentages.append(peak_percentage)
-                except Exception as e:
-                    print(f"Error processing {metric_file} for {city_info['full_name']}: {e}")
+            row = lookup_metric(metrics_df, city_info, metric)
+            if row is not None:
+                city_names.append(city_info['city'])
+                peak_days.append(row['peak_day'])
+                peak_percentages.append(row['peak_pct'])
         
         if peak_days:
             # Create scatter plot
@@ -1504,27 +1616,36 @@ def analyze_single_city(city_info, base_output_dir):
     
     try:
         # Run streamlined analysis (removed JavaScript dashboard)
+        city = city_info['dir_name']
         print("\n1. Analyzing simulation parameters...")
-        analyze_simulation_parameters(city_info)
+        with profile_stage('analyze_simulation_parameters', city=city):
+            analyze_simulation_parameters(city_info)
         
         print("\n2. Creating surveillance parameter analysis...")
-        create_surveillance_analysis(output_dir, city_info)
+        with profile_stage('create_surveillance_analysis', city=city):
+            create_surveillance_analysis(output_dir, city_info)
         
         print("\n3. Creating daily new cases analysis...")
-        create_daily_plots(output_dir, city_info)
+        with profile_stage('create_daily_plots', city=city):
+            create_daily_plots(output_dir, city_info)
         
         print("\n4. Creating current population states analysis...")
-        create_comprehensive_current_state_plots(output_dir, city_info)
+        with profile_stage('create_comprehensive_current_state_plots', city=city):
+            create_comprehensive_current_state_plots(output_dir, city_info)
         
         print("\n5. Creating cumulative analysis...")
-        create_cumulative_plots(output_dir, city_info)
+        with profile_stage('create_cumulative_plots', city=city):
+            create_cumulative_plots(output_dir, city_info)
         
         print("\n6. Creating lambda evolution analysis...")
-        create_comprehensive_lambda_plots(output_dir, city_info)
+        with profile_stage('create_comprehensive_lambda_plots', city=city):
+            create_comprehensive_lambda_plots(output_dir, city_info)
         
         print("\n7. Summary statistics...")
-        print_key_statistics(city_info)
+        with profile_stage('print_key_statistics', city=city):
+            print_key_statistics(city_info)
         
+        write_stage_report(output_dir)
         return output_dir
         
     finally:
@@ -1532,7 +1653,8 @@ def analyze_single_city(city_info, base_output_dir):
         os.chdir(original_dir)
 
 def create_comparative_analysis(city_dirs, output_dir):
-    """Run comparative analysis with 0-100% scale - Only Dashboard"""
+    """Run comparative analysis with 0-100% scale: the dashboard, and the peak,
+    summary and timeline views of the shared comparison metrics table"""
     
     print("\n" + "="*80)
     print("CREATING COMPARATIVE ANALYSIS (0-100% SCALE)")
@@ -1543,7 +1665,29 @@ def create_comparative_analysis(city_dirs, output_dir):
         print(f"  - {city_info['full_name']} (Pop: {city_info['population']})")
     
     print("\n1. Creating comparative dashboard (normalized 0-100%)...")
-    create_comparative_dashboard(output_dir, city_dirs)
+    with profile_stage('create_comparative_dashboard', cities=len(city_dirs)):
+        create_comparative_dashboard(output_dir, city_dirs)
+    
+    print("\n2. Extracting comparison metrics...")
+    with profile_stage('extract_comparison_metrics', cities=len(city_dirs)):
+        metrics_df = extract_comparison_metrics(city_dirs)
+    csv_filename = f'{output_dir}/comparison_metrics.csv'
+    metrics_df.to_csv(csv_filename, index=False)
+    print(f"Saved CSV: {csv_filename}")
+    
+    print("\n3. Creating peak comparison bar chart...")
+    with profile_stage('create_peak_comparison_bar_chart', cities=len(city_dirs)):
+        create_peak_comparison_bar_chart(output_dir, city_dirs, metrics_df)
+    
+    print("\n4. Creating summary statistics table...")
+    with profile_stage('create_summary_statistics_table', cities=len(city_dirs)):
+        create_summary_statistics_table(output_dir, city_dirs, metrics_df)
+    
+    print("\n5. Creating timeline comparison...")
+    with profile_stage('create_timeline_comparison', cities=len(city_dirs)):
+        create_timeline_comparison(output_dir, city_dirs, metrics_df)
+    
+    write_stage_report(output_dir)
 
 def main():
     """Main function to run enhanced epidemic analysis"""
@@ -0,0 +1,108 @@
+#Copyright [2020] [Indian Institute of Science, Bangalore & Tata Institute of Fundamental Research, Mumbai]
+#SPDX-License-Identifier: Apache-2.0
+
+"""
+Description: Exports level-of-detail series from the cpp-simulator output, so
+that large runs can be plotted at daily, weekly or per-ward resolution instead
+of at SIM_STEPS_PER_DAY resolution per community.
+
+Inputs:
+input_dir: cpp-simulator output folder containing csvContent.csv, or the
+csvContent.npy table converted by visualization/csvcontent_store.py.
+output_dir: folder in which the levels and a manifest.json are written.
+
+The dashboard in sim.js plots its own in-browser simulation and does not read
+these files.
+
+Levels written (all series are lists of [day, value] pairs, the format used by
+plot_plotly in sim.js):
+daily.json       - city totals, end-of-day snapshot.
+weekly.json      - city totals, end-of-week snapshot.
+wards_daily.json - per-ward series, end-of-day snapshot.
+steps.json       - city totals at full resolution (only with --steps).
+
+"""
+
+import os
+import json
+import argparse
+import sys
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "visualization"))
+from csvcontent_store import CsvContentStore, hasCsvContentStore
+
+SIM_STEPS_PER_DAY = 4
+DAYS_PER_WEEK = 7
+
+METRICS = ["affected", "exposed", "infective", "symptomatic",
+           "hospitalised", "critical", "dead", "recovered"]
+
+def read_csv_content(input_dir):
+    # Prefer the memory-mapped table written by csvcontent_store.py
+    if hasCsvContentStore(input_dir):
+        df = CsvContentStore(input_dir).slice(columns = METRICS)
+    else:
+        df = pd.read_csv(os.path.join(input_dir, "csvContent.csv"),
+                         usecols = ["Time", "community"] + METRICS)
+    df["step"] = (df["Time"] * SIM_STEPS_PER_DAY).round().astype(int)
+    return df
+
+def end_of_period(df, steps_per_period):
+    # Keep the last simulated step of every period; the final period may be
+    # partial.
+    period = df["step"] // steps_per_period
+    last_step = df.groupby(period)["step"].transform("max")
+    return df[df["step"] == last_step]
+
+def to_pairs(df, x_column, metric):
+    return [[float(x), int(y)] for x, y in zip(df[x_column], df[metric])]
+
+def city_level(df):
+    return {metric: to_pairs(df, "Time", metric) for metric in METRICS}
+
+def build_levels(df, keep_steps):
+    city_steps = df.groupby("step", as_index = False)[METRICS].sum()
+    city_steps["Time"] = city_steps["step"] / SIM_STEPS_PER_DAY
+
+    daily = end_of_period(city_steps, SIM_STEPS_PER_DAY)
+    weekly = end_of_period(city_steps, SIM_STEPS_PER_DAY * DAYS_PER_WEEK)
+
+    ward_daily = end_of_period(df, SIM_STEPS_PER_DAY)
+    wards = {}
+    for ward, ward_df in ward_daily.groupby("community"):
+        wards[str(int(ward))] = city_level(ward_df)
+
+    levels = {"weekly": (len(weekly), city_level(weekly)),
+              "daily": (len(daily), city_level(daily)),
+              "wards_daily": (len(daily), wards)}
+    if keep_steps:
+        levels["steps"] = (len(city_steps), city_level(city_steps))
+    return levels
+
+def export_levels(input_dir, output_dir, keep_steps):
+    os.makedirs(output_dir, exist_ok = True)
+    levels = build_levels(read_csv_content(input_dir), keep_steps)
+    manifest = {"metrics": METRICS, "levels": []}
+    for name, (num_points, series) in levels.items():
+        file_name = name + ".json"
+        with open(os.path.join(output_dir, file_name), "w") as f:
+            json.dump(series, f, separators = (",", ":"))
+        manifest["levels"].append({"name": name,
+                                   "file": file_name,
+                                   "points": num_points,
+                                   "per_ward": name == "wards_daily"})
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent = 1)
+    print("Wrote {} levels to {}".format(len(manifest["levels"]), output_dir))
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Export level-of-detail series for the dashboard')
+    parser.add_argument('-i', help = 'cpp-simulator output folder', required = True)
+    parser.add_argument('-o', help = 'output folder for the exported levels', required = True)
+    parser.add_argument('--steps', help = 'also export full-resolution city totals', action = 'store_true')
+    args = parser.parse_args()
+    export_levels(args.i, args.o, args.steps)
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,19 @@ optionslist = [[0], [0,1],[0,0.33],[0,0.5],[0],[0]]
 lastperiodoptions = [1]
 
 options = list(itertools.product(*optionslist))
+
+def run_length_encode(days):
+    # Merge consecutive days with the same attendance into one entry, whose
+    # "repeat" gives the number of days (and "id" the first of them)
+    entries = []
+    for day in days:
+        values = {k: v for k, v in day.items() if k != "id"}
+        if entries and entries[-1][1] == values:
+            entries[-1][0]["repeat"] += 1
+        else:
+            entries.append(({"id": day["id"], "repeat": 1, **values}, values))
+    return [entry for (entry, values) in entries]
+
 count = 0
 for x in lastperiodoptions:
     for (a,b,c,d,e,f) in options:
@@ -67,9 +80,8 @@ for x in lastperiodoptions:
                 w[officeTypes['Other']] = x
             interventions.append(w)
 
-        f = open("attendance" + str_o + ".json", "w+")
-        f.write(json.dumps(interventions))
-        f.close
+        with open("attendance" + str_o + ".json", "w+") as f:
+            f.write(json.dumps(run_length_encode(interventions)))
 
 
 # In[ ]:
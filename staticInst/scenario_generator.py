@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#"""
+#Copyright [2020] [Indian Institute of Science, Bangalore & Tata Institute of Fundamental Research, Mumbai]
+#SPDX-License-Identifier: Apache-2.0
+#"""
+"""Generates attendance, intervention and testing protocol files for a sweep
+of simulator scenarios from a compact declarative spec.
+
+A spec lists scenarios.  Each scenario gives its schedules as lists of
+periods, and simulator options.  Any value in a scenario may be replaced by
+{"sweep": [v1, v2, ...]}; the scenario is then expanded into one run for each
+combination of swept values.  For example:
+
+    {
+      "options": {"NUM_DAYS": 120, "BETA_H": 1.227},
+      "scenarios": [
+        {
+          "name": "lockdown",
+          "intervention": [
+            {"num_days": 21, "lockdown": true,
+             "compliance": {"sweep": [0.6, 0.9]}},
+            {"num_days": 30, "case_isolation": true, "home_quarantine": true}
+          ],
+          "attendance": [
+            {"num_days": 21, "attendance": 0},
+            {"num_days": 30, "attendance": {"IT": 0.5, "Other": {"sweep": [0.5, 1]}}}
+          ]
+        }
+      ]
+    }
+
+Attendance periods apply from the start of the interventions, or from the
+first day of the simulation if the scenario sets
+"attendance_from_simulation_start": true.
+
+Identical schedules are written once, to a file named after a hash of their
+contents, and each run is recorded in the sweep manifest with the simulator
+options that select its files.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+
+# Office types, as numbered in the attendance file (enum OfficeType in the
+# simulator)
+OFFICE_TYPES = {"Other": 0, "SEZ": 1, "Government": 2, "IT": 3, "Construction": 4, "Medical": 5}
+
+# Intervention policies that are objects with an "active" member in the
+# intervention file, and their other members
+INTERVENTION_POLICIES = {
+    "case_isolation": [],
+    "home_quarantine": [],
+    "lockdown": ["kappa_values_compliant", "kappa_values_non_compliant"],
+    "social_dist_elderly": [],
+    "school_closed": ["SC_factor"],
+    "workplace_odd_even": [],
+    "trains": ["fraction_forced_to_take_train"],
+    "neighbourhood_containment": ["leakage", "threshold"],
+    "ward_containment": ["leakage", "threshold"],
+}
+INTERVENTION_VALUES = ["compliance", "compliance_hd", "community_factor", "locked_community_leakage"]
+
+TESTING_PROTOCOL_VALUES = [
+    "test_false_positive",
+    "test_false_negative",
+    "prob_test_index_symptomatic",
+    "prob_test_index_hospitalised",
+    "prob_test_household_positive_symptomatic",
+    "prob_test_household_hospitalised_symptomatic",
+    "prob_test_household_symptomatic_symptomatic",
+    "prob_test_household_positive_asymptomatic",
+    "prob_test_household_hospitalised_asymptomatic",
+    "prob_test_household_symptomatic_asymptomatic",
+    "prob_test_workplace_positive_symptomatic",
+    "prob_test_workplace_hospitalised_symptomatic",
+    "prob_test_workplace_symptomatic_symptomatic",
+    "prob_test_workplace_positive_asymptomatic",
+    "prob_test_workplace_hospitalised_asymptomatic",
+    "prob_test_workplace_symptomatic_asymptomatic",
+    "prob_test_school_positive_symptomatic",
+    "prob_test_school_hospitalised_symptomatic",
+    "prob_test_school_symptomatic_symptomatic",
+    "prob_test_school_positive_asymptomatic",
+    "prob_test_school_hospitalised_asymptomatic",
+    "prob_test_school_symptomatic_asymptomatic",
+    "prob_test_random_community_positive_symptomatic",
+    "prob_test_random_community_hospitalised_symptomatic",
+]
+
+# Simulator options that select each kind of schedule file
+SCHEDULE_OPTIONS = {
+    "attendance": {"attendance_filename": None},
+    "intervention": {"intervention_filename": None, "INTERVENTION": 16},
+    "testing_protocol": {"testing_protocol_filename": None, "TESTING_PROTOCOL": 2},
+}
+
+MANIFEST_FILE_NAME = "sweep_manifest.json"
+
+
+def num_days_of(period):
+    num_days = period.get("num_days")
+    if not isinstance(num_days, int) or num_days <= 0:
+        raise ValueError(f"period {period} needs a positive integer num_days")
+    return num_days
+
+
+def merge_periods(periods):
+    """Merges consecutive periods that differ only in num_days, so that the
+    same schedule written in different ways gives the same file."""
+    merged = []
+    for period in periods:
+        if merged and {**merged[-1], "num_days": 0} == {**period, "num_days": 0}:
+            merged[-1]["num_days"] += period["num_days"]
+        else:
+            merged.append(dict(period))
+    return merged
+
+
+def attendance_schedule(periods, from_simulation_start=False):
+    """Attendance file entries for a list of periods.
+
+    Each period has num_days and attendance, which is either one probability
+    for every office type or a dict from office type names to probabilities
+    (office types that are not given attend fully).  By default the file uses
+    num_days entries, so, as for the other schedules, it applies from the
+    start of the interventions.  With from_simulation_start, it uses repeat
+    entries instead, which apply from the first day of the simulation."""
+    length_key = "repeat" if from_simulation_start else "num_days"
+    entries = []
+    for period in periods:
+        unknown = set(period) - {"num_days", "attendance"}
+        if unknown:
+            raise ValueError(f"unknown attendance keys {sorted(unknown)}")
+        attendance = period.get("attendance", 1)
+        if not isinstance(attendance, dict):
+            attendance = {name: attendance for name in OFFICE_TYPES}
+        unknown = set(attendance) - set(OFFICE_TYPES)
+        if unknown:
+            raise ValueError(f"unknown office types {sorted(unknown)}")
+        entry = {"num_days": num_days_of(period)}
+        for name, office_type in OFFICE_TYPES.items():
+            entry[str(office_type)] = attendance.get(name, 1)
+        entries.append(entry)
+    return [{length_key: entry.pop("num_days"), **entry} for entry in merge_periods(entries)]
+
+
+def intervention_schedule(periods):
+    """Intervention file entries for a list of periods.
+
+    A policy is given either as true/false or as a dict of its members, in
+    which case it is active unless the dict sets "active"."""
+    entries = []
+    for period in periods:
+        entry = {"num_days": num_days_of(period)}
+        for key, value in period.items():
+            if key == "num_days":
+                continue
+            if key in INTERVENTION_VALUES:
+                entry[key] = value
+            elif key in INTERVENTION_POLICIES:
+                if isinstance(value, dict):
+                    unknown = set(value) - set(INTERVENTION_POLICIES[key]) - {"active"}
+                    if unknown:
+                        raise ValueError(f"unknown members {sorted(unknown)} of {key}")
+                    entry[key] = {"active": True, **value}
+                elif value:
+                    entry[key] = {"active": True}
+            else:
+                raise ValueError(f"unknown intervention key {key}")
+        entries.append(entry)
+    return merge_periods(entries)
+
+
+def testing_protocol_schedule(periods):
+    """Testing protocol file entries for a list of periods."""
+    for period in periods:
+        num_days_of(period)
+        unknown = set(period) - set(TESTING_PROTOCOL_VALUES) - {"num_days"}
+        if unknown:
+            raise ValueError(f"unknown testing protocol keys {sorted(unknown)}")
+    return merge_periods(periods)
+
+
+SCHEDULES = {
+    "attendance": attendance_schedule,
+    "intervention": intervention_schedule,
+    "testing_protocol": testing_protocol_schedule,
+}
+
+
+def find_sweeps(value, path=()):
+    """Paths to the {"sweep": [...]} values in a scenario, with their values."""
+    if isinstance(value, dict):
+        if set(value) == {"sweep"}:
+            return [(path, value["sweep"])]
+        return [sweep for key, item in value.items() for sweep in find_sweeps(item, path + (key,))]
+    if isinstance(value, list):
+        return [sweep for index, item in enumerate(value) for sweep in find_sweeps(item, path + (index,))]
+    return []
+
+
+def set_path(value, path, new_value):
+    if not path:
+        return new_value
+    copy = dict(value) if isinstance(value, dict) else list(value)
+    copy[path[0]] = set_path(value[path[0]], path[1:], new_value)
+    return copy
+
+
+def expand_sweeps(scenario):
+    """Yields (parameters, scenario) for every combination of swept values,
+    where parameters maps the dotted path of each swept value to its value."""
+    sweeps = find_sweeps(scenario)
+    for values in itertools.product(*[values for (path, values) in sweeps]):
+        expanded = scenario
+        parameters = {}
+        for (path, _), value in zip(sweeps, values):
+            expanded = set_path(expanded, path, value)
+            parameters[".".join(str(key) for key in path)] = value
+        yield parameters, expanded
+
+
+def schedule_file_name(kind, entries):
+    contents = json.dumps(entries, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha1(contents.encode("utf-8")).hexdigest()[:12]
+    return f"{kind}_{digest}.json"
+
+
+def generate_sweep(spec, input_directory, output_directory, files_directory="scenarios"):
+    """Writes the schedule files of every run of spec and returns the sweep
+    manifest.
+
+    Schedule files go to files_directory inside input_directory, since the
+    simulator reads them relative to its input directory.  Each run gets its
+    own directory in output_directory.  Runs whose files and options are the
+    same as those of an earlier run are recorded with duplicate_of instead of
+    being run again."""
+    files_path = os.path.join(input_directory, files_directory)
+    os.makedirs(files_path, exist_ok=True)
+    common_options = spec.get("options", {})
+
+    written = set()
+    runs = []
+    seen = {}
+    for scenario in spec["scenarios"]:
+        for parameters, expanded in expand_sweeps(scenario):
+            name = f"{scenario['name']}_{len(runs):05d}"
+            options = dict(common_options)
+            files = {}
+            for kind, schedule in SCHEDULES.items():
+                if kind not in expanded:
+                    continue
+                if kind == "attendance":
+                    entries = schedule(expanded[kind], expanded.get("attendance_from_simulation_start", False))
+                else:
+                    entries = schedule(expanded[kind])
+                file_name = schedule_file_name(kind, entries)
+                if file_name not in written:
+                    with open(os.path.join(files_path, file_name), "w") as f:
+                        json.dump(entries, f, indent=2)
+                    written.add(file_name)
+                files[kind] = file_name
+                for option, value in SCHEDULE_OPTIONS[kind].items():
+                    options[option] = value if value is not None else os.path.join(files_directory, file_name)
+            options.update(expanded.get("options", {}))
+            options["input_directory"] = input_directory
+            run = {"name": name, "scenario": scenario["name"], "parameters": parameters, "files": files}
+            key = json.dumps(options, sort_keys=True)
+            if key in seen:
+                run["duplicate_of"] = seen[key]
+            else:
+                seen[key] = name
+            options["output_directory"] = os.path.join(output_directory, name)
+            run["options"] = options
+            runs.append(run)
+
+    return {"input_directory": input_directory,
+            "output_directory": output_directory,
+            "num_schedule_files": len(written),
+            "runs": runs}
+
+
+def simulator_command(run, simulator="./drive_simulator"):
+    """Command line for one run of the manifest.  Options set to true are
+    passed as flags, and options set to false are left out."""
+    command = [simulator]
+    for key, value in run["options"].items():
+        if value is True:
+            command.append(f"--{key}")
+        elif value is not False:
+            command.append(f"--{key}={value}")
+    return command
+
+
+def runs_to_simulate(manifest):
+    return [run for run in manifest["runs"] if "duplicate_of" not in run]
+
+
+def main():
+    my_parser = argparse.ArgumentParser(description='Generate the schedule files and manifest of a scenario sweep')
+    my_parser.add_argument('spec', help='JSON file with the scenario spec')
+    my_parser.add_argument('-i', help='simulator input folder, where the schedule files are written', required=True)
+    my_parser.add_argument('-o', help='folder for the run outputs and the sweep manifest', required=True)
+    my_parser.add_argument('--files-directory', default='scenarios',
+                           help='folder inside the input folder for the schedule files (default: scenarios)')
+    args = my_parser.parse_args()
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    try:
+        manifest = generate_sweep(spec, args.i, args.o, args.files_directory)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(args.o, exist_ok=True)
+    manifest_path = os.path.join(args.o, MANIFEST_FILE_NAME)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"{len(manifest['runs'])} runs, {len(runs_to_simulate(manifest))} distinct, "
+          f"{manifest['num_schedule_files']} schedule files")
+    print(f"manifest: {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
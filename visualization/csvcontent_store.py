@@ -0,0 +1,125 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+SIM_STEPS_PER_DAY = 4
+CHUNK_ROWS = 1000000
+
+# csvContent.csv is converted to csvContent.npy, a fixed-width
+# [timestep, community, column] array of uint32 counts, plus
+# csvContent.meta.json holding the column names and the simulated steps.
+# The .npy file is memory-mapped, so slicing a community range or a time
+# window only touches the pages it needs.
+DATA_FILE = "csvContent.npy"
+META_FILE = "csvContent.meta.json"
+
+def countRows(csv_file):
+    rows = 0
+    with open(csv_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            rows += block.count(b"\n")
+    return rows - 1 # header
+
+def convertCsvContent(input_dir, output_dir = None):
+    """Convert csvContent.csv to the memory-mappable layout, chunk by chunk"""
+    output_dir = output_dir or input_dir
+    csv_file = os.path.join(input_dir, "csvContent.csv")
+    num_rows = countRows(csv_file)
+    header = pd.read_csv(csv_file, nrows = 0).columns.tolist()
+    columns = header[2:] # drop Time and community
+    first_step = pd.read_csv(csv_file, usecols = ["Time"], nrows = CHUNK_ROWS)["Time"]
+    num_communities = int((first_step == first_step.iloc[0]).sum())
+    num_steps = num_rows // num_communities
+
+    data = np.lib.format.open_memmap(os.path.join(output_dir, DATA_FILE), mode = "w+",
+                                     dtype = np.uint32,
+                                     shape = (num_steps, num_communities, len(columns)))
+    flat = data.reshape(num_steps * num_communities, len(columns))
+    steps = np.empty(num_steps, dtype = np.int64)
+    row = 0
+    for chunk in pd.read_csv(csv_file, chunksize = CHUNK_ROWS):
+        n = len(chunk)
+        flat[row:row + n] = chunk[columns].values.astype(np.uint32)
+        # The first row of every timestep carries its Time.
+        index = np.arange(row, row + n)
+        first = index % num_communities == 0
+        steps[index[first] // num_communities] = (chunk["Time"].values[first] * SIM_STEPS_PER_DAY).round().astype(np.int64)
+        row += n
+    data.flush()
+    del data
+
+    with open(os.path.join(output_dir, META_FILE), "w") as f:
+        json.dump({"columns": columns,
+                   "num_communities": num_communities,
+                   "steps_per_day": SIM_STEPS_PER_DAY,
+                   "steps": steps.tolist()}, f)
+    return output_dir
+
+def hasCsvContentStore(input_dir):
+    data_file = os.path.join(input_dir, DATA_FILE)
+    csv_file = os.path.join(input_dir, "csvContent.csv")
+    return (os.path.exists(data_file)
+            and os.path.exists(os.path.join(input_dir, META_FILE))
+            and (not os.path.exists(csv_file) or os.path.getmtime(data_file) >= os.path.getmtime(csv_file)))
+
+class CsvContentStore:
+    """Read-only, memory-mapped view of a converted csvContent table"""
+
+    def __init__(self, input_dir):
+        with open(os.path.join(input_dir, META_FILE)) as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.num_communities = meta["num_communities"]
+        self.steps_per_day = meta["steps_per_day"]
+        self.steps = np.asarray(meta["steps"], dtype = np.int64)
+        self.data = np.load(os.path.join(input_dir, DATA_FILE), mmap_mode = "r")
+
+    def stepRange(self, start_day = None, end_day = None):
+        """Index range of the timesteps with start_day <= Time < end_day"""
+        lo = 0 if start_day is None else np.searchsorted(self.steps, int(round(start_day * self.steps_per_day)))
+        hi = len(self.steps) if end_day is None else np.searchsorted(self.steps, int(round(end_day * self.steps_per_day)))
+        return lo, hi
+
+    def endOfDaySteps(self):
+        """Index of the last simulated timestep of every day"""
+        day = self.steps // self.steps_per_day
+        return np.flatnonzero(np.append(day[1:] != day[:-1], True))
+
+    def slice(self, columns = None, communities = None, start_day = None, end_day = None, step_index = None):
+        """Rows of csvContent, in the same long format, restricted to a
+        community range (a slice), a time window in days or explicit step
+        indices"""
+        columns = columns or self.columns
+        col_index = [self.columns.index(c) for c in columns]
+        if step_index is None:
+            lo, hi = self.stepRange(start_day, end_day)
+            step_index = np.arange(lo, hi)
+            step_selection = slice(lo, hi)
+        else:
+            step_selection = np.asarray(step_index)
+        communities = communities if communities is not None else slice(None)
+        community_index = np.arange(self.num_communities)[communities]
+        # Basic slices keep this a view of the mapped file; only the selected
+        # block is copied by the column selection.
+        block = self.data[step_selection, communities][:, :, col_index]
+        num_steps, num_communities = len(step_index), len(community_index)
+        frame = pd.DataFrame(block.reshape(num_steps * num_communities, len(col_index)), columns = columns)
+        frame.insert(0, "community", np.tile(community_index, num_steps))
+        frame.insert(0, "Time", np.repeat(self.steps[step_index] / self.steps_per_day, num_communities))
+        return frame
+
+
+def main():
+    my_parser = argparse.ArgumentParser(description='Convert csvContent.csv to a memory-mapped binary layout')
+    my_parser.add_argument('-i', help='input folder containing csvContent.csv', required = True)
+    my_parser.add_argument('-o', help='output folder (defaults to the input folder)', default = None)
+    args = my_parser.parse_args()
+    output_dir = convertCsvContent(args.i, args.o)
+    print("Wrote {} and {} to {}".format(DATA_FILE, META_FILE, output_dir))
+
+
+
+if __name__ == "__main__":
+    main()
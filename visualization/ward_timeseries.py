@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import argparse
+import pandas as pd
+import plotly
+import plotly.express as px
+import geopandas as gpd
+from csvcontent_store import CsvContentStore, hasCsvContentStore
+
+SIM_STEPS_PER_DAY = 4
+
+# Columns of csvContent.csv that contribute to the per-ward daily series.
+# "community" is the 0-based community index, which coincides with the
+# wardIndex of the city geojson since communities are sorted by wardNo.
+WARD_COLUMNS = ["Time", "community", "affected", "exposed", "infective",
+                "symptomatic", "hospitalised", "critical", "dead", "recovered"]
+
+WARD_METRICS = ["affected", "new_affected", "active", "hospitalised", "dead"]
+
+def isCacheFresh(cache_file, source_file):
+    return (os.path.exists(cache_file)
+            and os.path.getmtime(cache_file) >= os.path.getmtime(source_file))
+
+def readEndOfDay(input_dir):
+    """End-of-day snapshot for every ward, from the memory-mapped store when
+    one has been converted, otherwise from csvContent.csv"""
+    if hasCsvContentStore(input_dir):
+        store = CsvContentStore(input_dir)
+        daily_df = store.slice(columns = WARD_COLUMNS[2:], step_index = store.endOfDaySteps())
+    else:
+        daily_df = pd.read_csv(os.path.join(input_dir, "csvContent.csv"), usecols = WARD_COLUMNS)
+        step = (daily_df["Time"] * SIM_STEPS_PER_DAY).round().astype(int)
+        last_step = step.groupby(step // SIM_STEPS_PER_DAY).transform("max")
+        daily_df = daily_df[step == last_step]
+    daily_df = daily_df.copy()
+    daily_df["day"] = (daily_df["Time"] * SIM_STEPS_PER_DAY).round().astype(int) // SIM_STEPS_PER_DAY
+    return daily_df
+
+def computeWardDaily(input_dir):
+    daily_df = readEndOfDay(input_dir)
+    daily_df = daily_df.rename(columns = {"community": "wardIndex"})
+    daily_df = daily_df.sort_values(["wardIndex", "day"]).reset_index(drop = True)
+    daily_df["active"] = (daily_df["exposed"] + daily_df["infective"] + daily_df["symptomatic"]
+                          + daily_df["hospitalised"] + daily_df["critical"])
+    daily_df["new_affected"] = daily_df.groupby("wardIndex")["affected"].diff().fillna(daily_df["affected"]).astype(int)
+    return daily_df[["day", "wardIndex"] + WARD_METRICS]
+
+def readWardDaily(input_dir, output_dir):
+    """Per-ward, per-day counts; recomputed only when the csvContent output changes"""
+    cache_file = os.path.join(output_dir, "ward_daily_infected.csv")
+    source_file = os.path.join(input_dir, "csvContent.csv")
+    if not os.path.exists(source_file):
+        source_file = os.path.join(input_dir, "csvContent.npy")
+    if isCacheFresh(cache_file, source_file):
+        return pd.read_csv(cache_file)
+    daily_df = computeWardDaily(input_dir)
+    daily_df.to_csv(cache_file, index = False)
+    return daily_df
+
+def readSimplifiedGeoJSON(geo_file, output_dir, tolerance):
+    """Ward geometries simplified once and cached next to the outputs"""
+    base = os.path.splitext(os.path.basename(geo_file))[0]
+    cache_file = os.path.join(output_dir, "{}_simplified_{}.geojson".format(base, tolerance))
+    if isCacheFresh(cache_file, geo_file):
+        with open(cache_file) as f:
+            return json.load(f)
+    map_df = gpd.read_file(geo_file)
+    map_df["geometry"] = map_df.geometry.simplify(tolerance, preserve_topology = True)
+    map_df = map_df[["wardIndex", "wardName", "geometry"]]
+    geojson = json.loads(map_df.to_json())
+    with open(cache_file, "w") as f:
+        json.dump(geojson, f)
+    return geojson
+
+def animatedChloropethMap(input_dir, geo_file, output_dir, metric, tolerance, show):
+    daily_df = readWardDaily(input_dir, output_dir)
+    geojson = readSimplifiedGeoJSON(geo_file, output_dir, tolerance)
+    ward_names = {feature["properties"]["wardIndex"]: feature["properties"]["wardName"]
+                  for feature in geojson["features"]}
+    daily_df["wardName"] = daily_df["wardIndex"].map(ward_names)
+    # The geometry is embedded once and referenced by wardIndex from every
+    # frame, instead of being repeated per row.
+    fig = px.choropleth(daily_df, geojson = geojson, locations = "wardIndex",
+                        featureidkey = "properties.wardIndex", color = metric,
+                        animation_frame = "day", hover_name = "wardName",
+                        range_color = (0, daily_df[metric].max()),
+                        color_continuous_scale = "Viridis")
+    fig.update_geos(fitbounds = "locations", visible = True)
+    fig.update_layout(title_text = "{} by Ward".format(metric))
+    fig.update(layout = dict(title=dict(x=0.5)))
+    fig.update_layout(margin={"r":0,"t":30,"l":10,"b":10}, coloraxis_colorbar={'title':metric})
+    if show:
+        fig.show()
+    plotly.offline.plot(fig, filename = os.path.join(output_dir, 'ward_{}_animated_map.html'.format(metric)), auto_open = False)
+
+
+def main():
+    default_input_path = "../staticInst/data/bangalore-10k-output/"
+    default_output_path = "../staticInst/data/bangalore-10k-output/"
+    default_geo_file = "../staticInst/data/base/bangalore/city.geojson"
+    my_parser = argparse.ArgumentParser(description='Create an animated daily chloropeth map for infections in each ward')
+    my_parser.add_argument('-i', help='input folder containing csvContent.csv', default=default_input_path)
+    my_parser.add_argument('-o', help='output folder (also holds the cached ward series and geometries)', default=default_output_path)
+    my_parser.add_argument('-g', help = 'input folder for geojson file', default = default_geo_file)
+    my_parser.add_argument('-m', help = 'metric to plot', choices = WARD_METRICS, default = "new_affected")
+    my_parser.add_argument('-t', help = 'geometry simplification tolerance, in degrees', type = float, default = 0.0005)
+    my_parser.add_argument('--show', help = 'open the figure in a browser', action = 'store_true')
+    args = my_parser.parse_args()
+    if len(sys.argv)==1:
+        print("No arguments passed.\n")
+        my_parser.print_help()
+        print("\n Assuming default values.\n")
+    animatedChloropethMap(args.i, args.g, args.o, args.m, args.t, args.show)
+
+
+
+if __name__ == "__main__":
+    main()